@@ -0,0 +1,259 @@
+"""Address autocomplete served by the backend (GET /api/address/suggest).
+
+Suggestions come first from a local prefix trie over the addresses of
+past delivery orders. A customer's own previous addresses rank first, so
+repeat customers get them without any upstream call. The rest comes
+from a pluggable upstream provider (DaData, or a stub for tests and
+offline runs). Upstream answers are kept in an LRU cache, and identical
+concurrent queries share one upstream request.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional
+
+import httpx
+
+from shared import metrics, repository
+from .geo import DADATA_TOKEN, DADATA_URL, building_address, geocoder, normalize_address
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_PROVIDER = os.getenv('ADDRESS_PROVIDER', 'dadata' if DADATA_TOKEN else 'none')
+SUGGEST_CACHE_SIZE = int(os.getenv('ADDRESS_CACHE_SIZE', '4096'))
+SUGGEST_CACHE_TTL = float(os.getenv('ADDRESS_CACHE_TTL', '86400'))
+# new orders from the bot process are picked up this often
+INDEX_REFRESH_INTERVAL = float(os.getenv('ADDRESS_INDEX_REFRESH', '60'))
+# shorter queries are answered from history only
+MIN_UPSTREAM_QUERY = 3
+TOP_K = 10
+# the trie stores this many characters per word start; longer queries filter the node's top
+MAX_DEPTH = 24
+USER_HISTORY = 5
+
+
+class _Node:
+    __slots__ = ('children', 'top')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        # best [uses, normalized key] under this prefix, most used first
+        self.top: List[list] = []
+
+
+class AddressIndex:
+    """Prefix trie over normalized building addresses, entered at every word start.
+
+    Each node keeps the TOP_K most used buildings below it, so a lookup
+    costs O(len(query)) regardless of how many addresses are stored.
+    Shared suggestions never include apartments; a customer's own recent
+    addresses are kept in full and offered to that customer only.
+    """
+
+    def __init__(self):
+        self.root = _Node()
+        self.uses: Dict[str, int] = {}
+        # normalized key -> building address as last typed
+        self.display: Dict[str, str] = {}
+        self.by_user: Dict[int, List[str]] = {}
+        self.last_order_id = 0
+        self._refreshed_at: Optional[float] = None
+
+    def __len__(self):
+        return len(self.uses)
+
+    def add(self, address: str, user_id: Optional[int] = None, uses: int = 1):
+        address = (address or '').strip()
+        key = normalize_address(address)
+        if not key:
+            return
+        count = self.uses[key] = self.uses.get(key, 0) + uses
+        self.display[key] = building_address(address)
+        words = key.split(' ')
+        for i in range(len(words)):
+            node = self.root
+            for ch in ' '.join(words[i:])[:MAX_DEPTH]:
+                node = node.children.setdefault(ch, _Node())
+                self._rank(node, key, count)
+        if user_id:
+            self.remember_user(user_id, address)
+
+    def remember_user(self, user_id: int, address: str):
+        recent = self.by_user.setdefault(user_id, [])
+        if address in recent:
+            recent.remove(address)
+        recent.insert(0, address)
+        del recent[USER_HISTORY:]
+
+    @staticmethod
+    def _rank(node: _Node, key: str, count: int):
+        top = node.top
+        if len(top) >= TOP_K and top[-1][0] >= count:
+            # counts only grow, so key cannot be in a full list whose last entry is >= count
+            return
+        for i, entry in enumerate(top):
+            if entry[1] == key:
+                entry[0] = count
+                break
+        else:
+            top.append([count, key])
+            i = len(top) - 1
+        # move the entry up into place
+        while i and top[i - 1][0] < count:
+            top[i - 1], top[i] = top[i], top[i - 1]
+            i -= 1
+        del top[TOP_K:]
+
+    def search(self, query: str, limit: int = TOP_K, user_id: Optional[int] = None) -> List[str]:
+        key = normalize_address(query)
+        found, seen = [], set()
+        for address in self.by_user.get(user_id, ()) if user_id else ():
+            own = normalize_address(address)
+            if not key or key in own:
+                found.append(address)
+                seen.add(own)
+        if key:
+            node = self.root
+            for ch in key[:MAX_DEPTH]:
+                node = node.children.get(ch)
+                if node is None:
+                    break
+            else:
+                found += [self.display[k] for _, k in node.top if k not in seen and key in k]
+        return found[:limit]
+
+    def stale(self) -> bool:
+        return self._refreshed_at is None or time.monotonic() - self._refreshed_at >= INDEX_REFRESH_INTERVAL
+
+    async def refresh(self, session):
+        """Add delivery addresses of orders created since the last refresh."""
+        rows = await repository.delivery_addresses(session, self.last_order_id)
+        counts = Counter(address.strip() for _, _, address in rows)
+        for address, uses in counts.items():
+            self.add(address, uses=uses)
+        for order_id, user_id, address in rows:
+            if user_id:
+                self.remember_user(user_id, address.strip())
+            self.last_order_id = max(self.last_order_id, order_id)
+        if counts:
+            await geocoder.lookup_many(session, counts)
+        self._refreshed_at = time.monotonic()
+
+
+# --- upstream providers: async suggest(query, count) -> [{'value', 'lat', 'lon'}] ---
+
+class NoProvider:
+    async def suggest(self, query: str, count: int) -> List[dict]:
+        return []
+
+
+class StubProvider:
+    """Fixed address list matched by prefix (tests, offline development)."""
+
+    def __init__(self, addresses=None):
+        self.calls = 0
+        self.addresses = list(addresses or (
+            'г Москва, ул Тверская, д 1', 'г Москва, ул Тверская, д 7', 'г Москва, ул Арбат, д 10',
+            'г Москва, Ленинский пр-кт, д 30', 'г Москва, ул Новый Арбат, д 24',
+        ))
+
+    async def suggest(self, query: str, count: int) -> List[dict]:
+        self.calls += 1
+        key = normalize_address(query)
+        return [{'value': a, 'lat': None, 'lon': None} for a in self.addresses if key in normalize_address(a)][:count]
+
+
+class DadataProvider:
+    def __init__(self, token: str = DADATA_TOKEN, timeout: float = 3.0):
+        self.token = token
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def suggest(self, query: str, count: int) -> List[dict]:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        resp = await self._client.post(
+            DADATA_URL, json={'query': query, 'count': count},
+            headers={'Authorization': f'Token {self.token}', 'Accept': 'application/json'},
+        )
+        resp.raise_for_status()
+        out = []
+        for s in resp.json().get('suggestions') or []:
+            data = s.get('data') or {}
+            lat, lon = data.get('geo_lat'), data.get('geo_lon')
+            out.append({'value': s['value'], 'lat': float(lat) if lat else None, 'lon': float(lon) if lon else None})
+        return out
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+
+PROVIDERS = {'dadata': DadataProvider, 'stub': StubProvider, 'none': NoProvider}
+
+
+class AddressSuggester:
+    """History trie first, then the upstream provider behind an LRU cache."""
+
+    def __init__(self, provider=None, cache_size: int = SUGGEST_CACHE_SIZE, ttl: float = SUGGEST_CACHE_TTL):
+        self.index = AddressIndex()
+        self.provider = provider or PROVIDERS.get(SUGGEST_PROVIDER, NoProvider)()
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self._cache: 'OrderedDict[tuple, tuple]' = OrderedDict()
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'errors': 0}
+
+    async def suggest(self, query: str, count: int = 7, user_id: Optional[int] = None) -> List[dict]:
+        out = []
+        for address in self.index.search(query, count, user_id):
+            point = geocoder.cached(address)
+            out.append({'value': address, 'lat': point and point[0], 'lon': point and point[1], 'source': 'history'})
+        if len(out) >= count or len(query.strip()) < MIN_UPSTREAM_QUERY:
+            return out
+        seen = {normalize_address(s['value']) for s in out}
+        for s in await self._upstream(query, count):
+            if normalize_address(s['value']) not in seen:
+                out.append({**s, 'source': 'upstream'})
+        return out[:count]
+
+    async def _upstream(self, query: str, count: int) -> List[dict]:
+        key = (normalize_address(query), count)
+        cached = self._cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self.ttl:
+            self._cache.move_to_end(key)
+            self.stats['hits'] += 1
+            return cached[1]
+        # debounce: keystrokes from several users with the same prefix share one request
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(pending)
+        self.stats['misses'] += 1
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        result = []
+        try:
+            result = await self.provider.suggest(query, count)
+        except Exception:
+            logger.warning("Address provider failed", exc_info=True)
+            metrics.errors.inc(where='address_suggest')
+            self.stats['errors'] += 1
+        else:
+            self._cache[key] = (time.monotonic(), result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        finally:
+            del self._inflight[key]
+            future.set_result(result)
+        return result
+
+    async def close(self):
+        close = getattr(self.provider, 'close', None)
+        if close is not None:
+            await close()
+
+
+suggester = AddressSuggester()
@@ -0,0 +1,166 @@
+"""In-memory catalog cache with set indexes for faceted product queries.
+
+Products are kept as plain dicts (same shape as /api/products).  Next to
+them the cache keeps one id-set per tag and per category, so a filter is
+a couple of set intersections and the facet counts come from a single
+pass over the matching products.
+"""
+import hashlib
+import json
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .images import thumb_url
+from .search import PRODUCT_FIELDS, normalize
+
+CATEGORY_FIELDS = ('id', 'title', 'sort_order')
+# product columns in /api/menu (category_id is implied by nesting)
+MENU_PRODUCT_FIELDS = tuple(f for f in PRODUCT_FIELDS if f != 'category_id') + ('thumb',)
+
+
+class CatalogCache:
+    def __init__(self):
+        self.version = 0
+        # catalog_version row this snapshot was built from
+        self.db_version = None
+        self._products: Dict[int, dict] = {}
+        self._tags: Dict[int, Tuple[str, ...]] = {}
+        # normalized tag -> product ids
+        self._by_tag: Dict[str, Set[int]] = {}
+        self._by_category: Dict[Optional[int], Set[int]] = {}
+        self._categories: List[dict] = []
+        # (version, body, etag) of the last rendered /api/menu
+        self._menu: Optional[Tuple[int, bytes, str]] = None
+
+    def __len__(self):
+        return len(self._products)
+
+    def build(self, products: Iterable, product_tags: Iterable[Tuple[int, str]] = (), categories: Iterable = ()):
+        """Full rebuild from ORM products and (product_id, tag title) rows."""
+        self._set_categories(categories)
+        tags: Dict[int, List[str]] = {}
+        for product_id, title in product_tags:
+            tags.setdefault(product_id, []).append(title)
+        self._products.clear()
+        self._tags.clear()
+        self._by_tag.clear()
+        self._by_category.clear()
+        for p in products:
+            self._put(_as_dict(p), tags.get(p.id, ()))
+        self.version += 1
+
+    def set_categories(self, categories: Iterable):
+        self._set_categories(categories)
+        self.version += 1
+
+    def _set_categories(self, categories: Iterable):
+        docs = [{f: getattr(c, f, None) for f in CATEGORY_FIELDS} for c in categories]
+        docs.sort(key=lambda c: (c['sort_order'] or 0, c['id']))
+        self._categories = docs
+
+    def upsert(self, product, tags: Iterable[str]) -> dict:
+        doc = _as_dict(product)
+        self._drop(doc['id'])
+        self._put(doc, tags)
+        self.version += 1
+        return doc
+
+    def remove(self, product_id: int):
+        if product_id in self._products:
+            self._drop(product_id)
+            del self._products[product_id]
+            self.version += 1
+
+    def _put(self, doc: dict, tags: Iterable[str]):
+        pid = doc['id']
+        # keep the original position on update so listing order is stable
+        self._products[pid] = doc
+        self._tags[pid] = tuple(tags)
+        for title in self._tags[pid]:
+            self._by_tag.setdefault(normalize(title), set()).add(pid)
+        self._by_category.setdefault(doc.get('category_id'), set()).add(pid)
+
+    def _drop(self, pid: int):
+        doc = self._products.get(pid)
+        if doc is None:
+            return
+        for title in self._tags.pop(pid, ()):
+            key = normalize(title)
+            bucket = self._by_tag.get(key)
+            if bucket is not None:
+                bucket.discard(pid)
+                if not bucket:
+                    del self._by_tag[key]
+        bucket = self._by_category.get(doc.get('category_id'))
+        if bucket is not None:
+            bucket.discard(pid)
+
+    def get(self, product_id: int) -> Optional[dict]:
+        return self._products.get(product_id)
+
+    def products(self, category_id: int = None) -> List[dict]:
+        if not category_id:
+            return list(self._products.values())
+        return [self._products[pid] for pid in sorted(self._by_category.get(category_id, ()))]
+
+    def query(self, category_id: int = None, tags: Iterable[str] = (), min_rating: float = None):
+        """Filter products and count facets in one pass.
+
+        Returns (items, facets).  Tag counts are over the matching items;
+        category counts ignore the category filter so every category tab
+        can show how many products it would give with the other filters.
+        """
+        candidates: Optional[Set[int]] = None
+        for tag in tags:
+            ids = self._by_tag.get(normalize(tag.strip()), set())
+            candidates = set(ids) if candidates is None else candidates & ids
+            if not candidates:
+                break
+        category_ids = self._by_category.get(category_id, set()) if category_id else None
+
+        items = []
+        tag_counts: Dict[str, int] = {}
+        category_counts: Dict[int, int] = {}
+        ids = self._products if candidates is None else sorted(candidates)
+        for pid in ids:
+            doc = self._products[pid]
+            if min_rating is not None and (doc.get('rating') or 0.0) < min_rating:
+                continue
+            cat = doc.get('category_id')
+            category_counts[cat] = category_counts.get(cat, 0) + 1
+            if category_ids is not None and pid not in category_ids:
+                continue
+            items.append(doc)
+            for title in self._tags.get(pid, ()):
+                tag_counts[title] = tag_counts.get(title, 0) + 1
+        return items, {'tags': tag_counts, 'categories': category_counts}
+
+    def menu(self) -> Tuple[bytes, str]:
+        """Serialized /api/menu body and its ETag, re-rendered only when the catalog changes.
+
+        Layout: categories in sort_order, each with its products as columns
+        ({"id": [...], "name": [...], ...}) so field names are not repeated
+        for every product.
+        """
+        if self._menu is not None and self._menu[0] == self.version:
+            return self._menu[1], self._menu[2]
+        categories = []
+        for c in self._categories:
+            docs = [self._products[pid] for pid in sorted(self._by_category.get(c['id'], ()))]
+            columns = {f: [d[f] for d in docs] for f in MENU_PRODUCT_FIELDS}
+            categories.append(dict(c, products=columns))
+        _, counts = self.query()
+        payload = {'version': self.version, 'categories': categories, 'tags': counts['tags']}
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        self._menu = (self.version, body, etag)
+        return body, etag
+
+
+def _as_dict(product) -> dict:
+    doc = {f: getattr(product, f, None) for f in PRODUCT_FIELDS}
+    doc['thumb'] = thumb_url(doc['id'], doc['image'])
+    return doc
+
+
+# Process-wide cache used by the API
+catalog = CatalogCache()
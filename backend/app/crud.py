@@ -1,236 +1,234 @@
-from .db import AsyncSessionLocal, Category, Product, User, Order
+# All functions work inside the caller's session (one per HTTP request,
+# see db.get_session) and never commit; the endpoint commits once.
+from .db import Category, Product, Order, ProductPhoto, product_tags
+from .schemas import CategoryRow, ProductRow, OrderRow
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import json
-from datetime import datetime
-from .db import Cart
-from sqlalchemy import delete, update
-
-async def list_categories():
-    async with AsyncSessionLocal() as s:
-        res = await s.execute(select(Category))
-        return [c for c in res.scalars().all()]
-
-
-async def create_category(data: dict):
-    async with AsyncSessionLocal() as s:
-        c = Category(title=data.get('title'), sort_order=data.get('sort_order', 0))
-        s.add(c)
-        await s.commit()
-        await s.refresh(c)
-        return c
-
-
-async def update_category(cat_id: int, data: dict):
-    async with AsyncSessionLocal() as s:
-        res = await s.execute(select(Category).where(Category.id == cat_id))
-        c = res.scalars().first()
-        if not c:
-            return None
-        c.title = data.get('title', c.title)
-        c.sort_order = data.get('sort_order', c.sort_order)
-        await s.commit()
-        return c
-
-
-async def delete_category(cat_id: int):
-    async with AsyncSessionLocal() as s:
-        res = await s.execute(select(Category).where(Category.id == cat_id))
-        c = res.scalars().first()
-        if not c:
-            return False
-        await s.delete(c)
-        await s.commit()
-        return True
-
-async def list_products(category_id: int = None):
-    async with AsyncSessionLocal() as s:
-        if category_id:
-            res = await s.execute(select(Product).where(Product.category_id == category_id))
-        else:
-            res = await s.execute(select(Product))
-        return [p for p in res.scalars().all()]
-
-
-async def create_product(data: dict):
-    async with AsyncSessionLocal() as s:
-        p = Product(name=data.get('name'), category_id=data.get('category_id'), description=data.get('description'), price=data.get('price'), image=data.get('image'), tags=data.get('tags'), rating=data.get('rating'))
-        s.add(p)
-        await s.commit()
-        await s.refresh(p)
-        return p
-
-
-async def update_product(product_id: int, data: dict):
-    async with AsyncSessionLocal() as s:
-        res = await s.execute(select(Product).where(Product.id == product_id))
-        p = res.scalars().first()
-        if not p:
-            return None
-        p.name = data.get('name', p.name)
-        p.category_id = data.get('category_id', p.category_id)
-        p.description = data.get('description', p.description)
-        p.price = data.get('price', p.price)
-        p.image = data.get('image', p.image)
-        p.tags = data.get('tags', p.tags)
-        p.rating = data.get('rating', p.rating)
-        await s.commit()
-        return p
-
-
-async def delete_product(product_id: int):
-    async with AsyncSessionLocal() as s:
-        res = await s.execute(select(Product).where(Product.id == product_id))
-        p = res.scalars().first()
-        if not p:
-            return False
-        await s.delete(p)
-        await s.commit()
-        return True
-
-
-async def export_products_csv():
+from sqlalchemy import delete
+from shared import order_status, repository, tracing
+from shared.repository import parse_tags
+
+# read paths select only these columns, in the field order of the *Row dataclasses
+CATEGORY_COLUMNS = (Category.id, Category.title, Category.sort_order)
+PRODUCT_COLUMNS = (Product.id, Product.name, Product.description, Product.price, Product.image_url,
+                   Product.tags, Product.rating, Product.category_id)
+# by name: order reads may go through orders UNION ALL orders_archive
+ORDER_COLUMN_NAMES = ('id', 'user_id', 'items_json', 'total_price', 'address', 'name', 'phone', 'payment_method',
+                      'delivery_type', 'status', 'created_at')
+
+
+async def list_categories(s: AsyncSession):
+    res = await s.execute(select(*CATEGORY_COLUMNS).order_by(Category.id))
+    return [CategoryRow(*r) for r in res]
+
+
+async def create_category(s: AsyncSession, data: dict):
+    c = Category(title=data.get('title'), sort_order=data.get('sort_order', 0))
+    s.add(c)
+    await s.flush()
+    await repository.bump_catalog_version(s)
+    return c
+
+
+async def update_category(s: AsyncSession, cat_id: int, data: dict):
+    res = await s.execute(select(Category).where(Category.id == cat_id))
+    c = res.scalars().first()
+    if not c:
+        return None
+    c.title = data.get('title', c.title)
+    c.sort_order = data.get('sort_order', c.sort_order)
+    await repository.bump_catalog_version(s)
+    return c
+
+
+async def delete_category(s: AsyncSession, cat_id: int):
+    res = await s.execute(select(Category).where(Category.id == cat_id))
+    c = res.scalars().first()
+    if not c:
+        return False
+    await s.delete(c)
+    await repository.bump_catalog_version(s)
+    return True
+
+async def list_product_tags(s: AsyncSession):
+    """(product_id, tag title) pairs for the catalog cache."""
+    return await repository.list_product_tags(s)
+
+
+async def sync_product_tags(s: AsyncSession):
+    """Backfill the tag tables from Product.tags (databases created before tags existed)."""
+    current = {}
+    for product_id, title in await list_product_tags(s):
+        current.setdefault(product_id, set()).add(title)
+    res = await s.execute(select(Product.id, Product.tags))
+    for product_id, tags in res.all():
+        if set(parse_tags(tags)) != current.get(product_id, set()):
+            await repository.set_product_tags(s, product_id, tags)
+
+
+async def get_catalog_version(s: AsyncSession):
+    return await repository.get_catalog_version(s)
+
+
+async def list_products(s: AsyncSession, category_id: int = None):
+    q = select(*PRODUCT_COLUMNS).order_by(Product.id)
+    if category_id:
+        q = q.where(Product.category_id == category_id)
+    res = await s.execute(q)
+    return [ProductRow(*r) for r in res]
+
+
+def product_row(p: Product) -> ProductRow:
+    """Admin write responses in the shape of list_products (image, not image_url)."""
+    return ProductRow(p.id, p.name, p.description, p.price, p.image_url, p.tags, p.rating, p.category_id)
+
+
+async def create_product(s: AsyncSession, data: dict):
+    # the admin panel sends image_url, the API schema calls it image
+    image = data.get('image', data.get('image_url'))
+    p = Product(name=data.get('name'), category_id=data.get('category_id'), description=data.get('description'), price=data.get('price'), image=image, tags=data.get('tags'), rating=data.get('rating'))
+    s.add(p)
+    await s.flush()
+    await repository.set_product_tags(s, p.id, p.tags)
+    await repository.bump_catalog_version(s)
+    return p
+
+
+async def update_product(s: AsyncSession, product_id: int, data: dict):
+    res = await s.execute(select(Product).where(Product.id == product_id))
+    p = res.scalars().first()
+    if not p:
+        return None
+    p.name = data.get('name', p.name)
+    p.category_id = data.get('category_id', p.category_id)
+    p.description = data.get('description', p.description)
+    p.price = data.get('price', p.price)
+    p.image = data.get('image', data.get('image_url', p.image))
+    p.tags = data.get('tags', p.tags)
+    p.rating = data.get('rating', p.rating)
+    if 'tags' in data:
+        await repository.set_product_tags(s, p.id, p.tags)
+    await repository.bump_catalog_version(s)
+    return p
+
+
+async def delete_product(s: AsyncSession, product_id: int):
+    res = await s.execute(select(Product).where(Product.id == product_id))
+    p = res.scalars().first()
+    if not p:
+        return False
+    await s.execute(delete(product_tags).where(product_tags.c.product_id == product_id))
+    # SQLite does not enforce the ON DELETE CASCADE of product_photos
+    await s.execute(delete(ProductPhoto).where(ProductPhoto.product_id == product_id))
+    await s.delete(p)
+    await repository.bump_catalog_version(s)
+    return True
+
+
+async def export_products_csv(s: AsyncSession):
     import csv, io
-    async with AsyncSessionLocal() as s:
-        res = await s.execute(select(Product))
-        products = res.scalars().all()
-        buf = io.StringIO()
-        writer = csv.writer(buf)
-        writer.writerow(['id','name','category_id','description','price','tags','rating'])
-        for p in products:
-            writer.writerow([p.id, p.name, p.category_id, p.description or '', p.price or 0, p.tags or '', p.rating or 0])
-        return buf.getvalue()
-
-async def add_to_cart(user_id: int, product_id: int, qty: int = 1):
-    async with AsyncSessionLocal() as s:
-        # find user
-        res = await s.execute(select(User).where(User.tg_id == user_id))
-        user = res.scalars().first()
-        if not user:
-            user = User(tg_id=user_id)
-            s.add(user)
-            await s.flush()
-        # find cart
-        res2 = await s.execute(select(Cart).where(Cart.user_id == user.id))
-        cart = res2.scalars().first()
-        if not cart:
-            cart = Cart(user_id=user.id, items_json=json.dumps([]), updated_at=datetime.utcnow())
-            s.add(cart)
-            await s.flush()
-        items = json.loads(cart.items_json or '[]')
-        found = False
-        for it in items:
-            if it.get('product_id') == product_id:
-                it['qty'] = it.get('qty', 0) + qty
-                found = True
-                break
-        if not found:
-            items.append({'product_id': product_id, 'qty': qty})
-        cart.items_json = json.dumps(items)
-        cart.updated_at = datetime.utcnow()
-        await s.commit()
-        return {"ok": True, "items": items}
-
-async def get_cart(user_id: int):
-    async with AsyncSessionLocal() as s:
-        res = await s.execute(select(User).where(User.tg_id == user_id))
-        user = res.scalars().first()
-        if not user:
-            return {"items": []}
-        res2 = await s.execute(select(Cart).where(Cart.user_id == user.id))
-        cart = res2.scalars().first()
-        if not cart:
-            return {"items": []}
-        items = json.loads(cart.items_json or '[]')
-        # enrich with product info
-        out = []
-        for it in items:
-            p_res = await s.execute(select(Product).where(Product.id == it.get('product_id')))
-            p = p_res.scalars().first()
-            if p:
-                out.append({
-                    'product_id': p.id,
-                    'name': p.name,
-                    'price': p.price,
-                    'qty': it.get('qty', 1)
-                })
-        return {"items": out}
-
-async def clear_cart(user_id: int):
-    async with AsyncSessionLocal() as s:
-        res = await s.execute(select(User).where(User.tg_id == user_id))
-        user = res.scalars().first()
-        if not user:
-            return {"ok": True}
-        res2 = await s.execute(select(Cart).where(Cart.user_id == user.id))
-        cart = res2.scalars().first()
-        if cart:
-            cart.items_json = json.dumps([])
-            cart.updated_at = datetime.utcnow()
-            await s.commit()
-        return {"ok": True}
-
-async def create_order(order_data):
-    async with AsyncSessionLocal() as s:
-        # ensure user exists
-        res = await s.execute(select(User).where(User.tg_id == order_data.tg_id))
-        user = res.scalars().first()
-        if not user:
-            user = User(tg_id=order_data.tg_id, name=order_data.name, phone=order_data.phone)
-            s.add(user)
-            await s.flush()
-        # if order_data.items is empty, try to load from cart
-        items = getattr(order_data, 'items', None)
-        if not items:
-            # try cart
-            res_cart = await s.execute(select(Cart).where(Cart.user_id == user.id))
-            cart = res_cart.scalars().first()
-            items = json.loads(cart.items_json) if cart and cart.items_json else []
-        o = Order(user_id=user.id, items_json=json.dumps(items), total_price=order_data.total_price, address=order_data.address, phone=order_data.phone, payment_method=order_data.payment_method, status='new')
-        s.add(o)
-        await s.commit()
-        await s.refresh(o)
-        # clear cart after creating order
-        res_c = await s.execute(select(Cart).where(Cart.user_id == user.id))
-        cart = res_c.scalars().first()
-        if cart:
-            cart.items_json = json.dumps([])
-            await s.commit()
-        return o
-
-async def mark_order_paid(order_id: int):
-    async with AsyncSessionLocal() as s:
-        res = await s.execute(select(Order).where(Order.id == order_id))
-        o = res.scalars().first()
-        if not o:
-            return False
-        o.status = 'paid'
-        await s.commit()
-        return True
-
-
-async def mark_order_status(order_id: int, status: str):
-    async with AsyncSessionLocal() as s:
-        res = await s.execute(select(Order).where(Order.id == order_id))
-        o = res.scalars().first()
-        if not o:
-            return False
-        o.status = status
-        await s.commit()
-        return True
-
-
-async def list_orders_all():
-    async with AsyncSessionLocal() as s:
-        res = await s.execute(select(Order).order_by(Order.created_at.desc()))
-        return res.scalars().all()
-
-
-async def list_orders_by_tg_id(tg_id: int):
-    async with AsyncSessionLocal() as s:
-        res = await s.execute(select(User).where(User.tg_id == tg_id))
-        user = res.scalars().first()
-        if not user:
-            return []
-        res2 = await s.execute(select(Order).where(Order.user_id == user.id).order_by(Order.created_at.desc()))
-        orders = res2.scalars().all()
-        return orders
+    res = await s.execute(select(Product))
+    products = res.scalars().all()
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(['id','name','category_id','description','price','tags','rating'])
+    for p in products:
+        writer.writerow([p.id, p.name, p.category_id, p.description or '', p.price or 0, p.tags or '', p.rating or 0])
+    return buf.getvalue()
+
+async def add_to_cart(s: AsyncSession, user_id: int, product_id: int, qty: int = 1):
+    # user_id is the Telegram id; the cart is shared with the bot
+    await repository.change_cart_qty(s, user_id, product_id, qty)
+    items = [{'product_id': p.id, 'qty': q} for p, q in await repository.cart_lines(s, user_id)]
+    return {"ok": True, "items": items}
+
+async def replace_cart(s: AsyncSession, user_id: int, items):
+    await repository.replace_cart(s, user_id, items)
+    return {"ok": True}
+
+async def get_cart(s: AsyncSession, user_id: int):
+    lines = await repository.cart_lines(s, user_id)
+    return {"items": [
+        {'product_id': p.id, 'name': p.name, 'price': p.price, 'qty': qty}
+        for p, qty in lines
+    ]}
+
+async def clear_cart(s: AsyncSession, user_id: int):
+    await repository.clear_cart(s, user_id)
+    return {"ok": True}
+
+async def create_order(s: AsyncSession, order_data):
+    # ensure user exists and remember the latest contact details
+    await repository.save_customer(s, order_data.tg_id, order_data.name, order_data.phone, order_data.address)
+    # if order_data.items is empty, try to load from cart
+    items = getattr(order_data, 'items', None)
+    if not items:
+        items = [
+            {'product_id': p.id, 'name': p.name, 'price': p.price, 'qty': qty}
+            for p, qty in await repository.cart_lines(s, order_data.tg_id)
+        ]
+    o = Order(user_id=order_data.tg_id, items_json=json.dumps(items), total_price=order_data.total_price, address=order_data.address, name=order_data.name, phone=order_data.phone, payment_method=order_data.payment_method, status='new', trace_id=tracing.current_trace_id())
+    s.add(o)
+    # clear cart after creating order
+    await repository.clear_cart(s, order_data.tg_id)
+    await s.flush()
+    await repository.record_status_events(s, [o.id], o.status)
+    return o
+
+async def get_order(s: AsyncSession, order_id: int):
+    res = await s.execute(select(Order).where(Order.id == order_id))
+    return res.scalars().first()
+
+async def mark_order_paid(s: AsyncSession, order_id: int):
+    return await change_order_status(s, [order_id], order_status.PAID)
+
+
+async def change_order_status(s: AsyncSession, order_ids, status: str):
+    """Apply a state-machine transition to one or many orders.
+
+    Returns (moved, rejected): moved is [(order id, Telegram id)] for orders
+    that changed, rejected maps the other ids to their current status
+    (None if the order does not exist). Raises InvalidTransition for an
+    unknown status.
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    moved = await repository.transition_orders(s, order_ids, status)
+    missed = set(order_ids) - {order_id for order_id, _ in moved}
+    rejected = {}
+    if missed:
+        current = await repository.order_statuses(s, missed)
+        rejected = {order_id: current.get(order_id) for order_id in order_ids if order_id in missed}
+    return moved, rejected
+
+
+async def stage_durations(s: AsyncSession, date_from, date_to):
+    """Per-status duration percentiles from order_status_events (see repository.stage_durations)."""
+    return await repository.stage_durations(s, date_from, date_to)
+
+
+async def ready_delivery_orders(s: AsyncSession):
+    """(id, address, ready ts) of delivery orders waiting for a courier."""
+    return await repository.ready_delivery_orders(s)
+
+
+async def list_orders_all(s: AsyncSession, date_from=None, date_to=None):
+    """Orders in [date_from, date_to); without date_from only the hot table (see repository.list_orders)."""
+    return [OrderRow(*r) for r in await repository.list_orders(s, ORDER_COLUMN_NAMES, date_from, date_to)]
+
+
+async def order_stats(s: AsyncSession, today_from):
+    """Order count and revenue, all time and since today_from (see repository.order_totals)."""
+    total, revenue = await repository.order_totals(s)
+    today, today_revenue = await repository.order_totals(s, today_from)
+    return {'orders': total, 'revenue': revenue, 'today_orders': today, 'today_revenue': today_revenue}
+
+
+async def list_orders_by_tg_id(s: AsyncSession, tg_id: int):
+    src = repository.orders_with_archive()
+    res = await s.execute(
+        select(*[src.c[name] for name in ORDER_COLUMN_NAMES])
+        .where(src.c.user_id == tg_id)
+        .order_by(src.c.created_at.desc())
+    )
+    return [OrderRow(*r) for r in res]
@@ -0,0 +1,115 @@
+"""Courier dispatch: group ready delivery orders into bags and order the stops.
+
+Stops are bucketed in a uniform grid with cells the size of the grouping
+radius, so the neighbours of a stop are found in its own and the 8
+surrounding cells instead of by scanning every order.  Bags are built
+greedily: the order waiting longest seeds a bag, then the nearest
+unassigned order within the radius of the last added stop, and ready within
+the time window of the seed, is added until the bag is full.  The stops of
+each bag are then visited nearest-first from the restaurant.
+"""
+import math
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .geo import LatLon, haversine_km
+
+# the restaurant (start of every route)
+DEPOT = (float(os.getenv('RESTAURANT_LAT', '55.7558')), float(os.getenv('RESTAURANT_LON', '37.6173')))
+MAX_BAG = int(os.getenv('DISPATCH_MAX_BAG', '3'))
+RADIUS_KM = float(os.getenv('DISPATCH_RADIUS_KM', '2'))
+WINDOW_MIN = float(os.getenv('DISPATCH_WINDOW_MIN', '15'))
+# upper bounds of the admin request parameters
+MAX_BAG_LIMIT = 10
+MAX_RADIUS_KM = 50.0
+
+KM_PER_DEGREE = 111.2
+
+
+@dataclass(slots=True)
+class Stop:
+    order_id: int
+    address: str
+    lat: float
+    lon: float
+    ready_at: datetime
+
+
+@dataclass(slots=True)
+class Bag:
+    stops: List[Stop] = field(default_factory=list)
+    # restaurant -> stops in route order -> restaurant
+    distance_km: float = 0.0
+
+    @property
+    def order_ids(self) -> List[int]:
+        return [stop.order_id for stop in self.stops]
+
+
+class Grid:
+    """Uniform lat/lon grid with cell side ~cell_km around the given latitude."""
+
+    def __init__(self, cell_km: float, lat: float):
+        self.dlat = cell_km / KM_PER_DEGREE
+        self.dlon = cell_km / (KM_PER_DEGREE * max(0.1, math.cos(math.radians(lat))))
+        self.cells: Dict[Tuple[int, int], List[Stop]] = {}
+
+    def cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(lat // self.dlat), int(lon // self.dlon)
+
+    def add(self, stop: Stop):
+        self.cells.setdefault(self.cell(stop.lat, stop.lon), []).append(stop)
+
+    def near(self, lat: float, lon: float):
+        i, j = self.cell(lat, lon)
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                yield from self.cells.get((i + di, j + dj), ())
+
+
+def route(stops: Sequence[Stop], depot: LatLon = DEPOT) -> Tuple[List[Stop], float]:
+    """Nearest-neighbour tour from the depot and back; returns (stops in order, km)."""
+    left, ordered, here, km = list(stops), [], depot, 0.0
+    while left:
+        nxt = min(left, key=lambda s: haversine_km(here, (s.lat, s.lon)))
+        left.remove(nxt)
+        km += haversine_km(here, (nxt.lat, nxt.lon))
+        here = (nxt.lat, nxt.lon)
+        ordered.append(nxt)
+    return ordered, km + haversine_km(here, depot)
+
+
+def plan(stops: Sequence[Stop], depot: LatLon = DEPOT, max_bag: int = MAX_BAG,
+         radius_km: float = RADIUS_KM, window: Optional[timedelta] = None) -> List[Bag]:
+    """Group stops into bags of up to max_bag orders; bags come oldest-first."""
+    if max_bag < 1 or radius_km <= 0:
+        raise ValueError('max_bag must be at least 1 and radius_km positive')
+    window = window if window is not None else timedelta(minutes=WINDOW_MIN)
+    grid = Grid(radius_km, depot[0])
+    for stop in stops:
+        grid.add(stop)
+    assigned = set()
+    bags = []
+    for seed in sorted(stops, key=lambda s: s.ready_at):
+        if seed.order_id in assigned:
+            continue
+        assigned.add(seed.order_id)
+        members, last = [seed], seed
+        while len(members) < max_bag:
+            best, best_km = None, radius_km
+            for cand in grid.near(last.lat, last.lon):
+                if cand.order_id in assigned or abs(cand.ready_at - seed.ready_at) > window:
+                    continue
+                km = haversine_km((last.lat, last.lon), (cand.lat, cand.lon))
+                if km <= best_km:
+                    best, best_km = cand, km
+            if best is None:
+                break
+            assigned.add(best.order_id)
+            members.append(best)
+            last = best
+        ordered, km = route(members, depot)
+        bags.append(Bag(ordered, round(km, 2)))
+    return bags
@@ -0,0 +1,156 @@
+"""Address normalization and a local geocode cache.
+
+Coordinates reach the cache in two ways. The WebApp sends DaData's
+geo_lat/geo_lon with the order when the customer picked a suggestion.
+If DADATA_TOKEN is set, addresses without coordinates are geocoded once
+through the DaData suggestions API, concurrently and outside of any
+database transaction (fetch_many, then remember_many). Results are stored in geocode_cache,
+keyed by the normalized building address (apartment, entrance and floor
+dropped), and kept in memory, so dispatch works offline.
+"""
+import asyncio
+import logging
+import math
+import os
+import re
+from typing import Dict, Iterable, Optional, Tuple
+
+import httpx
+
+from shared import metrics, repository
+
+logger = logging.getLogger(__name__)
+
+DADATA_URL = 'https://suggestions.dadata.ru/suggestions/api/4_1/rs/suggest/address'
+DADATA_TOKEN = os.getenv('DADATA_TOKEN', '')
+GEOCODE_TIMEOUT = float(os.getenv('GEOCODE_TIMEOUT', '3'))
+# all lookups of one fetch_many together; slower addresses stay unlocated until the next call
+GEOCODE_DEADLINE = float(os.getenv('GEOCODE_DEADLINE', '5'))
+GEOCODE_CONCURRENCY = int(os.getenv('GEOCODE_CONCURRENCY', '5'))
+
+EARTH_RADIUS_KM = 6371.0
+
+_WORD_RE = re.compile(r'[\w/-]+', re.UNICODE)
+
+# long forms -> the abbreviations DaData uses ('' drops the word)
+ABBREVIATIONS = {
+    'город': '', 'г': '', 'улица': 'ул', 'проспект': 'пр-кт', 'переулок': 'пер', 'площадь': 'пл',
+    'бульвар': 'б-р', 'шоссе': 'ш', 'набережная': 'наб',
+    'дом': '', 'д': '', 'корпус': 'к', 'корп': 'к', 'строение': 'стр',
+}
+# everything from these words on is inside the building
+APARTMENT_WORDS = {'кв', 'квартира', 'офис', 'оф', 'подъезд', 'под', 'этаж', 'эт', 'домофон'}
+
+LatLon = Tuple[float, float]
+
+
+def normalize_address(address: Optional[str]) -> str:
+    """Canonical building address: 'Москва, улица Ленина, дом 5, кв. 12' -> 'москва ул ленина 5'."""
+    words = []
+    for word in _WORD_RE.findall((address or '').casefold().replace('ё', 'е')):
+        if word in APARTMENT_WORDS:
+            break
+        word = ABBREVIATIONS.get(word, word)
+        if word:
+            words.append(word)
+    return ' '.join(words)
+
+
+_APARTMENT_RE = re.compile(r'[,\s]*\b(?:' + '|'.join(sorted(APARTMENT_WORDS, key=len, reverse=True)) + r')\b.*$',
+                           re.IGNORECASE | re.DOTALL)
+
+
+def building_address(address: Optional[str]) -> str:
+    """The address as typed, without apartment / entrance / floor."""
+    return _APARTMENT_RE.sub('', (address or '').strip())
+
+
+def haversine_km(a: LatLon, b: LatLon) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+
+class Geocoder:
+    """normalized address -> (lat, lon); memory, then geocode_cache, then DaData."""
+
+    def __init__(self, token: str = DADATA_TOKEN, timeout: float = GEOCODE_TIMEOUT,
+                 deadline: float = GEOCODE_DEADLINE, concurrency: int = GEOCODE_CONCURRENCY):
+        self.token = token
+        self.timeout = timeout
+        self.deadline = deadline
+        self.concurrency = concurrency
+        self._memory: Dict[str, LatLon] = {}
+
+    async def remember(self, session, address: str, lat: float, lon: float, source: str = 'webapp'):
+        """Store known coordinates (same transaction as the caller's write)."""
+        key = normalize_address(address)
+        if not key:
+            return
+        await repository.save_geocode(session, key, address, lat, lon, source)
+        self._memory[key] = (lat, lon)
+
+    def cached(self, address: str) -> Optional[LatLon]:
+        """Coordinates already in memory (no database or network access)."""
+        return self._memory.get(normalize_address(address))
+
+    async def lookup_many(self, session, addresses: Iterable[str]) -> Dict[str, LatLon]:
+        """address -> (lat, lon) for every address in memory or geocode_cache (no network access)."""
+        keys = {address: normalize_address(address) for address in addresses if address}
+        missing = {key for key in keys.values() if key and key not in self._memory}
+        if missing:
+            self._memory.update(await repository.load_geocodes(session, missing))
+        return {address: self._memory[key] for address, key in keys.items() if key in self._memory}
+
+    async def fetch_many(self, addresses: Iterable[str]) -> Dict[str, LatLon]:
+        """Geocode addresses through DaData, concurrently, within `deadline` seconds in total.
+
+        Call it without an open transaction and store the result with
+        remember_many; addresses not located in time are left out.
+        """
+        by_key = {}
+        for address in addresses:
+            key = normalize_address(address)
+            if key and key not in self._memory:
+                by_key.setdefault(key, address)
+        if not by_key or not self.token:
+            return {}
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def one(client, address):
+            async with limit:
+                return address, await self._fetch(client, address)
+
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            tasks = [asyncio.ensure_future(one(client, address)) for address in by_key.values()]
+            done, pending = await asyncio.wait(tasks, timeout=self.deadline)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+                logger.warning("Geocoding deadline: %d of %d addresses not located", len(pending), len(tasks))
+        return {address: point for address, point in (task.result() for task in done) if point is not None}
+
+    async def remember_many(self, session, points: Dict[str, LatLon], source: str = 'dadata'):
+        """Store coordinates found by fetch_many (caller commits)."""
+        for address, (lat, lon) in points.items():
+            await self.remember(session, address, lat, lon, source)
+
+    async def _fetch(self, client: httpx.AsyncClient, address: str) -> Optional[LatLon]:
+        try:
+            resp = await client.post(
+                DADATA_URL, json={'query': address, 'count': 1},
+                headers={'Authorization': f'Token {self.token}', 'Accept': 'application/json'},
+            )
+            resp.raise_for_status()
+            suggestions = resp.json().get('suggestions') or []
+            data = suggestions[0]['data'] if suggestions else {}
+            if data.get('geo_lat') and data.get('geo_lon'):
+                return float(data['geo_lat']), float(data['geo_lon'])
+        except Exception:
+            logger.warning("Geocoding failed for %r", address, exc_info=True)
+            metrics.errors.inc(where='geocode')
+        return None
+
+
+geocoder = Geocoder()
@@ -0,0 +1,265 @@
+"""Product image proxy: WebP thumbnails in a content-addressed disk cache.
+
+A product image source is either an external URL (fetched once) or an
+admin upload ("upload:<sha256>").  Originals are stored by the sha256 of
+their bytes, thumbnails by that hash plus the size name, so the same
+picture used by several products is stored and resized only once.
+Resizing runs in a process pool; the cache directory is kept under a
+size limit by evicting the least recently used files.  Uploads are the
+only copy of the picture, so they live in UPLOAD_DIR, outside the cache,
+and are never evicted.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+import httpx
+
+CACHE_DIR = Path(os.getenv('IMAGE_CACHE_DIR', './media_cache'))
+UPLOAD_DIR = Path(os.getenv('IMAGE_UPLOAD_DIR', './media_uploads'))
+CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_MB', '512')) * 1024 * 1024
+WORKERS = int(os.getenv('IMAGE_WORKERS', '2'))
+MAX_SOURCE_BYTES = 15 * 1024 * 1024
+
+# size name -> longest side in px
+SIZES = {'thumb': 200, 'card': 480, 'full': 1280}
+
+UPLOAD_PREFIX = 'upload:'
+
+
+class ImageError(Exception):
+    pass
+
+
+def version(source: str) -> str:
+    """Short token that changes whenever the product image source changes."""
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+
+
+def thumb_url(product_id: int, source: Optional[str], size: str = 'card') -> Optional[str]:
+    if not source:
+        return None
+    return f'/img/{product_id}/{size}?v={version(source)}'
+
+
+def _make_thumbnail(src: str, dst: str, max_side: int):
+    # runs in a worker process
+    from PIL import Image
+
+    with Image.open(src) as im:
+        im.thumbnail((max_side, max_side))
+        if im.mode not in ('RGB', 'RGBA'):
+            im = im.convert('RGBA' if 'A' in im.getbands() else 'RGB')
+        tmp = dst + '.tmp'
+        im.save(tmp, 'WEBP', quality=80, method=4)
+    os.replace(tmp, dst)
+
+
+class ImageCache:
+    def __init__(self, root: Path = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES, workers: int = WORKERS,
+                 uploads: Path = UPLOAD_DIR):
+        self.root = Path(root)
+        self.uploads = Path(uploads)
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # source -> sha256 of the original bytes
+        self._sources: Dict[str, str] = {}
+        # cached file -> (size, last used); loaded lazily from disk
+        self._files: Optional[Dict[Path, list]] = None
+        self._total = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    # --- public API ---
+
+    async def thumbnail(self, source: str, size: str) -> Path:
+        """Path of the WebP thumbnail for source, creating it on first use."""
+        if size not in SIZES:
+            raise ImageError(f'unknown size {size}')
+        digest = await self._original(source)
+        dst = self._path('thumb', f'{digest}-{size}.webp')
+        if dst.exists():
+            self._touch(dst)
+            return dst
+        return await self._once(str(dst), self._resize(digest, dst, SIZES[size]))
+
+    def store_upload(self, data: bytes) -> str:
+        """Save uploaded bytes, return the source string for Product.image."""
+        if not data:
+            raise ImageError('empty upload')
+        if len(data) > MAX_SOURCE_BYTES:
+            raise ImageError('image is too large')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._upload_path(digest)
+        if not path.exists():
+            tmp = path.with_suffix('.tmp')
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        return UPLOAD_PREFIX + digest
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    # --- originals ---
+
+    async def _original(self, source: str) -> str:
+        if source.startswith(UPLOAD_PREFIX):
+            digest = source[len(UPLOAD_PREFIX):]
+            if len(digest) != 64 or digest.strip('0123456789abcdef'):
+                raise ImageError(f'bad upload reference {source!r}')
+            if not self._upload_path(digest).exists():
+                # uploaded before UPLOAD_DIR existed: move it out of the cache while it is still there
+                cached = self._path('orig', digest)
+                if not cached.exists():
+                    raise ImageError('uploaded image is missing')
+                os.replace(cached, self._upload_path(digest))
+                self._forget(cached)
+            return digest
+        digest = self._sources.get(source)
+        if digest is None:
+            ref = self._path('src', hashlib.sha1(source.encode('utf-8')).hexdigest())
+            if ref.exists():
+                digest = ref.read_text().strip()
+        if digest and self._path('orig', digest).exists():
+            self._sources[source] = digest
+            self._touch(self._path('orig', digest))
+            return digest
+        return await self._once('src:' + source, self._fetch(source))
+
+    async def _fetch(self, url: str) -> str:
+        if not url.startswith(('http://', 'https://')):
+            raise ImageError(f'unsupported image source {url!r}')
+        try:
+            async with httpx.AsyncClient(timeout=10, follow_redirects=True) as client:
+                resp = await client.get(url)
+        except httpx.HTTPError as e:
+            raise ImageError(f'fetch failed: {e}') from e
+        if resp.status_code != 200:
+            raise ImageError(f'fetch failed: HTTP {resp.status_code}')
+        if len(resp.content) > MAX_SOURCE_BYTES:
+            raise ImageError('image is too large')
+        digest = self._store_original(resp.content)
+        ref = self._path('src', hashlib.sha1(url.encode('utf-8')).hexdigest())
+        ref.write_text(digest)
+        self._sources[url] = digest
+        return digest
+
+    def _store_original(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path('orig', digest)
+        if not path.exists():
+            tmp = path.with_suffix('.tmp')
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+            self._added(path)
+        else:
+            self._touch(path)
+        return digest
+
+    # --- thumbnails ---
+
+    async def _resize(self, digest: str, dst: Path, max_side: int) -> Path:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._pool, _make_thumbnail, str(self._source_path(digest)), str(dst), max_side)
+        except Exception as e:
+            raise ImageError(f'thumbnail failed: {e}') from e
+        self._added(dst)
+        return dst
+
+    async def _once(self, key: str, coro):
+        """Run coro once per key; concurrent callers wait for the same result."""
+        fut = self._inflight.get(key)
+        if fut is not None:
+            coro.close()
+            return await asyncio.shield(fut)
+        fut = asyncio.ensure_future(coro)
+        self._inflight[key] = fut
+        try:
+            return await asyncio.shield(fut)
+        finally:
+            if fut.done():
+                self._inflight.pop(key, None)
+            else:
+                fut.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+    def _source_path(self, digest: str) -> Path:
+        upload = self._upload_path(digest)
+        return upload if upload.exists() else self._path('orig', digest)
+
+    # --- LRU bookkeeping ---
+
+    def _path(self, kind: str, name: str) -> Path:
+        # two-level fan-out keeps directories small
+        path = self.root / kind / name[:2] / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def _upload_path(self, digest: str) -> Path:
+        # not under root: nothing here is counted or evicted
+        path = self.uploads / digest[:2] / digest
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def _forget(self, path: Path):
+        entry = self._index().pop(path, None)
+        if entry is not None:
+            self._total -= entry[0]
+
+    def _index(self) -> Dict[Path, list]:
+        if self._files is None:
+            self._files = {}
+            for kind in ('orig', 'thumb'):
+                for path in (self.root / kind).glob('*/*'):
+                    if path.suffix == '.tmp':
+                        continue
+                    st = path.stat()
+                    self._files[path] = [st.st_size, st.st_mtime]
+                    self._total += st.st_size
+        return self._files
+
+    def _touch(self, path: Path):
+        entry = self._index().get(path)
+        if entry is not None:
+            entry[1] = time.time()
+
+    def _added(self, path: Path):
+        files = self._index()
+        size = path.stat().st_size
+        old = files.get(path)
+        if old is not None:
+            self._total -= old[0]
+        files[path] = [size, time.time()]
+        self._total += size
+        if self._total > self.max_bytes:
+            self._evict(keep=path)
+
+    def _evict(self, keep: Path):
+        # drop least recently used files down to 90% of the limit
+        target = self.max_bytes * 0.9
+        for path, (size, _) in sorted(self._files.items(), key=lambda kv: kv[1][1]):
+            if self._total <= target:
+                break
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            del self._files[path]
+            self._total -= size
+            if path.parent.parent.name == 'orig':
+                digest = path.name
+                for source in [s for s, d in self._sources.items() if d == digest]:
+                    del self._sources[source]
+
+
+image_cache = ImageCache()
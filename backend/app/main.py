@@ -1,18 +1,33 @@
-from fastapi import FastAPI, Request, HTTPException, Depends, Header
+from fastapi import FastAPI, Request, HTTPException, Depends, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
-from fastapi.responses import HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, Response
 import uvicorn
+import asyncio
 import os
 import hashlib
+import json
+import logging
 import time
 import secrets
-from typing import Optional
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from typing import List, Optional
 
-from . import db, crud, schemas, payments
+import httpx
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
-app = FastAPI(title="Telegram Food Backend")
+from . import db, crud, schemas, payments, search, images, geo, dispatch, addresses, webapp_auth
+from .catalog import catalog
+from .responses import ORJSONResponse
+from shared import eta, jobs, metrics, order_status, repository, tracing
+from shared.repository import CATALOG_POLL_INTERVAL
+
+tracing.setup_logging('backend')
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="Telegram Food Backend", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,6 +36,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    """Latency per route template (/api/orders/{tg_id}), so ids do not explode the label set."""
+    t = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get('route')
+        metrics.http_duration.observe(
+            time.perf_counter() - t, method=request.method,
+            route=getattr(route, 'path', None) or 'unmatched', status=status,
+        )
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Span per request; continues the caller's trace (traceparent / X-Request-ID) and returns its id."""
+    parent = tracing.parse_traceparent(request.headers.get('traceparent'))
+    trace_id, parent_id = parent or (tracing.valid_trace_id(request.headers.get('x-request-id')), None)
+    attributes = {'http.method': request.method, 'http.target': request.url.path}
+    with tracing.span(f'{request.method} {request.url.path}', attributes, kind='server',
+                      trace_id=trace_id, parent_id=parent_id) as span:
+        response = await call_next(request)
+        route = request.scope.get('route')
+        if getattr(route, 'path', None):
+            span.name = f'{request.method} {route.path}'
+        span.set('http.status_code', response.status_code)
+        response.headers['X-Request-ID'] = span.trace_id
+        return response
+
+
+metrics.registry.stats('address_suggest_cache_total', 'Address suggestion cache hits, misses and errors',
+                       lambda: addresses.suggester.stats)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(authorization: Optional[str] = Header(None)):
+    if not metrics.authorized(authorization or ''):
+        raise HTTPException(401, "Требуется авторизация")
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
 # Защита от брутфорса
 auth_attempts = {}  # {ip: [(timestamp, success), ...]}
 MAX_ATTEMPTS = 20
@@ -28,9 +88,11 @@ BLOCK_TIME = 300  # 5 минут
 
 # Хранилище токенов {token: {user_id, created_at}}
 active_tokens = {}
+TOKEN_TTL = 86400  # 24 часа
 
 # Хранилище запросов на вход {request_id: {username, status, timestamp, user_data}}
 login_requests = {}
+LOGIN_REQUEST_TTL = 300  # 5 минут
 
 def check_rate_limit(ip: str):
     """Проверка на брутфорс"""
@@ -66,7 +128,7 @@ def verify_admin_token(authorization: Optional[str] = Header(None)) -> int:
     
     # Проверяем срок действия (24 часа)
     token_data = active_tokens[token]
-    if time.time() - token_data['created_at'] > 86400:
+    if time.time() - token_data['created_at'] > TOKEN_TTL:
         del active_tokens[token]
         raise HTTPException(401, "Токен истёк")
     
@@ -77,24 +139,101 @@ static_dir = Path(__file__).resolve().parent.parent.parent.joinpath('webapp')
 # Serve SPA: enable html=True so directory requests return index.html
 app.mount("/webapp", StaticFiles(directory=str(static_dir), html=True), name="webapp")
 
+_catalog_watcher: Optional[asyncio.Task] = None
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if _catalog_watcher is not None:
+        _catalog_watcher.cancel()
+    await jobs.scheduler.stop()
+    images.image_cache.close()
+    await addresses.suggester.close()
+    await db.router.close()
+
+
 @app.on_event("startup")
 async def startup():
+    global _catalog_watcher
     await db.init_db()
     await db.create_sample_data()
+    async with db.AsyncSessionLocal() as s:
+        await crud.sync_product_tags(s)
+        await s.commit()
+        await rebuild_catalog(s)
+        await eta.estimator.refresh(s, force=True)
+        await addresses.suggester.index.refresh(s)
+    _catalog_watcher = asyncio.create_task(watch_catalog())
+    jobs.add_shared_jobs(jobs.scheduler)
+    jobs.scheduler.add('sweep_auth', sweep_auth, '5m')
+    jobs.scheduler.start()
+
+
+async def rebuild_catalog(s: AsyncSession):
+    version = await crud.get_catalog_version(s)
+    products = await crud.list_products(s)
+    catalog.build(products, await crud.list_product_tags(s), await crud.list_categories(s))
+    catalog.db_version = version
+    search.product_index.build(catalog.products())
+
+
+async def watch_catalog():
+    """Rebuild the catalog when it was edited outside this process (e.g. bot /addproduct)."""
+    while True:
+        await asyncio.sleep(CATALOG_POLL_INTERVAL)
+        try:
+            # version and products from the same snapshot, so a lagging replica is never half-read
+            async with db.read_session() as s:
+                if await crud.get_catalog_version(s) != catalog.db_version:
+                    await rebuild_catalog(s)
+        except Exception:
+            logger.exception("Catalog refresh failed")
+            metrics.errors.inc(where='watch_catalog')
+
+
+async def sweep_auth() -> int:
+    """Forget expired tokens, old login requests and login attempts outside the rate-limit window."""
+    now = time.time()
+    removed = 0
+    for token in [t for t, data in active_tokens.items() if now - data['created_at'] > TOKEN_TTL]:
+        del active_tokens[token]
+        removed += 1
+    # expired requests are kept a little longer so check-login can still answer 'expired'
+    for request_id in [r for r, req in login_requests.items() if now - req['timestamp'] > 2 * LOGIN_REQUEST_TTL]:
+        del login_requests[request_id]
+        removed += 1
+    for ip in list(auth_attempts):
+        auth_attempts[ip] = [(t, ok) for t, ok in auth_attempts[ip] if now - t < BLOCK_TIME]
+        if not auth_attempts[ip]:
+            del auth_attempts[ip]
+    return removed
+
+
+def on_product_changed(product):
+    search.product_index.add(catalog.upsert(product, crud.parse_tags(product.tags)))
+
+
+def on_product_removed(product_id: int):
+    catalog.remove(product_id)
+    search.product_index.remove(product_id)
+
+
+async def on_categories_changed(s: AsyncSession):
+    catalog.set_categories(await crud.list_categories(s))
 
 
 @app.post("/api/admin/auth")
-async def admin_auth(request: Request, payload: dict):
+async def admin_auth(request: Request, payload: schemas.AdminAuthIn):
     """Авторизация администратора через Telegram или логин/пароль"""
     client_ip = request.client.host
     check_rate_limit(client_ip)
     
-    auth_type = payload.get('auth_type', 'telegram')  # telegram или password
+    auth_type = payload.auth_type  # telegram или password
     
     if auth_type == 'password':
         # Авторизация по логину/паролю
-        username = payload.get('username')
-        password = payload.get('password')
+        username = payload.username
+        password = payload.password
         
         admin_username = os.getenv('ADMIN_USERNAME', 'admin')
         admin_password = os.getenv('ADMIN_PASSWORD', 'admin')
@@ -124,8 +263,8 @@ async def admin_auth(request: Request, payload: dict):
     
     else:
         # Авторизация через Telegram
-        user_id = payload.get('user_id')
-        username = payload.get('username')
+        user_id = payload.user_id
+        username = payload.username
         
         if not user_id and not username:
             auth_attempts[client_ip].append((time.time(), False))
@@ -161,21 +300,21 @@ async def admin_auth(request: Request, payload: dict):
             'token': token,
             'user': {
                 'id': user_id,
-                'first_name': payload.get('first_name', 'Админ'),
-                'last_name': payload.get('last_name', ''),
-                'username': payload.get('username', '')
+                'first_name': payload.first_name,
+                'last_name': payload.last_name,
+                'username': payload.username or ''
             }
         }
 
 
 @app.post("/api/admin/login")
-async def admin_login(request: Request, payload: dict):
+async def admin_login(request: Request, payload: schemas.AdminLoginIn):
     """Прямая авторизация по логину/паролю без подтверждения"""
     client_ip = request.client.host
     check_rate_limit(client_ip)
     
-    username = payload.get('username')
-    password = payload.get('password')
+    username = payload.username
+    password = payload.password
     
     admin_username = os.getenv('ADMIN_USERNAME', 'admin')
     admin_password = os.getenv('ADMIN_PASSWORD', 'admin')
@@ -213,7 +352,7 @@ async def check_login(request_id: str):
     req = login_requests[request_id]
     
     # Проверяем срок действия (5 минут)
-    if time.time() - req['timestamp'] > 300:
+    if time.time() - req['timestamp'] > LOGIN_REQUEST_TTL:
         req['status'] = 'expired'
         return {'status': 'expired'}
     
@@ -240,16 +379,16 @@ async def check_login(request_id: str):
 
 
 @app.post("/api/admin/confirm-login/{request_id}")
-async def confirm_login(request_id: str, payload: dict):
+async def confirm_login(request_id: str, payload: schemas.ConfirmLoginIn):
     """Подтверждение/отклонение запроса на вход (вызывается из callback бота)"""
     if request_id not in login_requests:
         raise HTTPException(404, "Запрос не найден")
     
-    action = payload.get('action')  # 'confirm' или 'reject'
+    action = payload.action  # 'confirm' или 'reject'
     
     if action == 'confirm':
         login_requests[request_id]['status'] = 'confirmed'
-        login_requests[request_id]['user_data'] = payload.get('user_data')
+        login_requests[request_id]['user_data'] = payload.user_data
     else:
         login_requests[request_id]['status'] = 'rejected'
     
@@ -257,121 +396,204 @@ async def confirm_login(request_id: str, payload: dict):
 
 
 @app.get("/api/categories")
-async def get_categories():
-    return await crud.list_categories()
+async def get_categories(s: AsyncSession = Depends(db.get_session)):
+    return ORJSONResponse(await crud.list_categories(s))
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match (список через запятую, '*', слабые W/-теги) совпадает с etag"""
+    for tag in (if_none_match or '').split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == '*' or tag == etag:
+            return True
+    return False
+
+
+@app.get("/api/menu")
+async def get_menu(request: Request):
+    """Категории и товары одним ответом для старта WebApp (с ETag)"""
+    body, etag = catalog.menu()
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type='application/json', headers=headers)
 
 
 @app.post('/api/admin/category')
-async def api_create_category(payload: dict, user_id: int = Depends(verify_admin_token)):
-    c = await crud.create_category(payload)
+async def api_create_category(payload: schemas.CategoryIn, user_id: int = Depends(verify_admin_token), s: AsyncSession = Depends(db.get_session)):
+    c = await crud.create_category(s, payload.model_dump())
+    await s.commit()
+    await on_categories_changed(s)
     return c
 
 
 @app.put('/api/admin/category/{cat_id}')
-async def api_update_category(cat_id: int, payload: dict, user_id: int = Depends(verify_admin_token)):
-    c = await crud.update_category(cat_id, payload)
+async def api_update_category(cat_id: int, payload: schemas.CategoryUpdate, user_id: int = Depends(verify_admin_token), s: AsyncSession = Depends(db.get_session)):
+    c = await crud.update_category(s, cat_id, payload.model_dump(exclude_unset=True))
     if not c:
         raise HTTPException(404, 'category not found')
+    await s.commit()
+    await on_categories_changed(s)
     return c
 
 
 @app.delete('/api/admin/category/{cat_id}')
-async def api_delete_category(cat_id: int, user_id: int = Depends(verify_admin_token)):
-    ok = await crud.delete_category(cat_id)
+async def api_delete_category(cat_id: int, user_id: int = Depends(verify_admin_token), s: AsyncSession = Depends(db.get_session)):
+    ok = await crud.delete_category(s, cat_id)
     if not ok:
         raise HTTPException(404, 'category not found')
+    await s.commit()
+    await on_categories_changed(s)
     return {"ok": True}
 
 
 @app.get("/api/products")
-async def get_products(category_id: int = None):
-    return await crud.list_products(category_id)
+async def get_products(
+    category_id: int = None,
+    tag: Optional[List[str]] = Query(None),
+    min_rating: float = None,
+    facets: bool = False,
+):
+    """Товары из кэша каталога; tag/min_rating фильтруют, facets=1 добавляет счётчики"""
+    tags = [t for value in (tag or []) for t in crud.parse_tags(value)]
+    if not tags and min_rating is None and not facets:
+        return ORJSONResponse(catalog.products(category_id))
+    items, counts = catalog.query(category_id, tags, min_rating)
+    if facets:
+        return ORJSONResponse({'items': items, 'facets': counts})
+    return ORJSONResponse(items)
+
+
+@app.get("/api/products/search")
+async def search_products(q: str = '', limit: int = 20):
+    """Поиск по названию, описанию и тегам (с учётом опечаток)"""
+    return search.product_index.search(q, limit=max(1, min(limit, 100)))
 
 
 @app.post('/api/admin/product')
-async def api_create_product(payload: dict, user_id: int = Depends(verify_admin_token)):
-    p = await crud.create_product(payload)
-    return p
+async def api_create_product(payload: schemas.ProductIn, user_id: int = Depends(verify_admin_token), s: AsyncSession = Depends(db.get_session)):
+    p = await crud.create_product(s, payload.model_dump(exclude_unset=True))
+    await s.commit()
+    on_product_changed(p)
+    return crud.product_row(p)
 
 
 @app.put('/api/admin/product/{product_id}')
-async def api_update_product(product_id: int, payload: dict, user_id: int = Depends(verify_admin_token)):
-    p = await crud.update_product(product_id, payload)
+async def api_update_product(product_id: int, payload: schemas.ProductUpdate, user_id: int = Depends(verify_admin_token), s: AsyncSession = Depends(db.get_session)):
+    p = await crud.update_product(s, product_id, payload.model_dump(exclude_unset=True))
     if not p:
         raise HTTPException(404, 'product not found')
-    return p
+    await s.commit()
+    on_product_changed(p)
+    return crud.product_row(p)
 
 
 @app.delete('/api/admin/product/{product_id}')
-async def api_delete_product(product_id: int, user_id: int = Depends(verify_admin_token)):
-    ok = await crud.delete_product(product_id)
+async def api_delete_product(product_id: int, user_id: int = Depends(verify_admin_token), s: AsyncSession = Depends(db.get_session)):
+    ok = await crud.delete_product(s, product_id)
     if not ok:
         raise HTTPException(404, 'product not found')
+    await s.commit()
+    on_product_removed(product_id)
     return {"ok": True}
 
 
+@app.put('/api/admin/product/{product_id}/image')
+async def api_upload_product_image(product_id: int, request: Request, user_id: int = Depends(verify_admin_token), s: AsyncSession = Depends(db.get_session)):
+    """Загрузка фото товара (тело запроса — файл изображения)"""
+    try:
+        source = images.image_cache.store_upload(await request.body())
+    except images.ImageError as e:
+        raise HTTPException(400, str(e))
+    p = await crud.update_product(s, product_id, {'image': source})
+    if not p:
+        raise HTTPException(404, 'product not found')
+    await s.commit()
+    on_product_changed(p)
+    return crud.product_row(p)
+
+
+@app.get('/img/{product_id}/{size}')
+async def product_image(product_id: int, size: str, v: str = None):
+    """WebP-миниатюра фото товара из дискового кэша"""
+    product = catalog.get(product_id)
+    if size not in images.SIZES or not product or not product.get('image'):
+        raise HTTPException(404, 'image not found')
+    try:
+        path = await images.image_cache.thumbnail(product['image'], size)
+    except images.ImageError as e:
+        raise HTTPException(502, str(e))
+    # versioned URLs never change content; unversioned ones may after an edit
+    if v == images.version(product['image']):
+        cache_control = 'public, max-age=31536000, immutable'
+    else:
+        cache_control = 'public, max-age=300'
+    return FileResponse(path, media_type='image/webp', headers={'Cache-Control': cache_control})
+
+
 @app.get('/api/admin/products/export')
-async def export_products():
-    csv = await crud.export_products_csv()
+async def export_products(s: AsyncSession = Depends(db.get_read_session)):
+    csv = await crud.export_products_csv(s)
     return HTMLResponse(content=csv, media_type='text/csv')
 
 
 @app.post("/api/cart/{user_id}/add")
-async def add_to_cart(user_id: int, item: schemas.AddCartItem):
-    return await crud.add_to_cart(user_id, item.product_id, item.qty)
+async def add_to_cart(user_id: int, item: schemas.AddCartItem, s: AsyncSession = Depends(db.get_session)):
+    result = await crud.add_to_cart(s, user_id, item.product_id, item.qty)
+    await s.commit()
+    return result
 
 @app.post("/api/cart")
-async def sync_cart(request: Request):
+async def sync_cart(payload: schemas.CartSync, s: AsyncSession = Depends(db.get_session)):
     """Синхронизация корзины из WebApp (не используется, все в WebApp)"""
-    data = await request.json()
-    user_id = data.get('user_id', 0)
-    items = data.get('items', [])
-    
-    if not user_id:
+    if not payload.user_id:
         raise HTTPException(400, "user_id required")
     
-    # Очищаем старую корзину
-    await crud.clear_cart(user_id)
-    
-    # Добавляем новые позиции
-    for item in items:
-        await crud.add_to_cart(user_id, item['product_id'], item['qty'])
+    # Заменяем корзину целиком (одна транзакция)
+    await crud.replace_cart(s, payload.user_id, [{'product_id': i.product_id, 'qty': i.qty} for i in payload.items])
+    await s.commit()
     
     return {"ok": True}
 
 
 @app.get("/api/cart/{user_id}")
-async def get_cart(user_id: int):
-    return await crud.get_cart(user_id)
+async def get_cart(user_id: int, s: AsyncSession = Depends(db.get_session)):
+    return await crud.get_cart(s, user_id)
 
 
 @app.delete("/api/cart/{user_id}")
-async def delete_cart(user_id: int):
-    return await crud.clear_cart(user_id)
+async def delete_cart(user_id: int, s: AsyncSession = Depends(db.get_session)):
+    result = await crud.clear_cart(s, user_id)
+    await s.commit()
+    return result
+
+
+def webapp_user_id(x_telegram_init_data: Optional[str] = Header(None)) -> Optional[int]:
+    """Telegram id из подписанного initData WebApp; None без него или при неверной подписи"""
+    user = webapp_auth.verify_init_data(x_telegram_init_data, os.getenv('BOT_TOKEN'))
+    return user['id'] if user else None
 
 
 @app.post("/api/orders")
-async def create_order(request: Request):
-    """Создание заказа из WebApp"""
-    import httpx
-    import os
-    import json as json_lib
-    
-    try:
-        data = await request.json()
-    except Exception as e:
-        raise HTTPException(400, f"Invalid JSON: {str(e)}")
-    
-    user_id = data.get('user_id')
-    username = data.get('username')
-    first_name = data.get('first_name', 'Гость')
-    items = data.get('items', [])
-    total_price = data.get('total_price', 0)
-    address = data.get('address', '')
-    phone = data.get('phone', '')
-    comment = data.get('comment', '')
-    payment_method = data.get('payment_method', 'cash')
-    delivery_type = data.get('delivery_type', 'delivery')
+async def create_order(payload: schemas.OrderIn, session: AsyncSession = Depends(db.get_session),
+                       verified_user: Optional[int] = Depends(webapp_user_id)):
+    """Создание заказа из WebApp.
+
+    Профиль клиента и его адреса сохраняются, только если user_id
+    подтверждён подписанным initData.
+    """
+    user_id = payload.user_id
+    username = payload.username
+    first_name = payload.first_name
+    items = payload.items
+    total_price = payload.total_price
+    address = payload.address
+    phone = payload.phone
+    comment = payload.comment
+    payment_method = payload.payment_method
+    delivery_type = payload.delivery_type
     
     # Валидация - теперь user_id необязателен
     if not items:
@@ -383,26 +605,43 @@ async def create_order(request: Request):
     # Создаём идентификатор клиента
     customer_identifier = f"@{username}" if username else f"ID:{user_id}" if user_id else phone
     
+    # ETA считается по очереди на кухне до того, как заказ в неё встанет
+    await eta.estimator.refresh(session)
+    eta_minutes = eta.estimator.estimate_minutes(delivery_type == 'delivery')
+    eta_text = eta.estimator.estimate_text(delivery_type == 'delivery')
+
     # Создаем заказ в БД
-    from sqlalchemy import insert
-    from backend.app.db import AsyncSessionLocal, Order
-    
-    items_json = json_lib.dumps(items, ensure_ascii=False)
-    
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            insert(Order).values(
-                user_id=user_id,
-                items_json=items_json,
-                total_price=total_price,
-                address=address,
-                phone=phone,
-                payment_method=payment_method,
-                status='new'
-            ).returning(Order.id)
-        )
-        await session.commit()
-        order_id = result.scalar()
+    items_json = json.dumps([item.model_dump() for item in items], ensure_ascii=False)
+    
+    result = await session.execute(
+        insert(db.Order).values(
+            user_id=user_id,
+            items_json=items_json,
+            total_price=total_price,
+            address=address,
+            name=first_name,
+            phone=phone,
+            payment_method=payment_method,
+            delivery_type=delivery_type,
+            status='new',
+            trace_id=tracing.current_trace_id()
+        ).returning(db.Order.id)
+    )
+    order_id = result.scalar()
+    tracing.set_attribute('order.id', order_id)
+    if delivery_type == 'delivery' and payload.lat is not None and payload.lon is not None:
+        await geo.geocoder.remember(session, address, payload.lat, payload.lon)
+    await repository.record_status_events(session, [order_id], order_status.NEW)
+    # user_id из тела запроса может быть любым: профиль пишем только за подтверждённого клиента
+    owner = user_id if user_id and user_id == verified_user else None
+    if owner:
+        # профиль для повторных заказов в боте
+        await repository.save_customer(session, user_id, first_name, phone,
+                                       address if delivery_type == 'delivery' else None)
+    await session.commit()
+    eta.estimator.on_created(order_id)
+    if delivery_type == 'delivery':
+        addresses.suggester.index.add(address, owner)
     
     # Отправляем уведомление в Telegram
     bot_token = os.getenv('BOT_TOKEN')
@@ -418,7 +657,7 @@ async def create_order(request: Request):
             }
             payment_text = payment_texts.get(payment_method, payment_method)
             
-            items_text = '\n'.join([f"• {item['name']} × {item['qty']} = {item['price'] * item['qty']} ₽" for item in items])
+            items_text = '\n'.join([f"• {item.name} × {item.qty} = {item.price * item.qty} ₽" for item in items])
             
             message = f"""
 🎉 <b>Заказ #{order_id} принят!</b>
@@ -441,53 +680,167 @@ async def create_order(request: Request):
             if comment:
                 message += f"💬 Комментарий: {comment}\n"
             
-            message += f"\n⏱ Статус: <b>Готовится</b>"
+            message += f"\n📋 Статус: <b>{order_status.title(order_status.NEW)}</b>"
+            message += f"\n⏱ {'Доставим' if delivery_type == 'delivery' else 'Будет готов'} через: <b>{eta_text}</b>"
             
             async with httpx.AsyncClient() as client:
-                await client.post(
-                    f'https://api.telegram.org/bot{bot_token}/sendMessage',
-                    json={
-                        'chat_id': user_id,
-                        'text': message,
-                        'parse_mode': 'HTML'
-                    }
-                )
-        except Exception as e:
-            print(f"Error sending notification: {e}")
-    
-    return {"ok": True, "order_id": order_id}
+                with tracing.span('telegram sendMessage', {'telegram.chat_id': user_id}, kind='client'), \
+                        metrics.telegram_call('sendMessage'):
+                    response = await client.post(
+                        f'https://api.telegram.org/bot{bot_token}/sendMessage',
+                        json={
+                            'chat_id': user_id,
+                            'text': message,
+                            'parse_mode': 'HTML'
+                        }
+                    )
+                    response.raise_for_status()
+        except Exception:
+            logger.exception("Error sending notification")
+            metrics.errors.inc(where='create_order_notify')
+    
+    return {"ok": True, "order_id": order_id, "eta_minutes": eta_minutes, "eta": eta_text}
+
+
+@app.get("/api/address/suggest")
+async def address_suggest(q: str = '', count: int = 7, user_id: Optional[int] = Depends(webapp_user_id),
+                          s: AsyncSession = Depends(db.get_session)):
+    """Подсказки адреса: прошлые адреса клиента, частые адреса доставки, затем DaData.
+
+    Свои адреса (с квартирой) — только по подписанному initData WebApp;
+    без него — общие подсказки до уровня дома.
+    """
+    if addresses.suggester.index.stale():
+        await addresses.suggester.index.refresh(s)
+    return {"suggestions": await addresses.suggester.suggest(q, max(1, min(count, 20)), user_id)}
 
 
 @app.get("/api/orders/{tg_id}")
-async def get_orders_by_tg(tg_id: int):
-    return await crud.list_orders_by_tg_id(tg_id)
+async def get_orders_by_tg(tg_id: int, s: AsyncSession = Depends(db.get_read_session)):
+    return ORJSONResponse(await crud.list_orders_by_tg_id(s, tg_id))
 
 
 @app.get('/api/admin/orders')
-async def admin_list_orders(user_id: int = Depends(verify_admin_token)):
-    return await crud.list_orders_all()
+async def admin_list_orders(date_from: Optional[date] = None, date_to: Optional[date] = None, user_id: int = Depends(verify_admin_token)):
+    """Заказы за период (date_to включительно); без date_from — только оперативные: открытые и за последние дни"""
+    # оперативный список (после смены статуса) — с primary, история за период — с реплики
+    sessions = db.read_session() if date_from else db.AsyncSessionLocal()
+    async with sessions as s:
+        orders = await crud.list_orders_all(
+            s,
+            datetime.combine(date_from, dt_time.min) if date_from else None,
+            datetime.combine(date_to + timedelta(days=1), dt_time.min) if date_to else None,
+        )
+    return ORJSONResponse(orders)
+
+
+@app.get('/api/admin/stats')
+async def admin_stats(today_from: Optional[datetime] = None, user_id: int = Depends(verify_admin_token), s: AsyncSession = Depends(db.get_read_session)):
+    """Число заказов и выручка за всё время и с начала дня; today_from — начало дня админа (по умолчанию полночь UTC)"""
+    if today_from is None:
+        today_from = datetime.combine(datetime.utcnow().date(), dt_time.min)
+    elif today_from.tzinfo is not None:
+        today_from = today_from.astimezone(timezone.utc).replace(tzinfo=None)
+    return await crud.order_stats(s, today_from)
+
+
+def _single_status_change(order_id: int, rejected: dict, status: str):
+    if order_id in rejected:
+        current = rejected[order_id]
+        if current is None:
+            raise HTTPException(404, 'order not found')
+        raise HTTPException(409, f'cannot change status from {current} to {status}')
+
+
+@app.get('/api/admin/dispatch')
+async def admin_dispatch(max_bag: int = Query(dispatch.MAX_BAG, ge=1, le=dispatch.MAX_BAG_LIMIT),
+                         radius_km: float = Query(dispatch.RADIUS_KM, gt=0, le=dispatch.MAX_RADIUS_KM),
+                         window_min: float = Query(dispatch.WINDOW_MIN, ge=0),
+                         user_id: int = Depends(verify_admin_token), s: AsyncSession = Depends(db.get_session)):
+    """Готовые заказы на доставку, сгруппированные по сумкам курьеров с порядком объезда"""
+    rows = await crud.ready_delivery_orders(s)
+    addresses = [address for _, address, _ in rows]
+    points = await geo.geocoder.lookup_many(s, addresses)
+    await s.commit()  # no transaction stays open while DaData answers
+    found = await geo.geocoder.fetch_many([address for address in addresses if address not in points])
+    if found:
+        await geo.geocoder.remember_many(s, found)
+        await s.commit()
+        points.update(found)
+    stops = [dispatch.Stop(order_id, address, *points[address], ready_at)
+             for order_id, address, ready_at in rows if address in points]
+    bags = dispatch.plan(stops, max_bag=max_bag, radius_km=radius_km, window=timedelta(minutes=window_min))
+    return ORJSONResponse({
+        'bags': [{'orders': bag.order_ids, 'distance_km': bag.distance_km, 'stops': bag.stops} for bag in bags],
+        'unlocated': [{'order_id': order_id, 'address': address}
+                      for order_id, address, _ in rows if address not in points],
+    })
+
+
+@app.get('/api/admin/jobs')
+async def admin_jobs(user_id: int = Depends(verify_admin_token)):
+    """Фоновые задачи этого процесса: интервал, запуски, ошибки, длительность"""
+    return {'owner': jobs.scheduler.owner, 'jobs': jobs.scheduler.snapshot()}
+
+
+@app.post('/api/admin/jobs/{name}/run')
+async def admin_run_job(name: str, user_id: int = Depends(verify_admin_token)):
+    """Запустить задачу сейчас (leader-задачи — только если другой процесс её не выполняет)"""
+    if name not in jobs.scheduler.jobs:
+        raise HTTPException(404, 'Задача не найдена')
+    ran = await jobs.scheduler.run(name, force=True)
+    return {'ran': ran, 'job': next(j for j in jobs.scheduler.snapshot() if j['name'] == name)}
+
+
+@app.get('/api/admin/orders/stage-stats')
+async def admin_stage_stats(date_from: Optional[date] = None, date_to: Optional[date] = None, user_id: int = Depends(verify_admin_token), s: AsyncSession = Depends(db.get_read_session)):
+    """Сколько заказы проводят в каждом статусе (секунды, UTC-даты, date_to включительно; по умолчанию 7 дней)"""
+    date_to = date_to or datetime.utcnow().date()
+    date_from = date_from or date_to - timedelta(days=7)
+    if date_from > date_to:
+        raise HTTPException(400, 'date_from must not be after date_to')
+    stages = await crud.stage_durations(s, datetime.combine(date_from, dt_time.min),
+                                        datetime.combine(date_to + timedelta(days=1), dt_time.min))
+    return {'date_from': date_from, 'date_to': date_to, 'stages': stages}
 
 
 @app.post('/api/admin/order/{order_id}/status')
-async def admin_change_status(order_id: int, payload: dict, user_id: int = Depends(verify_admin_token)):
-    # payload: {"status": "ready"}
-    status = payload.get('status')
+async def admin_change_status(order_id: int, payload: schemas.OrderStatusIn, user_id: int = Depends(verify_admin_token), s: AsyncSession = Depends(db.get_session)):
+    status = payload.status
     if not status:
         raise HTTPException(400, 'status required')
-    # update DB and notify via payments.notify
-    from . import payments
-    await payments.process_webhook(order_id, status)
+    try:
+        _, rejected = await payments.process_webhook(s, order_id, status)
+    except order_status.InvalidTransition as e:
+        raise HTTPException(400, str(e))
+    _single_status_change(order_id, rejected, status)
     return {"ok": True}
 
 
+@app.post('/api/admin/orders/status')
+async def admin_change_status_bulk(payload: schemas.BulkOrderStatusIn, user_id: int = Depends(verify_admin_token), s: AsyncSession = Depends(db.get_session)):
+    """Перевод пачки заказов в один статус (например, все готовые в конце смены)"""
+    if not payload.order_ids:
+        raise HTTPException(400, 'order_ids required')
+    try:
+        moved, rejected = await payments.change_status(s, payload.order_ids, payload.status)
+    except order_status.InvalidTransition as e:
+        raise HTTPException(400, str(e))
+    return {"ok": True, "moved": [order_id for order_id, _ in moved], "rejected": rejected}
+
+
 @app.post("/webhook/payment")
-async def payment_webhook(payload: dict):
+async def payment_webhook(payload: schemas.PaymentWebhookIn, s: AsyncSession = Depends(db.get_session)):
     # mocked webhook
-    order_id = payload.get("order_id")
-    status = payload.get("status")
+    order_id = payload.order_id
+    status = payload.status or order_status.PAID
     if not order_id:
         raise HTTPException(400, "order_id required")
-    await payments.process_webhook(order_id, status)
+    try:
+        _, rejected = await payments.process_webhook(s, order_id, status)
+    except order_status.InvalidTransition as e:
+        raise HTTPException(400, str(e))
+    _single_status_change(order_id, rejected, status)
     return {"ok": True}
 
 
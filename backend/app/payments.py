@@ -1,72 +1,88 @@
+import asyncio
+import logging
 import os
 from . import crud
-import os
 from aiogram import Bot
+from shared import eta, metrics, order_status, tracing
+
+logger = logging.getLogger(__name__)
 
 BASE_URL = os.getenv('BASE_URL', 'http://localhost:8000')
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_CHAT = os.getenv('ADMIN_CHAT') or os.getenv('ADMIN_IDS')
+# concurrent sendMessage calls per batch, well under Telegram's ~30 msg/s
+NOTIFY_CONCURRENCY = 10
 
 def get_payment_url(order_id: int):
     # returns a simple mock payment page on backend
     return f"{BASE_URL}/pay/{order_id}"
 
-async def process_webhook(order_id: int, status: str):
-    """Обработка изменения статуса заказа и отправка уведомлений"""
-    # update order status in DB
-    await crud.mark_order_status(order_id, status)
 
-    # notify user and admin about status change
+def admin_ids():
+    admin_ids_str = os.getenv('ADMIN_IDS', '')
+    return [int(id.strip()) for id in admin_ids_str.split(',') if id.strip()]
+
+
+async def change_status(s, order_ids, status: str):
+    """Перевод заказов в новый статус, коммит и пакетные уведомления.
+
+    Returns (moved, rejected) as crud.change_order_status does.
+    """
+    moved, rejected = await crud.change_order_status(s, order_ids, status)
+    await s.commit()
+    tracing.set_attribute('order.ids', ','.join(str(order_id) for order_id in order_ids))
+    # orders.trace_id links these to the checkout that created them
+    logger.info("order status changed", extra={
+        'order_ids': [order_id for order_id, _ in moved], 'status': status, 'rejected': list(rejected),
+    })
+    eta.estimator.on_transition([order_id for order_id, _ in moved], status)
+    if moved:
+        await notify_status(moved, status)
+    return moved, rejected
+
+
+async def process_webhook(s, order_id: int, status: str):
+    """Обработка изменения статуса одного заказа (вебхук оплаты, админка)"""
+    return await change_status(s, [order_id], status)
+
+
+async def notify_status(moved, status: str):
+    """Одно сообщение каждому клиенту и одна сводка админам на весь пакет"""
+    if not BOT_TOKEN:
+        return
+    status_text = order_status.title(status)
     try:
-        if not BOT_TOKEN:
-            return True
         bot = Bot(token=BOT_TOKEN)
-        
-        from .db import AsyncSessionLocal, Order
-        from sqlalchemy import select
-        
-        async with AsyncSessionLocal() as s:
-            res = await s.execute(select(Order).where(Order.id == order_id))
-            o = res.scalars().first()
-            
-            if o:
-                # Формируем сообщение о статусе
-                status_texts = {
-                    'new': '🆕 Новый',
-                    'preparing': '👨‍🍳 Готовится',
-                    'ready': '✅ Готов',
-                    'delivering': '🚗 Доставляется',
-                    'completed': '🎉 Завершён',
-                    'cancelled': '❌ Отменён',
-                    'paid': '💳 Оплачен'
-                }
-                status_text = status_texts.get(status, status)
-                text = f"📦 Статус заказа <b>#{o.id}</b> изменён:\n{status_text}"
-                
-                # Отправляем уведомление клиенту (если есть user_id)
-                if o.user_id:
-                    try:
-                        await bot.send_message(o.user_id, text, parse_mode='HTML')
-                    except Exception as e:
-                        print(f"Error sending notification to user {o.user_id}: {e}")
-                
-                # Отправляем уведомление админам
-                admin_ids_str = os.getenv('ADMIN_IDS', '')
-                if admin_ids_str:
-                    admin_ids = [int(id.strip()) for id in admin_ids_str.split(',') if id.strip()]
-                    for admin_id in admin_ids:
-                        try:
-                            await bot.send_message(admin_id, f"🔔 Admin: {text}", parse_mode='HTML')
-                        except Exception as e:
-                            print(f"Error sending notification to admin {admin_id}: {e}")
-        
-        # close bot session
+        bot.session.middleware(metrics.TelegramMetrics())
+        bot.session.middleware(tracing.TelegramTracing())
+    except Exception:
+        logger.exception("notify_status: could not create the bot")
+        metrics.errors.inc(where='notify_status')
+        return
+    limit = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+
+    async def send(chat_id, text):
+        async with limit:
+            try:
+                await bot.send_message(chat_id, text, parse_mode='HTML')
+            except Exception as e:
+                # counted in telegram_errors_total by TelegramMetrics
+                logger.warning("Error sending notification to %s: %s", chat_id, e)
+
+    try:
+        sends = [
+            send(user_id, f"📦 Статус заказа <b>#{order_id}</b> изменён:\n{status_text}")
+            for order_id, user_id in moved if user_id
+        ]
+        if len(moved) == 1:
+            summary = f"🔔 Admin: 📦 Статус заказа <b>#{moved[0][0]}</b> изменён:\n{status_text}"
+        else:
+            ids = ', '.join(f"#{order_id}" for order_id, _ in moved)
+            summary = f"🔔 Admin: {len(moved)} заказов → {status_text}\n{ids}"
+        sends += [send(admin_id, summary) for admin_id in admin_ids()]
+        await asyncio.gather(*sends)
+    finally:
         try:
             await bot.session.close()
         except Exception:
             pass
-    except Exception as e:
-        print(f"Error in process_webhook: {e}")
-        pass
-    
-    return True
@@ -1,3 +1,5 @@
+from dataclasses import dataclass
+from datetime import datetime
 from pydantic import BaseModel
 from typing import List, Optional
 
@@ -37,6 +39,7 @@ class ProductIn(BaseModel):
     description: Optional[str] = None
     price: float
     image: Optional[str] = None
+    image_url: Optional[str] = None  # admin panel spelling of image
     tags: Optional[str] = None
     rating: Optional[float] = None
 
@@ -61,6 +64,84 @@ class ProductOut(BaseModel):
     class Config:
         orm_mode = True
 
+class CategoryUpdate(BaseModel):
+    title: Optional[str] = None
+    sort_order: Optional[int] = None
+
+
+class ProductUpdate(BaseModel):
+    name: Optional[str] = None
+    category_id: Optional[int] = None
+    description: Optional[str] = None
+    price: Optional[float] = None
+    image: Optional[str] = None
+    image_url: Optional[str] = None
+    tags: Optional[str] = None
+    rating: Optional[float] = None
+
+
+class CartSync(BaseModel):
+    user_id: int = 0
+    items: List[AddCartItem] = []
+
+
+class OrderItemIn(BaseModel):
+    product_id: Optional[int] = None
+    name: str = ''
+    qty: int = 1
+    price: float = 0
+
+
+class OrderIn(BaseModel):
+    """Заказ из WebApp (POST /api/orders)"""
+    user_id: Optional[int] = None
+    username: Optional[str] = None
+    first_name: Optional[str] = 'Гость'
+    items: List[OrderItemIn] = []
+    total_price: float = 0
+    address: Optional[str] = ''
+    phone: Optional[str] = ''
+    comment: Optional[str] = ''
+    payment_method: str = 'cash'
+    delivery_type: str = 'delivery'
+    # координаты из подсказки адреса (DaData geo_lat/geo_lon), если есть
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+
+
+class OrderStatusIn(BaseModel):
+    status: Optional[str] = None
+
+
+class BulkOrderStatusIn(BaseModel):
+    order_ids: List[int]
+    status: str
+
+
+class PaymentWebhookIn(BaseModel):
+    order_id: Optional[int] = None
+    status: Optional[str] = None
+
+
+class AdminAuthIn(BaseModel):
+    auth_type: str = 'telegram'  # telegram или password
+    username: Optional[str] = None
+    password: Optional[str] = None
+    user_id: Optional[int] = None
+    first_name: Optional[str] = 'Админ'
+    last_name: Optional[str] = ''
+
+
+class AdminLoginIn(BaseModel):
+    username: Optional[str] = None
+    password: Optional[str] = None
+
+
+class ConfirmLoginIn(BaseModel):
+    action: Optional[str] = None  # 'confirm' или 'reject'
+    user_data: Optional[dict] = None
+
+
 class CreateOrder(BaseModel):
     tg_id: int
     items: List[dict]
@@ -69,3 +150,40 @@ class CreateOrder(BaseModel):
     phone: Optional[str]
     payment_method: str
     name: Optional[str]
+
+
+# Read-path rows: slotted dataclasses filled straight from column tuples
+# and serialized by orjson (no ORM identity map, no jsonable_encoder).
+
+@dataclass(slots=True)
+class CategoryRow:
+    id: int
+    title: str
+    sort_order: Optional[int]
+
+
+@dataclass(slots=True)
+class ProductRow:
+    id: int
+    name: str
+    description: Optional[str]
+    price: float
+    image: Optional[str]
+    tags: Optional[str]
+    rating: Optional[float]
+    category_id: Optional[int]
+
+
+@dataclass(slots=True)
+class OrderRow:
+    id: int
+    user_id: Optional[int]
+    items_json: Optional[str]
+    total_price: Optional[float]
+    address: Optional[str]
+    name: Optional[str]
+    phone: Optional[str]
+    payment_method: Optional[str]
+    delivery_type: Optional[str]
+    status: Optional[str]
+    created_at: Optional[datetime]
@@ -0,0 +1,191 @@
+"""In-memory product search: inverted index + trigram fuzzy matching.
+
+The index is built once on startup from the products table and then kept
+up to date by the admin product endpoints (add / remove per product), so
+a search request never touches the database.
+"""
+import heapq
+import re
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Set
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# field weights: a hit in the name matters more than one in the description
+FIELD_WEIGHTS = (('name', 3.0), ('tags', 2.0), ('description', 1.0))
+
+# product fields returned by the search endpoint (same shape as /api/products)
+PRODUCT_FIELDS = ('id', 'name', 'description', 'price', 'image', 'tags', 'rating', 'category_id')
+
+
+def normalize(text: Optional[str]) -> str:
+    """Case folding + ё→е, so 'Тёплый' and 'теплый' are the same word."""
+    if not text:
+        return ''
+    return text.casefold().replace('ё', 'е')
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _WORD_RE.findall(normalize(text))
+
+
+def trigrams(token: str) -> Set[str]:
+    padded = f'  {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ProductSearchIndex:
+    """Inverted index over Product.name, description and tags.
+
+    Lookup order for every query token: exact word, then word prefix (for
+    the as-you-type case), then trigram similarity for typos.  All query
+    tokens must match for a product to be returned.
+    """
+
+    def __init__(self, min_similarity: float = 0.35, max_fuzzy: int = 8):
+        self.min_similarity = min_similarity
+        self.max_fuzzy = max_fuzzy
+        # word -> {product_id: weight}
+        self._postings: Dict[str, Dict[int, float]] = {}
+        # trigram -> words containing it
+        self._trigrams: Dict[str, Set[str]] = {}
+        # sorted vocabulary for prefix lookups
+        self._vocab: List[str] = []
+        # product_id -> indexed words / serialized product
+        self._doc_words: Dict[int, Set[str]] = {}
+        self._docs: Dict[int, dict] = {}
+
+    def __len__(self):
+        return len(self._docs)
+
+    def build(self, products: Iterable):
+        self.clear()
+        for p in products:
+            self.add(p)
+
+    def clear(self):
+        self._postings.clear()
+        self._trigrams.clear()
+        self._vocab.clear()
+        self._doc_words.clear()
+        self._docs.clear()
+
+    def add(self, product):
+        """Index (or re-index) a single product (ORM object or dict)."""
+        doc = _as_dict(product)
+        pid = doc['id']
+        if pid in self._docs:
+            self.remove(pid)
+        weights: Dict[str, float] = {}
+        for field, weight in FIELD_WEIGHTS:
+            for word in tokenize(doc.get(field)):
+                if weight > weights.get(word, 0.0):
+                    weights[word] = weight
+        for word, weight in weights.items():
+            postings = self._postings.get(word)
+            if postings is None:
+                postings = self._postings[word] = {}
+                insort(self._vocab, word)
+                for tri in trigrams(word):
+                    self._trigrams.setdefault(tri, set()).add(word)
+            postings[pid] = weight
+        self._doc_words[pid] = set(weights)
+        self._docs[pid] = doc
+
+    def remove(self, product_id: int):
+        words = self._doc_words.pop(product_id, None)
+        self._docs.pop(product_id, None)
+        if not words:
+            return
+        for word in words:
+            postings = self._postings.get(word)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if postings:
+                continue
+            del self._postings[word]
+            i = bisect_left(self._vocab, word)
+            if i < len(self._vocab) and self._vocab[i] == word:
+                del self._vocab[i]
+            for tri in trigrams(word):
+                bucket = self._trigrams.get(tri)
+                if bucket is not None:
+                    bucket.discard(word)
+                    if not bucket:
+                        del self._trigrams[tri]
+
+    def get(self, product_id: int) -> Optional[dict]:
+        return self._docs.get(product_id)
+
+    def search(self, query: str, limit: int = 20) -> List[dict]:
+        words = tokenize(query)
+        if not words:
+            return []
+        scores: Optional[Dict[int, float]] = None
+        for word in words:
+            hits = self._match_word(word)
+            if not hits:
+                return []
+            if scores is None:
+                scores = hits
+            else:
+                if len(hits) < len(scores):
+                    scores, hits = hits, scores
+                scores = {pid: s + hits[pid] for pid, s in scores.items() if pid in hits}
+                if not scores:
+                    return []
+        ranked = heapq.nlargest(limit, scores, key=scores.__getitem__)
+        return [self._docs[pid] for pid in ranked]
+
+    def _match_word(self, word: str) -> Dict[int, float]:
+        # the returned dict is treated as read-only by search()
+        exact = self._postings.get(word)
+        if exact:
+            return exact
+
+        # prefix: "рол" -> "ролл", "роллы"
+        matches = []
+        i = bisect_left(self._vocab, word)
+        while i < len(self._vocab) and self._vocab[i].startswith(word):
+            matches.append((0.5 + 0.5 * len(word) / len(self._vocab[i]), self._vocab[i]))
+            i += 1
+        if matches:
+            return self._merge(matches)
+
+        # fuzzy: vocabulary words sharing enough trigrams with the query word
+        query_tris = trigrams(word)
+        shared: Dict[str, int] = {}
+        for tri in query_tris:
+            for candidate in self._trigrams.get(tri, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        similar = []
+        for candidate, common in shared.items():
+            sim = common / (len(query_tris) + len(candidate) + 1 - common)
+            if sim >= self.min_similarity:
+                similar.append((sim, candidate))
+        similar.sort(reverse=True)
+        return self._merge(similar[:self.max_fuzzy])
+
+    def _merge(self, matches) -> Dict[int, float]:
+        """Best score per product over (factor, word) vocabulary matches."""
+        if not matches:
+            return {}
+        factor, word = matches[0]
+        hits = {pid: weight * factor for pid, weight in self._postings[word].items()}
+        for factor, word in matches[1:]:
+            for pid, weight in self._postings[word].items():
+                score = weight * factor
+                if score > hits.get(pid, 0.0):
+                    hits[pid] = score
+        return hits
+
+
+def _as_dict(product) -> dict:
+    if isinstance(product, dict):
+        return product
+    return {f: getattr(product, f, None) for f in PRODUCT_FIELDS}
+
+
+# Process-wide index used by the API
+product_index = ProductSearchIndex()
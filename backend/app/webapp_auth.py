@@ -0,0 +1,50 @@
+"""Validation of Telegram WebApp initData (Telegram.WebApp.initData).
+
+The WebApp sends the raw initData string in the X-Telegram-Init-Data
+header. It is signed by Telegram with a key derived from the bot token,
+so a valid signature proves which Telegram user opened the WebApp:
+
+    secret = HMAC_SHA256(key='WebAppData', msg=bot_token)
+    hash   = hex(HMAC_SHA256(key=secret, msg=data_check_string))
+
+where data_check_string is every other field as 'key=value', sorted by
+key and joined with newlines.
+"""
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode
+
+# signed initData older than this is refused (a leaked string stops working)
+INIT_DATA_TTL = int(os.getenv('WEBAPP_INIT_DATA_TTL', '86400'))
+
+
+def _signature(fields: dict, bot_token: str) -> str:
+    data_check_string = '\n'.join(f'{k}={v}' for k, v in sorted(fields.items()))
+    secret = hmac.new(b'WebAppData', bot_token.encode(), hashlib.sha256).digest()
+    return hmac.new(secret, data_check_string.encode(), hashlib.sha256).hexdigest()
+
+
+def verify_init_data(init_data: Optional[str], bot_token: Optional[str], ttl: int = INIT_DATA_TTL) -> Optional[dict]:
+    """The `user` object of valid, fresh initData; None if it is missing, forged or expired."""
+    if not init_data or not bot_token:
+        return None
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    received = fields.pop('hash', '')
+    if not received or not hmac.compare_digest(_signature(fields, bot_token), received):
+        return None
+    try:
+        if ttl and time.time() - int(fields.get('auth_date', 0)) > ttl:
+            return None
+        user = json.loads(fields.get('user') or 'null')
+    except ValueError:
+        return None
+    return user if isinstance(user, dict) and isinstance(user.get('id'), int) else None
+
+
+def sign_init_data(fields: dict, bot_token: str) -> str:
+    """initData as Telegram would send it (for tests and local WebApp runs)."""
+    return urlencode({**fields, 'hash': _signature(fields, bot_token)})
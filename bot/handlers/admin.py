@@ -2,13 +2,18 @@ from aiogram import Router
 from aiogram.types import Message, WebAppInfo, CallbackQuery
 from aiogram.filters import Command
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+import logging
 import os
 import httpx
 
 import config
 from bot.services.db import AsyncSessionLocal, Product, Category
+from bot.services.catalog_cache import catalog_cache
+from shared import metrics
+from shared.repository import bump_catalog_version, set_product_tags
 
 router = Router()
+logger = logging.getLogger(__name__)
 
 ADMIN_IDS = [int(id.strip()) for id in os.getenv('ADMIN_IDS', '').split(',') if id.strip()]
 BASE_URL = os.getenv('BASE_URL', 'https://mandanator.ru')
@@ -72,8 +77,9 @@ async def callback_confirm_login(callback: CallbackQuery):
             await callback.answer("✅ Доступ разрешён")
         else:
             await callback.answer("❌ Ошибка подтверждения", show_alert=True)
-    except Exception as e:
-        print(f"Error confirming login: {e}")
+    except Exception:
+        logger.exception("Error confirming login")
+        metrics.errors.inc(where='confirm_login')
         await callback.answer("❌ Ошибка сервера", show_alert=True)
 
 
@@ -101,8 +107,9 @@ async def callback_reject_login(callback: CallbackQuery):
             await callback.answer("❌ Доступ запрещён")
         else:
             await callback.answer("❌ Ошибка", show_alert=True)
-    except Exception as e:
-        print(f"Error rejecting login: {e}")
+    except Exception:
+        logger.exception("Error rejecting login")
+        metrics.errors.inc(where='reject_login')
         await callback.answer("❌ Ошибка сервера", show_alert=True)
 
 
@@ -131,7 +138,11 @@ async def cmd_addproduct(message: Message):
             await s.flush()
         prod = Product(name=name, description=desc, price=price, category_id=cat.id, tags=tags)
         s.add(prod)
+        await s.flush()
+        await set_product_tags(s, prod.id, tags)
+        await bump_catalog_version(s)
         await s.commit()
+    catalog_cache.invalidate()
     await message.answer('Продукт добавлен')
 
 @router.message(Command('listproducts'))
@@ -2,8 +2,9 @@
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
-from sqlalchemy import select, delete
-from bot.services.db import AsyncSessionLocal, Cart, Product
+from sqlalchemy import delete
+from bot.services.db import AsyncSessionLocal, Cart
+from shared.repository import cart_lines
 
 router = Router()
 
@@ -11,31 +12,19 @@ router = Router()
 async def get_cart_items(user_id: int):
     """Получить товары из корзины пользователя"""
     async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(Cart).where(Cart.user_id == user_id)
-        )
-        cart_items = result.scalars().all()
-        
-        if not cart_items:
-            return [], 0.0
+        lines = await cart_lines(session, user_id)
         
         items_data = []
         total = 0.0
         
-        for cart_item in cart_items:
-            product_result = await session.execute(
-                select(Product).where(Product.id == cart_item.product_id)
-            )
-            product = product_result.scalar_one_or_none()
-            
-            if product:
-                item_total = product.price * cart_item.qty
-                items_data.append({
-                    'product': product,
-                    'qty': cart_item.qty,
-                    'total': item_total
-                })
-                total += item_total
+        for product, qty in lines:
+            item_total = product.price * qty
+            items_data.append({
+                'product': product,
+                'qty': qty,
+                'total': item_total
+            })
+            total += item_total
         
         return items_data, total
 
@@ -1,56 +1,46 @@
 """Обработчик меню (интеграция с WebApp)"""
 import json
+import logging
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
 from aiogram.fsm.context import FSMContext
 import os
-from sqlalchemy import delete
-from bot.services.db import AsyncSessionLocal, Cart
+from bot.services.db import AsyncSessionLocal
+from shared import metrics, tracing
+from shared.repository import replace_cart
 
 router = Router()
+logger = logging.getLogger(__name__)
 
 WEBAPP_URL = os.getenv('WEBHOOK_URL') or os.getenv('BASE_URL', 'https://mandanator.ru')
 @router.message(F.web_app_data)
 async def handle_webapp_data(message: Message, state: FSMContext):
     """Обработка данных от WebApp (checkout)"""
-    print(f"[DEBUG MENU] WebApp data received from user {message.from_user.id}")
+    user_id = message.from_user.id
     try:
         data = json.loads(message.web_app_data.data)
         action = data.get('action')
-        print(f"[DEBUG MENU] Action: {action}, Data: {data}")
+        logger.debug("webapp data received", extra={'user_id': user_id, 'action': action})
         
         if action == 'checkout':
             items = data.get('items', [])
             total = data.get('total', 0)
             
-            print(f"[DEBUG MENU] Items count: {len(items)}, Total: {total}")
+            logger.info("webapp checkout", extra={'user_id': user_id, 'items': len(items), 'total': total})
             
             if not items:
                 await message.answer("❌ Корзина пуста!")
                 return
             
             # Сохраняем данные в корзину БД
-            user_id = message.from_user.id
             async with AsyncSessionLocal() as session:
-                # Очищаем старую корзину
-                await session.execute(delete(Cart).where(Cart.user_id == user_id))
+                # Заменяем корзину новыми позициями (одна строка на товар)
+                await replace_cart(session, user_id, items)
                 await session.commit()
-                
-                # Добавляем новые позиции
-                for item in items:
-                    cart_item = Cart(
-                        user_id=user_id,
-                        product_id=item['product_id'],
-                        qty=item['qty']
-                    )
-                    session.add(cart_item)
-                await session.commit()
-            
-            print(f"[DEBUG MENU] Cart saved, sending button...")
             
-            # Сохраняем total в state для будущего использования
-            await state.update_data(checkout_total=total)
+            # Сохраняем total в state для будущего использования, trace_id — для заказа (orders.trace_id)
+            await state.update_data(checkout_total=total, trace_id=tracing.current_trace_id())
             
             # Переходим к оформлению заказа
             from bot.handlers.order import start_order
@@ -62,14 +52,12 @@ async def handle_webapp_data(message: Message, state: FSMContext):
                     [InlineKeyboardButton(text="✅ Оформить заказ", callback_data="start_order")]
                 ])
             )
-            print(f"[DEBUG MENU] Button sent successfully")
         else:
             await message.answer("Неизвестное действие от WebApp")
             
-    except Exception as e:
-        print(f"[ERROR MENU] Error handling webapp data: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Error handling webapp data", extra={'user_id': user_id})
+        metrics.errors.inc(where='handle_webapp_data')
         await message.answer("❌ Ошибка обработки данных. Попробуйте еще раз.")
 
 
@@ -1,15 +1,32 @@
 """Обработчик оформления заказов"""
+import json
+import logging
+import time
+from typing import Optional
 from aiogram import Router, F
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
-from sqlalchemy import select, delete
+from sqlalchemy import select
 from datetime import datetime
-from bot.services.db import AsyncSessionLocal, Cart, Product, Order
+from bot.services.db import AsyncSessionLocal, Cart, Order
+from bot.services.order_history import HistoryPage, history_cache
+from bot.services.profiles import PastOrder, Profile, profile_cache
+from shared import eta, order_status, tracing
+from shared.repository import cart_from_items, cart_lines, clear_cart, order_items, record_status_events, save_customer
+
+logger = logging.getLogger(__name__)
 
 router = Router()
 
+PAYMENT_TEXTS = {
+    'cash': '💵 Наличными курьеру',
+    'card': '💳 Картой курьеру',
+    'yukassa': '🌐 Онлайн (ЮКасса)'
+}
+
 
 class OrderStates(StatesGroup):
     """Состояния оформления заказа"""
@@ -19,60 +36,124 @@ class OrderStates(StatesGroup):
     confirming = State()
 
 
+def short(text: str, limit: int = 40) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+def last_checkout(profile: Profile) -> Optional[PastOrder]:
+    """Прошлый заказ для «Как в прошлый раз»: доставка с телефоном и известным способом оплаты"""
+    last = profile.last_delivery()
+    if last and profile.phone and last.payment_method in PAYMENT_TEXTS:
+        return last
+    return None
+
+
 @router.callback_query(F.data == "start_order")
 async def start_order(callback: CallbackQuery, state: FSMContext):
-    """Начать оформление заказа"""
-    print(f"[DEBUG] start_order triggered by user {callback.from_user.id}")
-    
+    """Начать оформление заказа: сохранённые адрес и телефон предлагаются кнопками"""
+    user_id = callback.from_user.id
+
     # Проверяем что корзина не пуста
     async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(Cart).where(Cart.user_id == callback.from_user.id)
-        )
-        cart_items = result.scalars().all()
-        
-        print(f"[DEBUG] Cart items count: {len(cart_items)}")
-        
-        if not cart_items:
-            await callback.answer("❌ Корзина пуста!", show_alert=True)
-            return
-    
-    print("[DEBUG] Sending address request...")
-    await callback.message.answer(
+        has_items = (await session.execute(select(Cart.id).where(Cart.user_id == user_id).limit(1))).first()
+    if not has_items:
+        await callback.answer("❌ Корзина пуста!", show_alert=True)
+        return
+
+    profile = await profile_cache.get(user_id)
+    # trace_id: трасса, с которой началось оформление (данные WebApp или эта кнопка), попадёт в orders.trace_id
+    trace_id = (await state.get_data()).get('trace_id') or tracing.current_trace_id()
+    # started_at: незавершённые оформления удаляет задача sweep_checkouts
+    await state.set_data({'name': profile.name or callback.from_user.full_name, 'started_at': time.time(),
+                          'trace_id': trace_id})
+
+    buttons = []
+    if last_checkout(profile):
+        buttons.append([InlineKeyboardButton(text="⚡ Как в прошлый раз", callback_data="checkout_last")])
+    for idx, address in enumerate(profile.addresses):
+        buttons.append([InlineKeyboardButton(text=f"📍 {short(address)}", callback_data=f"address_{idx}")])
+
+    text = (
         "📍 <b>Адрес доставки</b>\n\n"
         "Укажите полный адрес доставки:\n"
         "• Улица, дом, квартира\n"
         "• Подъезд, этаж, домофон"
     )
+    if buttons:
+        text += "\n\nИли выберите сохранённый:"
+    await callback.message.answer(text, reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons) if buttons else None)
     await state.set_state(OrderStates.entering_address)
     await callback.answer()
-    print("[DEBUG] start_order completed")
+
+
+@router.callback_query(StateFilter(OrderStates.entering_address), F.data == "checkout_last")
+async def checkout_last(callback: CallbackQuery, state: FSMContext):
+    """Адрес, телефон и оплата из прошлого заказа — сразу к подтверждению"""
+    profile = await profile_cache.get(callback.from_user.id)
+    last = last_checkout(profile)
+    if last is None:
+        await callback.answer("Прошлый заказ не найден, введите адрес текстом", show_alert=True)
+        return
+    await state.update_data(address=last.address, phone=profile.phone, payment_method=last.payment_method)
+    await show_confirmation(callback, state)
+
+
+@router.callback_query(StateFilter(OrderStates.entering_address), F.data.startswith("address_"))
+async def pick_address(callback: CallbackQuery, state: FSMContext):
+    """Выбор сохранённого адреса"""
+    profile = await profile_cache.get(callback.from_user.id)
+    idx = int(callback.data.replace("address_", ""))
+    if idx >= len(profile.addresses):
+        await callback.answer("Адрес не найден, введите его текстом", show_alert=True)
+        return
+    await state.update_data(address=profile.addresses[idx])
+    await callback.answer()
+    await ask_phone(callback.message, callback.from_user.id, state)
 
 
 @router.message(StateFilter(OrderStates.entering_address))
 async def enter_address(message: Message, state: FSMContext):
     """Ввод адреса доставки"""
     await state.update_data(address=message.text)
-    
+    await ask_phone(message, message.from_user.id, state)
+
+
+async def ask_phone(message: Message, user_id: int, state: FSMContext):
+    profile = await profile_cache.get(user_id)
+    kb = None
+    if profile.phone:
+        kb = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=f"📱 {profile.phone}", callback_data="phone_saved")]
+        ])
     await message.answer(
         "📱 <b>Контактный телефон</b>\n\n"
         "Укажите номер телефона для связи:\n"
-        "Формат: +7 (XXX) XXX-XX-XX"
+        "Формат: +7 (XXX) XXX-XX-XX",
+        reply_markup=kb
     )
     await state.set_state(OrderStates.entering_phone)
 
 
+@router.callback_query(StateFilter(OrderStates.entering_phone), F.data == "phone_saved")
+async def pick_phone(callback: CallbackQuery, state: FSMContext):
+    """Телефон из профиля"""
+    profile = await profile_cache.get(callback.from_user.id)
+    await state.update_data(phone=profile.phone)
+    await callback.answer()
+    await ask_payment(callback.message, state)
+
+
 @router.message(StateFilter(OrderStates.entering_phone))
 async def enter_phone(message: Message, state: FSMContext):
     """Ввод телефона"""
     await state.update_data(phone=message.text)
-    
+    await ask_payment(message, state)
+
+
+async def ask_payment(message: Message, state: FSMContext):
     kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="💵 Наличными курьеру", callback_data="payment_cash")],
-        [InlineKeyboardButton(text="💳 Картой курьеру", callback_data="payment_card")],
-        [InlineKeyboardButton(text="🌐 Онлайн (ЮКасса)", callback_data="payment_yukassa")],
-        [InlineKeyboardButton(text="🔙 Назад", callback_data="cancel_order")]
-    ])
+        [InlineKeyboardButton(text=text, callback_data=f"payment_{key}")] for key, text in PAYMENT_TEXTS.items()
+    ] + [[InlineKeyboardButton(text="🔙 Назад", callback_data="cancel_order")]])
     
     await message.answer(
         "💰 <b>Способ оплаты</b>\n\n"
@@ -85,42 +166,26 @@ async def enter_phone(message: Message, state: FSMContext):
 @router.callback_query(StateFilter(OrderStates.choosing_payment), F.data.startswith("payment_"))
 async def choose_payment(callback: CallbackQuery, state: FSMContext):
     """Выбор способа оплаты"""
-    payment_type = callback.data.replace("payment_", "")
-    await state.update_data(payment_method=payment_type)
-    
-    # Получаем данные заказа
+    await state.update_data(payment_method=callback.data.replace("payment_", ""))
+    await show_confirmation(callback, state)
+
+
+async def show_confirmation(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    
-    # Получаем товары из корзины
+
+    # Товары из корзины одним запросом
     async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(Cart).where(Cart.user_id == callback.from_user.id)
-        )
-        cart_items = result.scalars().all()
-        
-        items_text = ""
-        total = 0.0
-        
-        for cart_item in cart_items:
-            product_result = await session.execute(
-                select(Product).where(Product.id == cart_item.product_id)
-            )
-            product = product_result.scalar_one_or_none()
-            
-            if product:
-                item_total = product.price * cart_item.qty
-                items_text += f"• {product.name} × {cart_item.qty} = {item_total} ₽\n"
-                total += item_total
+        lines = await cart_lines(session, callback.from_user.id)
+
+    items_text = ""
+    total = 0.0
+    for product, qty in lines:
+        item_total = product.price * qty
+        items_text += f"• {product.name} × {qty} = {item_total} ₽\n"
+        total += item_total
     
     await state.update_data(total=total)
-    
-    # Формируем текст подтверждения
-    payment_texts = {
-        'cash': '💵 Наличными курьеру',
-        'card': '💳 Картой курьеру',
-        'yukassa': '🌐 Онлайн (ЮКасса)'
-    }
-    payment_text = payment_texts.get(payment_type, payment_type)
+    payment_text = PAYMENT_TEXTS.get(data['payment_method'], data['payment_method'])
     
     confirmation_text = (
         "✅ <b>Подтверждение заказа</b>\n\n"
@@ -150,20 +215,20 @@ async def confirm_order(callback: CallbackQuery, state: FSMContext):
     
     async with AsyncSessionLocal() as session:
         # Формируем JSON позиций заказа
-        items_json_list = []
-        result = await session.execute(select(Cart).where(Cart.user_id == user_id))
-        cart_items = result.scalars().all()
-        for cart_item in cart_items:
-            product_result = await session.execute(select(Product).where(Product.id == cart_item.product_id))
-            product = product_result.scalar_one_or_none()
-            if product:
-                items_json_list.append({
-                    "product_id": product.id,
-                    "name": product.name,
-                    "qty": cart_item.qty,
-                    "price": product.price,
-                    "total": product.price * cart_item.qty
-                })
+        items_json_list = [
+            {
+                "product_id": product.id,
+                "name": product.name,
+                "qty": qty,
+                "price": product.price,
+                "total": product.price * qty
+            }
+            for product, qty in await cart_lines(session, user_id)
+        ]
+
+        # ETA по текущей очереди на кухне, до того как заказ в неё встанет
+        await eta.estimator.refresh(session)
+        eta_text = eta.estimator.estimate_text()
 
         # Создаем заказ
         new_order = Order(
@@ -171,21 +236,30 @@ async def confirm_order(callback: CallbackQuery, state: FSMContext):
             items_json=json.dumps(items_json_list, ensure_ascii=False),
             total_price=data['total'],
             address=data['address'],
+            name=data['name'],
             phone=data['phone'],
             payment_method=data['payment_method'],
             status='new',
-            created_at=datetime.now()
+            created_at=datetime.utcnow(),
+            trace_id=data.get('trace_id') or tracing.current_trace_id()
         )
         session.add(new_order)
         await session.flush()
+        await record_status_events(session, [new_order.id], order_status.NEW)
+        # Профиль: последний телефон и адрес для следующего заказа
+        await save_customer(session, user_id, data['name'], data['phone'], data['address'])
 
         # Очищаем корзину
-        await session.execute(
-            delete(Cart).where(Cart.user_id == user_id)
-        )
+        await clear_cart(session, user_id)
         
         await session.commit()
         order_number = new_order.id
+        eta.estimator.on_created(order_number)
+    tracing.set_attribute('order.id', order_number)
+    logger.info("order created", extra={'order_id': order_number, 'user_id': user_id,
+                                        'checkout_trace_id': new_order.trace_id})
+    profile_cache.invalidate(user_id)
+    history_cache.invalidate(user_id)
     
     await callback.message.edit_text(
         f"🎉 <b>Заказ #{order_number} успешно оформлен!</b>\n\n"
@@ -193,7 +267,8 @@ async def confirm_order(callback: CallbackQuery, state: FSMContext):
         f"Сумма заказа: {data['total']} ₽\n"
         f"Адрес: {data['address']}\n"
         f"Имя: {data['name']}\n"
-        f"Телефон: {data['phone']}",
+        f"Телефон: {data['phone']}\n\n"
+        f"⏱ Ожидаемое время доставки: <b>{eta_text}</b>",
         reply_markup=InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="🔙 Главное меню", callback_data="main_menu")]
         ])
@@ -214,56 +289,118 @@ async def cancel_order(callback: CallbackQuery, state: FSMContext):
     await show_cart_handler(callback.from_user.id, callback.message, edit=True)
 
 
+def render_history(page: HistoryPage):
+    """Текст и клавиатура страницы истории заказов"""
+    if not page.orders:
+        text = (
+            "📋 <b>История заказов пуста</b>\n\n"
+            "Вы еще не оформляли заказы."
+        )
+        return text, InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="🍕 Открыть меню", callback_data="main_menu")]
+        ])
+
+    text = "📋 <b>Ваши заказы:</b>\n\n"
+    for order in page.orders:
+        date = order.created_at.strftime("%d.%m.%Y %H:%M") if order.created_at else "—"
+        text += f"📦 <b>Заказ #{order.id}</b>\n"
+        text += f"   Дата: {date}\n"
+        text += f"   Сумма: {order.total_price} ₽\n"
+        text += f"   Статус: {order_status.title(order.status)}\n\n"
+
+    nav = []
+    if page.newer_than is not None:
+        nav.append(InlineKeyboardButton(text="⬅️ Новее", callback_data=f"orders_gt_{page.newer_than}"))
+    if page.older_than is not None:
+        nav.append(InlineKeyboardButton(text="Старше ➡️", callback_data=f"orders_lt_{page.older_than}"))
+    buttons = [nav] if nav else []
+    buttons.append([InlineKeyboardButton(text="🔙 Главное меню", callback_data="main_menu")])
+    return text, InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
 @router.message(Command("orders"))
 async def cmd_orders(message: Message):
     """Показать историю заказов"""
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(Order)
-            .where(Order.user_id == message.from_user.id)
-            .order_by(Order.created_at.desc())
-            .limit(10)
-        )
-        orders = result.scalars().all()
-        
-        if not orders:
-            await message.answer(
-                "📋 <b>История заказов пуста</b>\n\n"
-                "Вы еще не оформляли заказы.",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="🍕 Открыть меню", callback_data="main_menu")]
-                ])
-            )
-            return
-        
-        text = "📋 <b>Ваши заказы:</b>\n\n"
-        
-        status_emoji = {
-            'new': '🆕',
-            'processing': '⏳',
-            'delivering': '🚚',
-            'completed': '✅',
-            'cancelled': '❌'
-        }
-        
-        for order in orders:
-            emoji = status_emoji.get(order.status, '📦')
-            date = order.created_at.strftime("%d.%m.%Y %H:%M")
-            text += f"{emoji} <b>Заказ #{order.id}</b>\n"
-            text += f"   Дата: {date}\n"
-            text += f"   Сумма: {order.total} ₽\n"
-            text += f"   Статус: {order.status}\n\n"
-        
-        await message.answer(
-            text,
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔙 Главное меню", callback_data="main_menu")]
-            ])
-        )
+    text, kb = render_history(await history_cache.page(message.from_user.id))
+    await message.answer(text, reply_markup=kb)
 
 
 @router.callback_query(F.data == "my_orders")
 async def callback_orders(callback: CallbackQuery):
-    """Показать заказы через callback"""
-    await cmd_orders(callback.message)
+    """Показать заказы через callback, в том же сообщении"""
+    await show_history_page(callback)
+
+
+@router.callback_query(F.data.startswith("orders_"))
+async def page_orders(callback: CallbackQuery):
+    """Листание истории: orders_lt_<id> — старше, orders_gt_<id> — новее"""
+    _, direction, order_id = callback.data.split("_")
+    if direction == "lt":
+        await show_history_page(callback, before=int(order_id))
+    else:
+        await show_history_page(callback, after=int(order_id))
+
+
+async def show_history_page(callback: CallbackQuery, before: int = None, after: int = None):
+    page = await history_cache.page(callback.from_user.id, before=before, after=after)
+    text, kb = render_history(page)
+    try:
+        await callback.message.edit_text(text, reply_markup=kb)
+    except TelegramBadRequest as e:
+        # «not modified» — двойной тап по той же кнопке; иначе сообщение не текстовое (фото меню)
+        if 'message is not modified' not in str(e):
+            await callback.message.answer(text, reply_markup=kb)
+    await callback.answer()
+
+
+async def show_repeat_menu(message: Message, user_id: int):
+    profile = await profile_cache.get(user_id)
+    if not profile.orders:
+        await message.answer("📋 Вы еще не оформляли заказы.")
+        return
+    buttons = [
+        [InlineKeyboardButton(
+            text=f"🔁 #{o.id} · {o.created_at.strftime('%d.%m') if o.created_at else ''} · {o.total_price} ₽",
+            callback_data=f"repeat_{o.id}"
+        )]
+        for o in profile.orders
+    ]
+    await message.answer(
+        "🔁 <b>Повторить заказ</b>\n\nТовары выбранного заказа заменят текущую корзину:",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons)
+    )
+
+
+@router.message(Command("repeat"))
+async def cmd_repeat(message: Message):
+    """Повторить один из последних заказов"""
+    await show_repeat_menu(message, message.from_user.id)
+
+
+@router.callback_query(F.data == "repeat")
+async def callback_repeat(callback: CallbackQuery):
+    await show_repeat_menu(callback.message, callback.from_user.id)
     await callback.answer()
+
+
+@router.callback_query(F.data.startswith("repeat_"))
+async def repeat_order(callback: CallbackQuery):
+    """Собрать корзину из товаров прошлого заказа"""
+    user_id = callback.from_user.id
+    order_id = int(callback.data.replace("repeat_", ""))
+    past = (await profile_cache.get(user_id)).order(order_id)
+
+    async with AsyncSessionLocal() as session:
+        items = past.items if past is not None else await order_items(session, user_id, order_id)
+        if items is None:
+            await callback.answer("❌ Заказ не найден", show_alert=True)
+            return
+        added = await cart_from_items(session, user_id, items)
+        await session.commit()
+
+    if not added:
+        await callback.answer("❌ Этих товаров больше нет в меню", show_alert=True)
+        return
+    await callback.answer("🛒 Товары добавлены в корзину")
+    from bot.handlers.cart import show_cart_handler
+    await show_cart_handler(user_id, callback.message, edit=True)
@@ -4,6 +4,9 @@ from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
 import os
 
+from bot.services.db import AsyncSessionLocal
+from shared import eta
+
 router = Router()
 
 # URL веб-приложения
@@ -15,6 +18,7 @@ def get_main_menu_kb() -> InlineKeyboardMarkup:
     buttons = [
         [InlineKeyboardButton(text="🍕 Открыть меню", web_app=WebAppInfo(url=f"{WEBAPP_URL}/webapp/"))],
         [InlineKeyboardButton(text="📋 Мои заказы", callback_data="my_orders")],
+        [InlineKeyboardButton(text="🔁 Повторить заказ", callback_data="repeat")],
         [InlineKeyboardButton(text="ℹ️ О ресторане", callback_data="about")],
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -44,39 +48,34 @@ async def show_main_menu(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "about")
-async def show_about(callback: CallbackQuery):
-    """Информация о ресторане"""
-    about_text = (
+async def about_text() -> str:
+    """Текст «О ресторане» с временем доставки по текущей загрузке кухни"""
+    async with AsyncSessionLocal() as session:
+        await eta.estimator.refresh(session)
+    return (
         "ℹ️ <b>О ресторане Jafood</b>\n\n"
         "🍕 Мы готовим с душой!\n\n"
         "📍 <b>Адрес:</b> г. Москва, ул. Примерная, д. 1\n"
         "⏰ <b>Режим работы:</b> 10:00 - 23:00\n"
         "📞 <b>Телефон:</b> +7 (999) 123-45-67\n\n"
-        "🚚 <b>Доставка:</b> 30-60 минут\n"
+        f"🚚 <b>Доставка сейчас:</b> {eta.estimator.estimate_text()}\n"
         "💰 <b>Минимальный заказ:</b> 500 ₽\n"
         "🎁 <b>Акции:</b> При заказе от 1500 ₽ — бесплатная доставка!"
     )
-    
+
+
+@router.callback_query(F.data == "about")
+async def show_about(callback: CallbackQuery):
+    """Информация о ресторане"""
     back_kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🔙 Назад", callback_data="main_menu")]
     ])
     
-    await callback.message.edit_text(about_text, reply_markup=back_kb)
+    await callback.message.edit_text(await about_text(), reply_markup=back_kb)
     await callback.answer()
 
 
 @router.message(Command("about"))
 async def cmd_about(message: Message):
     """Команда /about"""
-    about_text = (
-        "ℹ️ <b>О ресторане Jafood</b>\n\n"
-        "🍕 Мы готовим с душой!\n\n"
-        "📍 <b>Адрес:</b> г. Москва, ул. Примерная, д. 1\n"
-        "⏰ <b>Режим работы:</b> 10:00 - 23:00\n"
-        "📞 <b>Телефон:</b> +7 (999) 123-45-67\n\n"
-        "🚚 <b>Доставка:</b> 30-60 минут\n"
-        "💰 <b>Минимальный заказ:</b> 500 ₽\n"
-        "🎁 <b>Акции:</b> При заказе от 1500 ₽ — бесплатная доставка!"
-    )
-    await message.answer(about_text, reply_markup=get_main_menu_kb())
+    await message.answer(await about_text(), reply_markup=get_main_menu_kb())
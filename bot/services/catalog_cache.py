@@ -0,0 +1,156 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy import select
+
+from bot.services.db import Category, Product, create_sample_data
+from shared.db import read_session
+from shared.repository import CATALOG_POLL_INTERVAL, get_catalog_version
+
+Screen = Tuple[str, InlineKeyboardMarkup]
+
+
+def render_menu(categories: List[Category]) -> Screen:
+    text = "<b>Меню</b>\nВыберите категорию сверху"
+    kb = InlineKeyboardBuilder()
+    # categories as top row buttons
+    for c in categories:
+        kb.add(InlineKeyboardButton(text=c.title, callback_data=f"menu:cat:{c.id}"))
+    kb.adjust(3)
+    kb.row(InlineKeyboardButton(text="Корзина", callback_data="menu:cart"))
+    return text, kb.as_markup()
+
+
+def render_category(category: Category, products: List[Product]) -> Screen:
+    # product grid as text + keyboard with product buttons in 2 columns
+    lines = [f"<b>{category.title}</b>\nВыберите товар:"]
+    for p in products:
+        lines.append(f"{p.name} — {p.price}₽")
+    text = "\n".join(lines)
+
+    kb = InlineKeyboardBuilder()
+    for p in products:
+        kb.add(InlineKeyboardButton(text=f"{p.name} — {int(p.price)}₽", callback_data=f"menu:view:{p.id}"))
+    kb.adjust(2)
+    # navigation
+    kb.row(
+        InlineKeyboardButton(text="Назад к категориям", callback_data="menu:back"),
+        InlineKeyboardButton(text="Корзина", callback_data="menu:cart"),
+    )
+    return text, kb.as_markup()
+
+
+def render_product(product: Product, qty: int = 0) -> Screen:
+    text = f"<b>{product.name}</b>\n{product.description}\nЦена: {product.price}₽\nРейтинг: {product.rating}\n{product.tags}"
+    if qty:
+        text += f"\n\nВ корзине: {qty} шт. — {product.price * qty}₽"
+    kb = InlineKeyboardBuilder()
+    kb.row(
+        InlineKeyboardButton(text="+", callback_data=f"menu:plus:{product.id}"),
+        InlineKeyboardButton(text=f"В корзине: {qty}" if qty else "Добавить", callback_data=f"menu:add:{product.id}"),
+        InlineKeyboardButton(text="-", callback_data=f"menu:minus:{product.id}"),
+    )
+    kb.row(InlineKeyboardButton(text="В корзину", callback_data=f"menu:to_cart:{product.id}"))
+    kb.row(InlineKeyboardButton(text="Назад к категории", callback_data="menu:back"))
+    return text, kb.as_markup()
+
+
+class CatalogCache:
+    """Catalog snapshot plus pre-rendered menu screens for the bot.
+
+    Screens (text + inline keyboard) are rendered once per catalog version
+    and reused for every chat, so a navigation tap needs no DB query and
+    no keyboard building.  Every poll_interval seconds the shared
+    catalog_version row is checked and the snapshot is re-read only when
+    it changed (edits from the backend) or after invalidate().
+    """
+
+    def __init__(self, poll_interval: float = CATALOG_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.version = 0
+        self._db_version = None
+        self._checked_at = 0.0
+        self._written_at = None
+        self._categories: List[Category] = []
+        self._category_by_id: Dict[int, Category] = {}
+        self._products: Dict[int, Product] = {}
+        self._by_category: Dict[int, List[Product]] = {}
+        self._screens: Dict[tuple, Screen] = {}
+
+    # product cards are cached per quantity up to this value
+    MAX_CACHED_QTY = 20
+
+    def invalidate(self):
+        self._db_version = None
+        self._checked_at = 0.0
+        # the re-read must see our own write (replica only once it has caught up)
+        self._written_at = time.time()
+
+    async def _fresh(self):
+        if self.version and time.monotonic() - self._checked_at < self.poll_interval:
+            return
+        # version and products from one snapshot: a lagging replica gives an old but consistent catalog
+        async with read_session(self._written_at) as s:
+            db_version = await get_catalog_version(s)
+            if db_version == self._db_version:
+                self._checked_at = time.monotonic()
+                return
+            categories = (await s.execute(select(Category).order_by(Category.id))).scalars().all()
+            if not categories:
+                await create_sample_data()
+                categories = (await s.execute(select(Category).order_by(Category.id))).scalars().all()
+            products = (await s.execute(select(Product).order_by(Product.id))).scalars().all()
+        self._categories = list(categories)
+        self._category_by_id = {c.id: c for c in categories}
+        self._products = {p.id: p for p in products}
+        self._by_category = {}
+        for p in products:
+            self._by_category.setdefault(p.category_id, []).append(p)
+        self._screens = {}
+        self._db_version = db_version
+        self._checked_at = time.monotonic()
+        self.version += 1
+
+    async def categories(self) -> List[Category]:
+        await self._fresh()
+        return self._categories
+
+    async def product(self, product_id: int) -> Optional[Product]:
+        await self._fresh()
+        return self._products.get(product_id)
+
+    async def menu_screen(self) -> Screen:
+        await self._fresh()
+        screen = self._screens.get(('menu',))
+        if screen is None:
+            screen = self._screens[('menu',)] = render_menu(self._categories)
+        return screen
+
+    async def category_screen(self, category_id: int) -> Optional[Screen]:
+        await self._fresh()
+        key = ('cat', category_id)
+        screen = self._screens.get(key)
+        if screen is None:
+            category = self._category_by_id.get(category_id)
+            if category is None:
+                return None
+            screen = self._screens[key] = render_category(category, self._by_category.get(category_id, []))
+        return screen
+
+    async def product_screen(self, product_id: int, qty: int = 0) -> Optional[Screen]:
+        await self._fresh()
+        key = ('product', product_id, qty)
+        screen = self._screens.get(key)
+        if screen is None:
+            product = self._products.get(product_id)
+            if product is None:
+                return None
+            screen = render_product(product, qty)
+            if qty <= self.MAX_CACHED_QTY:
+                self._screens[key] = screen
+        return screen
+
+
+catalog_cache = CatalogCache()
@@ -0,0 +1,96 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup
+
+from bot.services.menu_state import MenuState
+
+logger = logging.getLogger(__name__)
+
+# edits of one chat closer together than this are merged into one
+EDIT_DEBOUNCE = float(os.getenv('BOT_EDIT_DEBOUNCE', '0.4'))
+
+
+def screen_digest(text: str, markup: Optional[InlineKeyboardMarkup] = None, media: str = '') -> str:
+    raw = '\x00'.join((text, markup.model_dump_json() if markup is not None else '', media or ''))
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class EditRenderer:
+    """Sends menu edits only when they change something.
+
+    - an edit whose digest equals what the message already shows is
+      dropped (no "message is not modified" round trip);
+    - while a chat is inside the debounce window, newer edits replace the
+      pending one and only the last is sent when the window ends, so a
+      burst of +/- taps becomes a single edit.
+    """
+
+    def __init__(self, window: float = EDIT_DEBOUNCE):
+        self.window = window
+        self.stats = {'requested': 0, 'sent': 0, 'skipped_same': 0, 'coalesced': 0, 'not_modified': 0}
+        # chat_id -> [digest, action] of the edit waiting for its window
+        self._pending: Dict[int, list] = {}
+
+    @property
+    def avoided(self) -> int:
+        s = self.stats
+        return s['skipped_same'] + s['coalesced'] + s['not_modified']
+
+    async def edit(self, chat_id: int, state: MenuState, digest: str, action: Callable[[], Awaitable[None]]):
+        self.stats['requested'] += 1
+        pending = self._pending.get(chat_id)
+        if pending is not None:
+            pending[0], pending[1] = digest, action
+            self.stats['coalesced'] += 1
+            return
+        if digest == state.digest:
+            self.stats['skipped_same'] += 1
+            return
+        wait = state.edited_at + self.window - time.monotonic()
+        if wait <= 0:
+            await self._send(state, digest, action)
+            return
+        self._pending[chat_id] = [digest, action]
+        asyncio.get_running_loop().create_task(self._deferred(chat_id, state, wait))
+
+    async def _deferred(self, chat_id: int, state: MenuState, wait: float):
+        await asyncio.sleep(wait)
+        pending = self._pending.pop(chat_id, None)
+        if pending is None:
+            # flush() sent it already
+            return
+        digest, action = pending
+        if digest == state.digest:
+            self.stats['skipped_same'] += 1
+            return
+        try:
+            await self._send(state, digest, action)
+        except Exception:
+            logger.exception('deferred menu edit failed for chat %s', chat_id)
+
+    async def _send(self, state: MenuState, digest: str, action: Callable[[], Awaitable[None]]):
+        state.edited_at = time.monotonic()
+        try:
+            await action()
+        except TelegramBadRequest as e:
+            if 'message is not modified' not in str(e):
+                raise
+            self.stats['not_modified'] += 1
+        else:
+            self.stats['sent'] += 1
+        state.digest = digest
+
+    async def flush(self):
+        """Send pending edits now (shutdown)."""
+        for chat_id in list(self._pending):
+            digest, action = self._pending.pop(chat_id)
+            try:
+                await action()
+            except Exception:
+                logger.exception('pending menu edit failed for chat %s', chat_id)
@@ -0,0 +1,59 @@
+"""Maintenance jobs of the bot process (scheduler in shared.jobs)."""
+import os
+import time
+from typing import Dict
+
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from bot.services.menu_ui import menu_ui
+from shared.jobs import Scheduler, add_shared_jobs, parse_interval
+
+# a checkout left unfinished this long is dropped (the cart itself stays)
+CHECKOUT_TTL = parse_interval(os.getenv('CHECKOUT_TTL', '2h'))
+
+# records whose data has no started_at -> when a sweep first saw them (kept out of the handlers' data)
+_first_seen: Dict[StorageKey, float] = {}
+
+
+def sweep_fsm(storage: BaseStorage, ttl: float = CHECKOUT_TTL, first_seen: Dict[StorageKey, float] = None) -> int:
+    """Drop abandoned checkouts and the empty records MemoryStorage creates on every lookup.
+
+    Data written without started_at (e.g. the WebApp handler) expires ttl
+    after the first sweep that saw it; that time is kept in first_seen,
+    not in the record, so handlers never find keys they did not write.
+    """
+    if not isinstance(storage, MemoryStorage):
+        # Redis and other storages expire keys themselves
+        return 0
+    first_seen = _first_seen if first_seen is None else first_seen
+    now = time.time()
+    stale = []
+    unstamped = set()
+    for key, record in storage.storage.items():
+        if record.state is None and not record.data:
+            stale.append(key)
+        elif 'started_at' in record.data:
+            if now - record.data['started_at'] > ttl:
+                stale.append(key)
+        else:
+            unstamped.add(key)
+            if now - first_seen.setdefault(key, now) > ttl:
+                stale.append(key)
+    for key in stale:
+        del storage.storage[key]
+    # forget records that were removed or got their own started_at meanwhile
+    for key in first_seen.keys() - (unstamped - set(stale)):
+        del first_seen[key]
+    return len(stale)
+
+
+def setup_jobs(scheduler: Scheduler, storage: BaseStorage) -> Scheduler:
+    add_shared_jobs(scheduler)
+    scheduler.add('purge_menu_sessions', menu_ui.purge_expired, '6h', leader=True, first_delay=120)
+
+    async def sweep_checkouts():
+        return sweep_fsm(storage)
+
+    scheduler.add('sweep_checkouts', sweep_checkouts, '10m')
+    return scheduler
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import select, delete
+
+from bot.services.db import AsyncSessionLocal, MenuSession
+
+logger = logging.getLogger(__name__)
+
+MAX_CHATS = int(os.getenv('MENU_STATE_MAX', '50000'))
+TTL = int(os.getenv('MENU_STATE_TTL', str(7 * 86400)))
+PERSIST = os.getenv('MENU_STATE_PERSIST', '1') == '1'
+FLUSH_INTERVAL = float(os.getenv('MENU_STATE_FLUSH_INTERVAL', '5'))
+
+
+class MenuState:
+    """Menu message of one chat: which message to edit and what it shows."""
+    __slots__ = ('message_id', 'state', 'category', 'product', 'touched', 'digest', 'edited_at')
+
+    def __init__(self, message_id: int, state: str, category: Optional[int] = None,
+                 product: Optional[int] = None, touched: float = 0.0):
+        self.message_id = message_id
+        self.state = state
+        self.category = category
+        self.product = product
+        self.touched = touched or time.time()
+        # digest of the rendered content and monotonic time of the last edit
+        # (memory only, see EditRenderer)
+        self.digest: Optional[str] = None
+        self.edited_at = 0.0
+
+
+class MenuStateStore:
+    """chat_id -> MenuState, bounded by size (LRU) and age (TTL).
+
+    With persistence on, changes are collected and written to the
+    menu_sessions table in batches (write-behind), and a chat that is not
+    in memory (evicted, or after a restart) is looked up there, so old
+    menu messages keep being edited in place across deploys.
+    """
+
+    def __init__(self, max_chats: int = MAX_CHATS, ttl: float = TTL, persist: bool = PERSIST,
+                 flush_interval: float = FLUSH_INTERVAL):
+        self.max_chats = max_chats
+        self.ttl = ttl
+        self.persist = persist
+        self.flush_interval = flush_interval
+        self._items: "OrderedDict[int, MenuState]" = OrderedDict()
+        self._dirty: Dict[int, MenuState] = {}
+        self._flusher: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._items)
+
+    async def get(self, chat_id: int) -> Optional[MenuState]:
+        item = self._items.get(chat_id)
+        if item is not None:
+            if time.time() - item.touched > self.ttl:
+                del self._items[chat_id]
+                return None
+            self._items.move_to_end(chat_id)
+            return item
+        item = self._dirty.get(chat_id)
+        if item is None and self.persist:
+            item = await self._load(chat_id)
+        if item is None or time.time() - item.touched > self.ttl:
+            return None
+        self._remember(chat_id, item)
+        return item
+
+    def set(self, chat_id: int, message_id: int, state: str, category: Optional[int] = None,
+            product: Optional[int] = None) -> MenuState:
+        item = self._items.get(chat_id)
+        if item is None or item.message_id != message_id:
+            item = MenuState(message_id, state, category, product)
+        else:
+            # same message: update in place, keeping its render digest
+            item.state, item.category, item.product = state, category, product
+            item.touched = time.time()
+        self._remember(chat_id, item)
+        if self.persist:
+            self._dirty[chat_id] = item
+            self._ensure_flusher()
+        return item
+
+    def _remember(self, chat_id: int, item: MenuState):
+        self._items[chat_id] = item
+        self._items.move_to_end(chat_id)
+        while len(self._items) > self.max_chats:
+            # evicted entries that are still dirty stay in _dirty until flushed
+            self._items.popitem(last=False)
+
+    async def _load(self, chat_id: int) -> Optional[MenuState]:
+        async with AsyncSessionLocal() as s:
+            row = (await s.execute(select(MenuSession).where(MenuSession.chat_id == chat_id))).scalar_one_or_none()
+        if row is None:
+            return None
+        return MenuState(row.message_id, row.state, row.category_id, row.product_id,
+                         touched=row.updated_at.timestamp() if row.updated_at else 0.0)
+
+    async def flush(self):
+        """Write pending changes in one transaction."""
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        try:
+            async with AsyncSessionLocal() as s:
+                for chat_id, item in batch.items():
+                    await s.merge(MenuSession(
+                        chat_id=chat_id, message_id=item.message_id, state=item.state,
+                        category_id=item.category, product_id=item.product,
+                        updated_at=datetime.fromtimestamp(item.touched),
+                    ))
+                await s.commit()
+        except Exception:
+            logger.exception('menu state flush failed')
+            # keep newer changes, retry the rest next time
+            for chat_id, item in batch.items():
+                self._dirty.setdefault(chat_id, item)
+
+    async def purge_expired(self) -> int:
+        """Delete persisted sessions older than the TTL; returns the number deleted."""
+        cutoff = datetime.fromtimestamp(time.time() - self.ttl)
+        async with AsyncSessionLocal() as s:
+            res = await s.execute(delete(MenuSession).where(MenuSession.updated_at < cutoff))
+            await s.commit()
+        return res.rowcount
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            try:
+                self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+            except RuntimeError:
+                pass
+
+    async def _flush_loop(self):
+        while self._dirty:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
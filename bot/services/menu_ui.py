@@ -1,9 +1,43 @@
-from typing import Dict, Any, List
+import hashlib
+import os
+
 from aiogram import Bot
-from aiogram.types import Message, InlineKeyboardButton
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from bot.services.db import Product, Category
+from bot.services.catalog_cache import catalog_cache
+from bot.services.db import Product
+from bot.services.edit_renderer import EditRenderer, screen_digest
+from bot.services.menu_state import MenuState, MenuStateStore
+from bot.services.photo_cache import photo_cache
+
+# public address of the backend: admin uploads are only reachable through its /img proxy
+BASE_URL = os.getenv('BASE_URL', 'https://mandanator.ru')
+UPLOAD_PREFIX = 'upload:'
+
+
+def photo_url(product_id: int, source: str) -> str:
+    """URL Telegram can download a product image source from."""
+    if source.startswith(UPLOAD_PREFIX):
+        # same URL as backend.app.images.thumb_url(product_id, source, 'full')
+        v = hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+        return f"{BASE_URL.rstrip('/')}/img/{product_id}/full?v={v}"
+    return source
+
+
+def _cart_markup() -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    kb.row(
+        InlineKeyboardButton(text="Очистить", callback_data="menu:clear_cart"),
+        InlineKeyboardButton(text="Оформить", callback_data="menu:checkout"),
+    )
+    kb.row(InlineKeyboardButton(text="Назад к категориям", callback_data="menu:back"))
+    return kb.as_markup()
+
+
+# static, built once
+CART_MARKUP = _cart_markup()
 
 
 class MenuUI:
@@ -15,113 +49,113 @@ class MenuUI:
     message_id for the chat.
     """
 
-    def __init__(self):
-        # chat_id -> dict(message_id=int, state=str, extras={})
-        self._menus: Dict[int, Dict[str, Any]] = {}
-
-    async def open_menu(self, bot: Bot, chat_id: int, categories: List[Category]):
-        text = "<b>Меню</b>\nВыберите категорию сверху"
-        kb = InlineKeyboardBuilder()
-        # categories as top row buttons
-        for c in categories:
-            kb.add(InlineKeyboardButton(text=c.title, callback_data=f"menu:cat:{c.id}"))
-        kb.add(InlineKeyboardButton(text="Корзина", callback_data="menu:cart"))
-        markup = kb.as_markup(row_width=3)
+    def __init__(self, store: MenuStateStore = None, renderer: EditRenderer = None):
+        # chat_id -> MenuState (bounded, persisted)
+        self._menus = store or MenuStateStore()
+        self.renderer = renderer or EditRenderer()
+
+    async def purge_expired(self) -> int:
+        return await self._menus.purge_expired()
+
+    async def close(self):
+        await self.renderer.flush()
+        await self._menus.close()
+
+    async def _send(self, bot: Bot, chat_id: int, text: str, markup: InlineKeyboardMarkup, state: str, **extra):
         msg: Message = await bot.send_message(chat_id, text, reply_markup=markup, parse_mode="HTML")
-        self._menus[chat_id] = {"message_id": msg.message_id, "state": "menu", "category": None}
-
-    async def show_category(self, bot: Bot, chat_id: int, category: Category, products: List[Product]):
-        # Build a product grid as text + keyboard with product buttons in 2 columns
-        lines = [f"<b>{category.title}</b>\nВыберите товар:"]
-        for p in products:
-            lines.append(f"{p.name} — {p.price}₽")
-        text = "\n".join(lines)
-
-        kb = InlineKeyboardBuilder()
-        for p in products:
-            kb.add(InlineKeyboardButton(text=f"{p.name} — {int(p.price)}₽", callback_data=f"menu:view:{p.id}"))
-        # navigation
-        kb.add(InlineKeyboardButton(text="Назад к категориям", callback_data="menu:back"))
-        kb.add(InlineKeyboardButton(text="Корзина", callback_data="menu:cart"))
-
-        menu = self._menus.get(chat_id)
+        self._menus.set(chat_id, msg.message_id, state, **extra).digest = screen_digest(text, markup)
+
+    async def _edit_text(self, bot: Bot, chat_id: int, menu: MenuState, text: str, markup: InlineKeyboardMarkup):
+        message_id = menu.message_id
+
+        async def action():
+            await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, reply_markup=markup, parse_mode="HTML")
+
+        await self.renderer.edit(chat_id, menu, screen_digest(text, markup), action)
+
+    async def open_menu(self, bot: Bot, chat_id: int):
+        text, markup = await catalog_cache.menu_screen()
+        await self._send(bot, chat_id, text, markup, "menu")
+
+    async def show_category(self, bot: Bot, chat_id: int, category_id: int):
+        screen = await catalog_cache.category_screen(category_id)
+        if screen is None:
+            return
+        text, markup = screen
+
+        menu = await self._menus.get(chat_id)
         if not menu:
             # fallback: send new message
-            msg = await bot.send_message(chat_id, text, reply_markup=kb.as_markup(row_width=2), parse_mode="HTML")
-            self._menus[chat_id] = {"message_id": msg.message_id, "state": "category", "category": category.id}
+            await self._send(bot, chat_id, text, markup, "category", category=category_id)
             return
 
-        await bot.edit_message_text(chat_id=chat_id, message_id=menu["message_id"], text=text, reply_markup=kb.as_markup(row_width=2), parse_mode="HTML")
-        menu["state"] = "category"
-        menu["category"] = category.id
-
-    async def show_product(self, bot: Bot, chat_id: int, product: Product):
-        # Show product photo if available, else edit text
-        text = f"<b>{product.name}</b>\n{product.description}\nЦена: {product.price}₽\nРейтинг: {product.rating}\n{product.tags}"
-        kb = InlineKeyboardBuilder()
-        kb.row(
-            InlineKeyboardButton(text="+", callback_data=f"menu:plus:{product.id}"),
-            InlineKeyboardButton(text="Добавить", callback_data=f"menu:add:{product.id}"),
-            InlineKeyboardButton(text="-", callback_data=f"menu:minus:{product.id}"),
-        )
-        kb.add(InlineKeyboardButton(text="В корзину", callback_data=f"menu:to_cart:{product.id}"))
-        kb.add(InlineKeyboardButton(text="Назад к категории", callback_data="menu:back"))
-
-        menu = self._menus.get(chat_id)
+        self._menus.set(chat_id, menu.message_id, "category", category=category_id)
+        await self._edit_text(bot, chat_id, menu, text, markup)
+
+    async def show_product(self, bot: Bot, chat_id: int, product_id: int, qty: int = 0):
+        product = await catalog_cache.product(product_id)
+        if product is None:
+            return
+        text, markup = await catalog_cache.product_screen(product_id, qty)
+
+        menu = await self._menus.get(chat_id)
         if not menu:
-            msg = await bot.send_message(chat_id, text, reply_markup=kb.as_markup(), parse_mode="HTML")
-            self._menus[chat_id] = {"message_id": msg.message_id, "state": "product", "product": product.id}
+            await self._send(bot, chat_id, text, markup, "product", product=product.id)
             return
 
-        # If product has image, try editing media; otherwise edit text
+        message_id = menu.message_id
+
+        async def action():
+            # Show product photo if available, else edit text
+            try:
+                if product.image_url:
+                    await self._edit_photo(bot, chat_id, message_id, product, text, markup)
+                else:
+                    await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, reply_markup=markup, parse_mode="HTML")
+            except Exception:
+                # fallback to editing text if media edit fails
+                await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, reply_markup=markup, parse_mode="HTML")
+
+        self._menus.set(chat_id, menu.message_id, "product", category=menu.category, product=product.id)
+        await self.renderer.edit(chat_id, menu, screen_digest(text, markup, product.image_url), action)
+
+    async def _edit_photo(self, bot: Bot, chat_id: int, message_id: int, product: Product, caption: str, markup: InlineKeyboardMarkup):
+        # send the cached Telegram file_id when we have one, the URL only the first time
+        file_id = await photo_cache.get(product.id, product.image_url)
+        media = InputMediaPhoto(media=file_id or photo_url(product.id, product.image_url), caption=caption, parse_mode="HTML")
         try:
-            if product.image_url:
-                from aiogram.types import InputMediaPhoto
-                media = InputMediaPhoto(media=product.image_url, caption=text, parse_mode="HTML")
-                await bot.edit_message_media(media=media, chat_id=chat_id, message_id=menu["message_id"], reply_markup=kb.as_markup())
-            else:
-                await bot.edit_message_text(chat_id=chat_id, message_id=menu["message_id"], text=text, reply_markup=kb.as_markup(), parse_mode="HTML")
-        except Exception:
-            # fallback to editing text if media edit fails
-            await bot.edit_message_text(chat_id=chat_id, message_id=menu["message_id"], text=text, reply_markup=kb.as_markup(), parse_mode="HTML")
-
-        menu["state"] = "product"
-        menu["product"] = product.id
+            msg = await bot.edit_message_media(media=media, chat_id=chat_id, message_id=message_id, reply_markup=markup)
+        except TelegramBadRequest:
+            if not file_id:
+                raise
+            # file_id no longer accepted: forget it and retry with the URL
+            await photo_cache.forget(product.id)
+            return await self._edit_photo(bot, chat_id, message_id, product, caption, markup)
+        if isinstance(msg, Message) and msg.photo:
+            await photo_cache.put(product.id, product.image_url, msg.photo[-1].file_id)
 
     async def show_cart(self, bot: Bot, chat_id: int, items_text: str, total: float):
         text = f"<b>Корзина</b>\n{items_text}\n\nИтого: {total}₽"
-        kb = InlineKeyboardBuilder()
-        kb.row(
-            InlineKeyboardButton(text="Очистить", callback_data="menu:clear_cart"),
-            InlineKeyboardButton(text="Оформить", callback_data="menu:checkout"),
-        )
-        kb.add(InlineKeyboardButton(text="Назад к категориям", callback_data="menu:back"))
-
-        menu = self._menus.get(chat_id)
+
+        menu = await self._menus.get(chat_id)
         if not menu:
-            msg = await bot.send_message(chat_id, text, reply_markup=kb.as_markup(), parse_mode="HTML")
-            self._menus[chat_id] = {"message_id": msg.message_id, "state": "cart"}
+            await self._send(bot, chat_id, text, CART_MARKUP, "cart")
             return
 
-        await bot.edit_message_text(chat_id=chat_id, message_id=menu["message_id"], text=text, reply_markup=kb.as_markup(), parse_mode="HTML")
-        menu["state"] = "cart"
+        self._menus.set(chat_id, menu.message_id, "cart")
+        await self._edit_text(bot, chat_id, menu, text, CART_MARKUP)
 
-    async def back_to_menu(self, bot: Bot, chat_id: int, categories: List[Category]):
+    async def back_to_menu(self, bot: Bot, chat_id: int):
         # Re-open categories view by editing the same message
-        text = "<b>Меню</b>\nВыберите категорию сверху"
-        kb = InlineKeyboardBuilder()
-        for c in categories:
-            kb.add(InlineKeyboardButton(text=c.title, callback_data=f"menu:cat:{c.id}"))
-        kb.add(InlineKeyboardButton(text="Корзина", callback_data="menu:cart"))
+        text, markup = await catalog_cache.menu_screen()
 
-        menu = self._menus.get(chat_id)
+        menu = await self._menus.get(chat_id)
         if not menu:
-            msg = await bot.send_message(chat_id, text, reply_markup=kb.as_markup(row_width=3), parse_mode="HTML")
-            self._menus[chat_id] = {"message_id": msg.message_id, "state": "menu"}
+            await self._send(bot, chat_id, text, markup, "menu")
             return
 
-        await bot.edit_message_text(chat_id=chat_id, message_id=menu["message_id"], text=text, reply_markup=kb.as_markup(row_width=3), parse_mode="HTML")
-        menu["state"] = "menu"
+        self._menus.set(chat_id, menu.message_id, "menu")
+        await self._edit_text(bot, chat_id, menu, text, markup)
 
 
 # Singleton UI instance
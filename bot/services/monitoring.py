@@ -0,0 +1,41 @@
+"""Prometheus metrics and tracing of the bot process (shared.metrics, shared.tracing).
+
+The bot has no HTTP server of its own, so the metrics are served by a
+small exporter on BOT_METRICS_PORT ('0' disables it).
+"""
+import logging
+import os
+
+from aiogram import Bot, Dispatcher
+
+from bot.services.menu_ui import menu_ui
+from bot.services.order_history import history_cache
+from shared import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+BOT_METRICS_PORT = int(os.getenv('BOT_METRICS_PORT', '9101'))
+
+metrics.registry.stats('menu_edits_total', 'Menu screen edits: requested, sent, coalesced, skipped',
+                       lambda: menu_ui.renderer.stats)
+metrics.registry.stats('order_history_total', 'Order history pages served, queries and invalidations',
+                       lambda: history_cache.stats)
+
+
+def instrument(bot: Bot, dp: Dispatcher):
+    """Time and trace Bot API calls and handlers; call after every router is included."""
+    bot.session.middleware(metrics.TelegramMetrics())
+    bot.session.middleware(tracing.TelegramTracing())
+    metrics.instrument_dispatcher(dp)
+    tracing.instrument_dispatcher(dp)
+
+
+async def start_exporter(port: int = BOT_METRICS_PORT):
+    """Start the /metrics exporter; returns its runner, or None when disabled or the port is taken."""
+    if not port:
+        return None
+    try:
+        return await metrics.serve(port)
+    except OSError as e:
+        logger.warning('metrics exporter not started on port %s: %s', port, e)
+        return None
@@ -0,0 +1,142 @@
+"""Per-customer order history for the "Мои заказы" screen.
+
+The newest orders of a customer are loaded in keyset chunks (id < last
+loaded id) and kept in memory, so paging back and forth through the
+history costs no queries.  An entry is dropped when the bot creates an
+order for that customer, and when order_status_events shows a new order
+or a status change for one of their orders (WebApp orders, admin panel,
+payment webhooks); that log is polled at most every HISTORY_POLL_INTERVAL
+seconds, and only while someone is looking at their history.
+
+Chunks are read from the replica when it has caught up with the change
+that dropped the entry, and from the primary otherwise.
+"""
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bot.services.db import AsyncSessionLocal
+from shared.db import read_session, router
+from shared.repository import order_events_after, user_orders_page
+
+PAGE_SIZE = 5
+# orders fetched per query; several pages, so the next taps are served from memory
+CHUNK_SIZE = 4 * PAGE_SIZE
+HISTORY_POLL_INTERVAL = float(os.getenv('HISTORY_POLL_INTERVAL', '5'))
+# customers kept in memory (least recently viewed are dropped first)
+HISTORY_MAX_USERS = int(os.getenv('HISTORY_MAX_USERS', '5000'))
+
+
+@dataclass(slots=True)
+class OrderSummary:
+    id: int
+    created_at: Optional[datetime]
+    total_price: Optional[float]
+    status: Optional[str]
+    delivery_type: Optional[str]
+
+
+@dataclass(slots=True)
+class HistoryPage:
+    orders: List[OrderSummary]
+    # ids for the keyset navigation buttons, None when there is no such page
+    newer_than: Optional[int]
+    older_than: Optional[int]
+
+
+class _History:
+    __slots__ = ('orders', 'complete')
+
+    def __init__(self):
+        # contiguous from the newest order, newest first
+        self.orders: List[OrderSummary] = []
+        self.complete = False
+
+
+class OrderHistoryCache:
+    def __init__(self, page_size: int = PAGE_SIZE, chunk_size: int = CHUNK_SIZE,
+                 poll_interval: float = HISTORY_POLL_INTERVAL, max_users: int = HISTORY_MAX_USERS):
+        self.page_size = page_size
+        self.chunk_size = max(chunk_size, page_size + 1)
+        self.poll_interval = poll_interval
+        self.max_users = max_users
+        self._users: Dict[int, _History] = {}
+        # user -> time.time() of the last known change; reads must see it
+        self._changed_at: Dict[int, float] = {}
+        self._last_event: Optional[int] = None
+        self._checked_at = 0.0
+        self.stats = {'pages': 0, 'queries': 0, 'invalidated': 0}
+
+    def invalidate(self, user_id: int):
+        self._changed_at[user_id] = time.time()
+        if self._users.pop(user_id, None) is not None:
+            self.stats['invalidated'] += 1
+
+    async def page(self, user_id: int, before: Optional[int] = None, after: Optional[int] = None) -> HistoryPage:
+        """Orders with id < before (older page), id > after (newer page) or the newest page."""
+        self.stats['pages'] += 1
+        await self._sync()
+        history = self._users.pop(user_id, None) or _History()
+        # re-insert: dict order is the LRU order
+        self._users[user_id] = history
+        while len(self._users) > self.max_users:
+            evicted = next(iter(self._users))
+            del self._users[evicted]
+            self._changed_at.pop(evicted, None)
+
+        if after is not None:
+            # everything newer than a loaded id is loaded (the list starts at the newest order)
+            while not history.complete and (not history.orders or history.orders[-1].id > after):
+                await self._load(user_id, history)
+            newer = [o for o in history.orders if o.id > after]
+            start = max(0, len(newer) - self.page_size)
+        else:
+            start = 0
+            if before is not None:
+                while not history.complete and (not history.orders or history.orders[-1].id >= before):
+                    await self._load(user_id, history)
+                start = next((i for i, o in enumerate(history.orders) if o.id < before), len(history.orders))
+        # one extra order tells whether an older page exists
+        while not history.complete and len(history.orders) <= start + self.page_size:
+            await self._load(user_id, history)
+
+        orders = history.orders[start:start + self.page_size]
+        if not orders:
+            return HistoryPage([], None, None)
+        return HistoryPage(
+            orders,
+            orders[0].id if start > 0 else None,
+            orders[-1].id if len(history.orders) > start + self.page_size else None,
+        )
+
+    async def _load(self, user_id: int, history: _History):
+        before = history.orders[-1].id if history.orders else None
+        async with read_session(self._changed_at.get(user_id)) as session:
+            rows = await user_orders_page(session, user_id, before, self.chunk_size)
+        self.stats['queries'] += 1
+        # a concurrent tap may have loaded the same chunk meanwhile
+        last = history.orders[-1].id if history.orders else None
+        if last != before:
+            return
+        history.orders += [OrderSummary(*row) for row in rows]
+        history.complete = len(rows) < self.chunk_size
+
+    async def _sync(self):
+        """Drop customers whose orders changed in another process since the last check."""
+        now = time.monotonic()
+        if now - self._checked_at < self.poll_interval:
+            return
+        self._checked_at = now
+        async with AsyncSessionLocal() as session:
+            self._last_event, changed = await order_events_after(session, self._last_event)
+        for user_id in changed:
+            self.invalidate(user_id)
+        # any replica the router still uses has replayed changes older than this
+        settled = time.time() - router.max_lag - router.check_interval
+        for user_id in [u for u, ts in self._changed_at.items() if ts < settled]:
+            del self._changed_at[user_id]
+
+
+history_cache = OrderHistoryCache()
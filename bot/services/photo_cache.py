@@ -0,0 +1,53 @@
+from typing import Dict, Optional, Tuple
+from datetime import datetime
+
+from sqlalchemy import select, delete
+
+from bot.services.db import AsyncSessionLocal, ProductPhoto
+
+
+class PhotoFileCache:
+    """product_id -> Telegram file_id of its photo.
+
+    After the first successful send Telegram returns a file_id; reusing it
+    avoids Telegram downloading the image URL again on every view.  An
+    entry only counts while the product still has the same image_url, so
+    changing the picture invalidates it.  Rows live in the DB so the cache
+    survives restarts; reads are served from memory.
+    """
+
+    def __init__(self):
+        # product_id -> (image_url, file_id)
+        self._ids: Dict[int, Tuple[str, str]] = {}
+        self._loaded = False
+
+    async def _load(self):
+        async with AsyncSessionLocal() as s:
+            rows = (await s.execute(select(ProductPhoto))).scalars().all()
+        self._ids = {r.product_id: (r.image_url, r.file_id) for r in rows}
+        self._loaded = True
+
+    async def get(self, product_id: int, image_url: str) -> Optional[str]:
+        if not self._loaded:
+            await self._load()
+        entry = self._ids.get(product_id)
+        if entry and entry[0] == image_url:
+            return entry[1]
+        return None
+
+    async def put(self, product_id: int, image_url: str, file_id: str):
+        if self._ids.get(product_id) == (image_url, file_id):
+            return
+        self._ids[product_id] = (image_url, file_id)
+        async with AsyncSessionLocal() as s:
+            await s.merge(ProductPhoto(product_id=product_id, image_url=image_url, file_id=file_id, updated_at=datetime.utcnow()))
+            await s.commit()
+
+    async def forget(self, product_id: int):
+        self._ids.pop(product_id, None)
+        async with AsyncSessionLocal() as s:
+            await s.execute(delete(ProductPhoto).where(ProductPhoto.product_id == product_id))
+            await s.commit()
+
+
+photo_cache = PhotoFileCache()
@@ -0,0 +1,77 @@
+"""Customer profiles for checkout and repeat orders, cached per Telegram id.
+
+A profile (name, last phone, saved addresses, last orders) is read with
+three small queries the first time a customer opens checkout and then
+served from memory.  Orders placed through the bot invalidate it right
+away; changes made by the backend (WebApp orders, status changes) are
+picked up after PROFILE_TTL seconds.
+"""
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from bot.services.db import AsyncSessionLocal
+from shared.repository import customer_profile
+
+PROFILE_TTL = float(os.getenv('PROFILE_TTL', '300'))
+SAVED_ADDRESSES = 3
+RECENT_ORDERS = 5
+
+
+@dataclass(slots=True)
+class PastOrder:
+    id: int
+    created_at: Optional[datetime]
+    total_price: Optional[float]
+    status: Optional[str]
+    items: List[dict]
+    address: Optional[str]
+    payment_method: Optional[str]
+    delivery_type: Optional[str]
+
+
+@dataclass(slots=True)
+class Profile:
+    name: Optional[str] = None
+    phone: Optional[str] = None
+    addresses: List[str] = field(default_factory=list)
+    orders: List[PastOrder] = field(default_factory=list)
+
+    def order(self, order_id: int) -> Optional[PastOrder]:
+        return next((o for o in self.orders if o.id == order_id), None)
+
+    def last_delivery(self) -> Optional[PastOrder]:
+        """The latest order if it was a delivery (a pickup's address is just 'Самовывоз')."""
+        last = self.orders[0] if self.orders else None
+        return last if last and last.delivery_type == 'delivery' and last.address else None
+
+
+class ProfileCache:
+    def __init__(self, ttl: float = PROFILE_TTL):
+        self.ttl = ttl
+        self._profiles: Dict[int, Tuple[float, Profile]] = {}
+
+    async def get(self, telegram_id: int) -> Profile:
+        cached = self._profiles.get(telegram_id)
+        if cached is not None and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+        async with AsyncSessionLocal() as session:
+            user, addresses, orders = await customer_profile(session, telegram_id, SAVED_ADDRESSES, RECENT_ORDERS)
+        profile = Profile(
+            name=user.name if user else None,
+            phone=user.phone if user else None,
+            addresses=list(addresses),
+            orders=[PastOrder(o.id, o.created_at, o.total_price, o.status, json.loads(o.items_json or '[]'),
+                              o.address, o.payment_method, o.delivery_type) for o in orders],
+        )
+        self._profiles[telegram_id] = (time.monotonic(), profile)
+        return profile
+
+    def invalidate(self, telegram_id: int):
+        self._profiles.pop(telegram_id, None)
+
+
+profile_cache = ProfileCache()
@@ -15,12 +15,14 @@ from bot.handlers.cart import router as cart_router
 from bot.handlers.order import router as order_router
 from bot.handlers.admin import router as admin_router
 from bot.services.db import init_db
+from bot.services.maintenance import setup_jobs
+from bot.services.menu_ui import menu_ui
+from bot.services.monitoring import instrument, start_exporter
+from shared.jobs import scheduler
+from shared.tracing import setup_logging
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Настройка логирования: JSON с trace_id (LOG_FORMAT=text — обычные строки)
+setup_logging('bot')
 logger = logging.getLogger(__name__)
 
 # Конфигурация из переменных окружения
@@ -34,6 +36,7 @@ ADMIN_IDS = [int(id.strip()) for id in os.getenv('ADMIN_IDS', '').split(',') if
 bot = Bot(token=BOT_TOKEN)
 storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
+exporter = None
 
 
 async def set_bot_commands():
@@ -64,15 +67,22 @@ async def set_bot_commands():
 
 async def on_startup():
     """Действия при запуске бота"""
+    global exporter
     logger.info("🚀 Запуск бота...")
     await init_db()
     await set_bot_commands()
+    setup_jobs(scheduler, storage).start()
+    exporter = await start_exporter()
     logger.info("✅ Бот запущен и готов к работе!")
 
 
 async def on_shutdown():
     """Действия при остановке бота"""
     logger.info("🛑 Остановка бота...")
+    await scheduler.stop()
+    if exporter is not None:
+        await exporter.cleanup()
+    await menu_ui.close()
     await bot.session.close()
     logger.info("✅ Бот остановлен")
 
@@ -85,6 +95,7 @@ async def main():
     dp.include_router(cart_router)
     dp.include_router(order_router)
     dp.include_router(admin_router)
+    instrument(bot, dp)
     
     # Запуск
     try:
@@ -1,5 +1,4 @@
 import asyncio
-import logging
 
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
@@ -7,8 +6,13 @@ from aiogram.fsm.storage.memory import MemoryStorage
 import config
 from bot.services.db import init_db, create_sample_data
 from bot.handlers import catalog, cart, order, admin
+from bot.services.maintenance import setup_jobs
+from bot.services.menu_ui import menu_ui
+from bot.services.monitoring import instrument, start_exporter
+from shared.jobs import scheduler
+from shared.tracing import setup_logging
 
-logging.basicConfig(level=logging.INFO)
+setup_logging('bot')
 
 async def main():
     await init_db()
@@ -23,10 +27,17 @@ async def main():
     dp.include_router(cart)
     dp.include_router(order)
     dp.include_router(admin)
+    instrument(bot, dp)
 
+    setup_jobs(scheduler, storage).start()
+    exporter = await start_exporter()
     try:
         await dp.start_polling(bot)
     finally:
+        await scheduler.stop()
+        if exporter is not None:
+            await exporter.cleanup()
+        await menu_ui.close()
         await bot.session.close()
 
 if __name__ == '__main__':
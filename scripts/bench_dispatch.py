@@ -0,0 +1,105 @@
+"""Бенчмарк группировки доставок (backend.app.dispatch) на синтетическом потоке.
+
+    python -m scripts.bench_dispatch [--orders-per-hour 1000] [--hours 1] [--every 5] [--radius-km 8]
+
+Заказы равномерно появляются в течение часа в круге --radius-km вокруг
+ресторана. Диспетчер каждые --every минут раскладывает готовые заказы по
+сумкам. Сравниваются километры по сравнению с «одна сумка — один заказ»,
+а также время планирования с сеткой и с полным перебором соседей.
+"""
+import argparse
+import math
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from backend.app import dispatch
+from backend.app.dispatch import Stop, plan, route
+
+
+class ScanAll(dispatch.Grid):
+    """No spatial index: every stop is a neighbour candidate."""
+
+    def near(self, lat, lon):
+        for cell in self.cells.values():
+            yield from cell
+
+
+@contextmanager
+def grid_class(cls):
+    saved, dispatch.Grid = dispatch.Grid, cls
+    try:
+        yield
+    finally:
+        dispatch.Grid = saved
+
+
+def synthetic_orders(n: int, hours: float, radius_km: float, rnd: random.Random):
+    t0 = datetime(2024, 1, 1, 18)
+    lat0, lon0 = dispatch.DEPOT
+    stops = []
+    for i in range(n):
+        r = radius_km * math.sqrt(rnd.random())
+        a = rnd.uniform(0, 2 * math.pi)
+        lat = lat0 + r * math.cos(a) / dispatch.KM_PER_DEGREE
+        lon = lon0 + r * math.sin(a) / (dispatch.KM_PER_DEGREE * math.cos(math.radians(lat0)))
+        ready = t0 + timedelta(seconds=rnd.uniform(0, hours * 3600))
+        stops.append(Stop(i + 1, f'адрес {i + 1}', lat, lon, ready))
+    return sorted(stops, key=lambda s: s.ready_at)
+
+
+def cycles(stops, every: timedelta):
+    """Stops that became ready since the previous dispatcher run, per run."""
+    start, batch = stops[0].ready_at, []
+    for stop in stops:
+        while stop.ready_at >= start + every:
+            yield batch
+            start, batch = start + every, []
+        batch.append(stop)
+    yield batch
+
+
+def run(stops, every, max_bag, radius):
+    bags, spent = [], 0.0
+    for batch in cycles(stops, every):
+        if batch:
+            t = time.perf_counter()
+            bags += plan(batch, max_bag=max_bag, radius_km=radius, window=every)
+            spent += time.perf_counter() - t
+    return bags, spent
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders-per-hour', type=int, default=1000)
+    parser.add_argument('--hours', type=float, default=1)
+    parser.add_argument('--every', type=float, default=5, help='minutes between dispatcher runs')
+    parser.add_argument('--radius-km', type=float, default=8, help='delivery area radius')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    n = int(args.orders_per_hour * args.hours)
+    stops = synthetic_orders(n, args.hours, args.radius_km, random.Random(args.seed))
+    every = timedelta(minutes=args.every)
+    singles_km = sum(route([s])[1] for s in stops)
+    print(f'{n} заказов за {args.hours:g} ч, диспетчер каждые {args.every:g} мин, '
+          f'по одному заказу: {singles_km:,.0f} км')
+
+    for max_bag, radius in ((2, 1.0), (3, 1.5), (4, 2.0)):
+        bags, spent = run(stops, every, max_bag, radius)
+        km = sum(b.distance_km for b in bags)
+        print(f'  сумка до {max_bag}, радиус {radius:g} км: {len(bags)} выездов, '
+              f'{n / len(bags):.2f} заказа/выезд, {km:,.0f} км ({km / singles_km:.0%}), план {spent * 1000:.1f} мс')
+
+    # one big planning call: grid vs scanning all candidates
+    for label, cls in (('сетка', dispatch.Grid), ('перебор', ScanAll)):
+        with grid_class(cls):
+            t = time.perf_counter()
+            bags = plan(stops, max_bag=3, radius_km=1.5, window=timedelta(minutes=15))
+            elapsed = time.perf_counter() - t
+        print(f'  один план на все {n} заказов, {label}: {elapsed * 1000:.1f} мс, {len(bags)} выездов')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Симуляция потока заказов: точность ETA (shared.eta) против фиксированных «30-60 минут».
+
+    python -m scripts.bench_eta [--orders 5000] [--cooks 3] [--seed 1]
+
+Кухня — очередь FIFO с --cooks поварами; время готовки, ожидания курьера и
+доставки случайные. Для каждого заказа ETA берётся в момент оформления и
+сравнивается с фактическим временем до доставки. Также печатается цена
+одного обновления модели (on_created / on_transition).
+"""
+import argparse
+import heapq
+import random
+import time
+from datetime import datetime, timedelta
+
+from shared import order_status as st
+from shared.eta import EtaEstimator
+
+BASELINE_MINUTES = 45  # середина «30-60 минут»
+
+# заказов в час по часам смены: тихо, обед, час пик, вечер
+SCENARIOS = {
+    'quiet': [4] * 8,
+    'steady': [8] * 8,
+    'rush': [5, 8, 11, 14, 14, 11, 8, 5],
+}
+
+
+def simulate(rates, cooks: int, limit: int, rnd: random.Random):
+    """Returns [(eta_seconds, actual_seconds)] and the estimator's update cost in µs."""
+    est = EtaEstimator()
+    t0 = datetime(2024, 1, 1, 10)
+    events = []  # (time offset in seconds, seq, kind, order id)
+    seq = 0
+
+    def push(at, kind, order_id):
+        nonlocal seq
+        seq += 1
+        heapq.heappush(events, (at, seq, kind, order_id))
+
+    # arrivals: Poisson process with a per-hour rate
+    at, order_id = 0.0, 0
+    while order_id < limit:
+        hour = int(at // 3600) % len(rates)
+        at += rnd.expovariate(rates[hour] / 3600)
+        order_id += 1
+        push(at, 'arrive', order_id)
+
+    free_cooks, queue = cooks, []
+    placed, eta, results = {}, {}, []
+    updates, spent = 0, 0.0
+
+    def update(fn, *args):
+        nonlocal updates, spent
+        t = time.perf_counter()
+        fn(*args)
+        spent += time.perf_counter() - t
+        updates += 1
+
+    def start_cooking(at, order_id):
+        nonlocal free_cooks
+        free_cooks -= 1
+        update(est.on_transition, [order_id], st.PREPARING, t0 + timedelta(seconds=at))
+        push(at + rnd.lognormvariate(6.7, 0.35), 'ready', order_id)  # ~13-14 min
+
+    while events:
+        at, _, kind, order_id = heapq.heappop(events)
+        now = t0 + timedelta(seconds=at)
+        if kind == 'arrive':
+            eta[order_id] = est.estimate(delivery=True)
+            placed[order_id] = at
+            update(est.on_created, order_id, now)
+            if free_cooks:
+                start_cooking(at, order_id)
+            else:
+                queue.append(order_id)
+        elif kind == 'ready':
+            update(est.on_transition, [order_id], st.READY, now)
+            free_cooks += 1
+            if queue:
+                start_cooking(at, queue.pop(0))
+            push(at + rnd.expovariate(1 / 300), 'pickup', order_id)  # courier ~5 min
+        elif kind == 'pickup':
+            update(est.on_transition, [order_id], st.DELIVERING, now)
+            push(at + rnd.uniform(900, 1800), 'delivered', order_id)  # 15-30 min
+        elif kind == 'delivered':
+            update(est.on_transition, [order_id], st.COMPLETED, now)
+            results.append((eta[order_id], at - placed[order_id]))
+    return results, spent / updates * 1e6
+
+
+def report(label: str, pairs):
+    err = [abs(p - a) / 60 for p, a in pairs]
+    err.sort()
+    within = sum(1 for e in err if e <= 10) / len(err)
+    print(f'  {label:<10} MAE {sum(err) / len(err):5.1f} мин  p90 {err[int(len(err) * 0.9)]:5.1f} мин  '
+          f'в пределах ±10 мин: {within:5.1%}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--cooks', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    for name, rates in SCENARIOS.items():
+        results, cost = simulate(rates, args.cooks, args.orders, random.Random(args.seed))
+        # the first orders only train the model
+        scored = results[len(results) // 10:]
+        print(f'{name}: {len(scored)} заказов, {args.cooks} повара, обновление модели {cost:.1f} µs')
+        report('ETA', scored)
+        report('30-60', [(BASELINE_MINUTES * 60, actual) for _, actual in scored])
+
+
+if __name__ == '__main__':
+    main()
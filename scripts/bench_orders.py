@@ -0,0 +1,73 @@
+"""Нагрузочный тест POST /api/orders в духе locust: N виртуальных клиентов, p50/p99.
+
+    python -m scripts.bench_orders [--users 20] [--requests 50] [--url http://localhost:11204]
+
+Без --url приложение поднимается в процессе (httpx ASGITransport) на
+временной SQLite-базе; с --url запросы идут на запущенный сервер.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import httpx
+
+
+def order_payload(user: int) -> dict:
+    items = [
+        {'product_id': pid, 'name': f'Товар {pid}', 'qty': random.randint(1, 3), 'price': 450.0}
+        for pid in random.sample(range(1, 6), random.randint(1, 4))
+    ]
+    return {
+        'user_id': None, 'username': f'user{user}', 'first_name': 'Гость',
+        'items': items, 'total_price': sum(i['qty'] * i['price'] for i in items),
+        'address': 'ул. Пример, 1', 'phone': '+79000000000', 'comment': '',
+        'payment_method': 'cash', 'delivery_type': 'delivery',
+    }
+
+
+async def virtual_user(client: httpx.AsyncClient, user: int, n: int, timings: list, errors: list):
+    for _ in range(n):
+        t = time.perf_counter()
+        resp = await client.post('/api/orders', json=order_payload(user))
+        timings.append((time.perf_counter() - t) * 1000)
+        if resp.status_code != 200:
+            errors.append(resp.status_code)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=50, help='requests per user')
+    parser.add_argument('--url', default=None)
+    args = parser.parse_args()
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=30)
+    else:
+        os.environ['DATABASE_URL'] = f'sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db'
+        os.environ['BOT_TOKEN'] = ''
+        from backend.app import main as app_main
+        await app_main.startup()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app_main.app), base_url='http://bench')
+
+    timings, errors = [], []
+    async with client:
+        # warm-up
+        await client.post('/api/orders', json=order_payload(0))
+        t0 = time.perf_counter()
+        await asyncio.gather(*(virtual_user(client, u, args.requests, timings, errors) for u in range(args.users)))
+        wall = time.perf_counter() - t0
+
+    timings.sort()
+    pct = lambda q: timings[min(len(timings) - 1, int(len(timings) * q))]  # noqa: E731
+    print(f'{len(timings)} requests, {args.users} users, {len(errors)} errors')
+    print(f'throughput {len(timings) / wall:.0f} req/s')
+    print(f'latency ms: mean {statistics.mean(timings):.1f}  p50 {pct(0.5):.1f}  p90 {pct(0.9):.1f}  p99 {pct(0.99):.1f}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+"""Бенчмарк чтения списков: ORM-объекты + jsonable_encoder против проекций + orjson.
+
+    python -m scripts.bench_projection [--rows 10000] [--repeat 5]
+
+Считает строки/сек для полного пути «запрос + сериализация ответа» на
+временной SQLite-базе (DATABASE_URL подменяется).
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+_tmp = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f'sqlite+aiosqlite:///{_tmp}/bench.db'
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+
+from backend.app import crud  # noqa: E402
+from backend.app.db import AsyncSessionLocal, Order, Product, init_db  # noqa: E402
+from backend.app.responses import ORJSONResponse  # noqa: E402
+
+
+def render_default(content) -> bytes:
+    # what starlette's JSONResponse does
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(',', ':')).encode('utf-8')
+
+
+async def seed(n: int):
+    await init_db()
+    async with AsyncSessionLocal() as s:
+        await s.execute(Product.__table__.insert(), [
+            {'name': f'Ролл {i}', 'description': 'Рис, нори, лосось', 'price': 450.0, 'category_id': 1 + i % 3,
+             'image_url': f'https://example.com/{i}.jpg', 'tags': 'Новинка', 'rating': 4.5}
+            for i in range(n)
+        ])
+        items = json.dumps([{'product_id': 1, 'name': 'Ролл', 'qty': 2, 'price': 450.0}], ensure_ascii=False)
+        await s.execute(Order.__table__.insert(), [
+            {'user_id': 1000 + i % 50, 'items_json': items, 'total_price': 900.0, 'address': 'ул. Пример 1',
+             'name': 'Гость', 'phone': '+7 900 000-00-00', 'payment_method': 'cash', 'status': 'new',
+             'created_at': datetime(2024, 1, 1, 12, 0, i % 60)}
+            for i in range(n)
+        ])
+        await s.commit()
+
+
+async def orm_orders(s):
+    return jsonable_encoder((await s.execute(select(Order).order_by(Order.created_at.desc()))).scalars().all())
+
+
+async def orm_products(s):
+    return jsonable_encoder((await s.execute(select(Product))).scalars().all())
+
+
+async def run(label: str, load, render, rows: int, repeat: int):
+    best = None
+    for _ in range(repeat):
+        async with AsyncSessionLocal() as s:
+            t = time.perf_counter()
+            body = render(await load(s))
+            elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{label:<34} {best * 1000:8.1f} ms {rows / best:>12,.0f} rows/s  {len(body) / 1024:7.0f} KiB')
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    await seed(args.rows)
+    orjson_render = lambda content: ORJSONResponse(content).body  # noqa: E731
+
+    await run('orders: ORM + jsonable_encoder', orm_orders, render_default, args.rows, args.repeat)
+    await run('orders: projection + orjson', crud.list_orders_all, orjson_render, args.rows, args.repeat)
+    await run('products: ORM + jsonable_encoder', orm_products, render_default, args.rows, args.repeat)
+    await run('products: projection + orjson', crud.list_products, orjson_render, args.rows, args.repeat)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+"""Бенчмарк поиска по товарам: 10k синтетических позиций, задержка запроса.
+
+    python -m scripts.bench_search [--products 10000] [--queries 2000]
+"""
+import argparse
+import random
+import statistics
+import time
+
+from backend.app.search import ProductSearchIndex
+
+WORDS = [
+    'ролл', 'суп', 'лосось', 'тунец', 'угорь', 'сыр', 'курица', 'соус', 'тёплый',
+    'острый', 'овощной', 'рис', 'нори', 'креветка', 'авокадо', 'огурец', 'мисо',
+    'темпура', 'запечённый', 'сливочный', 'классический', 'фирменный', 'морковный',
+    'японский', 'кунжут', 'икра', 'краб', 'грибы', 'говядина', 'лапша',
+]
+TAGS = ['Новинка', 'Выбор шефа', 'Выбор месяца', 'Острое', 'Вегетарианское']
+QUERIES = ['ролл', 'лосос', 'теплый суп', 'сливочнй', 'фирменный ролл', 'креветк', 'выбор шефа', 'унагии', 'мисо']
+
+
+def make_products(n: int, seed: int = 42):
+    rnd = random.Random(seed)
+    for i in range(1, n + 1):
+        yield {
+            'id': i,
+            'name': ' '.join(rnd.sample(WORDS, 2)) + f' {i}',
+            'description': ', '.join(rnd.sample(WORDS, 5)),
+            'price': rnd.randint(150, 900),
+            'tags': ', '.join(rnd.sample(TAGS, rnd.randint(0, 2))),
+            'rating': round(rnd.uniform(3.5, 5.0), 1),
+            'category_id': rnd.randint(1, 12),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    index = ProductSearchIndex()
+    t0 = time.perf_counter()
+    index.build(make_products(args.products))
+    print(f'build: {args.products} products in {(time.perf_counter() - t0) * 1000:.1f} ms')
+
+    timings = []
+    for i in range(args.queries):
+        q = QUERIES[i % len(QUERIES)]
+        t = time.perf_counter()
+        index.search(q, limit=20)
+        timings.append((time.perf_counter() - t) * 1e6)
+    timings.sort()
+    p = lambda q: timings[min(len(timings) - 1, int(len(timings) * q))]
+    print(f'query: mean {statistics.mean(timings):.0f} µs, p50 {p(0.5):.0f} µs, p99 {p(0.99):.0f} µs')
+
+    t = time.perf_counter()
+    index.add({'id': 1, 'name': 'Новый ролл', 'description': 'обновлено', 'tags': 'Новинка'})
+    print(f'incremental update: {(time.perf_counter() - t) * 1e6:.0f} µs')
+
+
+if __name__ == '__main__':
+    main()
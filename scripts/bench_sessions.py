@@ -0,0 +1,59 @@
+"""Сколько соединений из пула и транзакций уходит на один HTTP-запрос.
+
+    python -m scripts.bench_sessions
+
+Работает на временной SQLite-базе (DATABASE_URL подменяется).
+"""
+import os
+import sys
+import tempfile
+
+_tmp = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f'sqlite+aiosqlite:///{_tmp}/bench.db'
+os.environ.setdefault('BOT_TOKEN', '')
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from backend.app import main  # noqa: E402
+from backend.app.db import engine  # noqa: E402
+
+counters = {'checkout': 0, 'commit': 0}
+event.listen(engine.sync_engine, 'checkout', lambda *a: counters.__setitem__('checkout', counters['checkout'] + 1))
+event.listen(engine.sync_engine, 'commit', lambda *a: counters.__setitem__('commit', counters['commit'] + 1))
+
+TG_ID = 424242
+
+
+def measure(client, name, method, url, **kwargs):
+    counters.update(checkout=0, commit=0)
+    resp = client.request(method, url, **kwargs)
+    print(f'{name:<28} {resp.status_code:>4} {counters["checkout"]:>9} {counters["commit"]:>7}')
+    return resp
+
+
+def main_():
+    with TestClient(main.app) as client:
+        headers = {'Authorization': 'Bearer ' + main.generate_token(0)}
+        print(f'{"endpoint":<28} {"code":>4} {"checkouts":>9} {"commits":>7}')
+        measure(client, 'GET categories', 'GET', '/api/categories')
+        measure(client, 'POST cart add', 'POST', f'/api/cart/{TG_ID}/add', json={'product_id': 1, 'qty': 1})
+        measure(client, 'POST cart sync (3 items)', 'POST', '/api/cart', json={
+            'user_id': TG_ID, 'items': [{'product_id': i, 'qty': 1} for i in (1, 2, 3)]})
+        measure(client, 'GET cart', 'GET', f'/api/cart/{TG_ID}')
+        measure(client, 'DELETE cart', 'DELETE', f'/api/cart/{TG_ID}')
+        r = measure(client, 'POST admin product', 'POST', '/api/admin/product', headers=headers,
+                    json={'name': 'Бенч ролл', 'category_id': 1, 'price': 100, 'tags': 'Новинка'})
+        measure(client, 'PUT admin product', 'PUT', f'/api/admin/product/{r.json()["id"]}', headers=headers,
+                json={'price': 120, 'tags': 'Новинка, Острое'})
+        r = measure(client, 'POST orders', 'POST', '/api/orders', json={
+            'user_id': TG_ID, 'items': [{'product_id': 1, 'name': 'x', 'qty': 1, 'price': 450}], 'phone': '1'})
+        measure(client, 'GET orders by tg', 'GET', f'/api/orders/{TG_ID}')
+        measure(client, 'POST admin order status', 'POST', f'/api/admin/order/{r.json()["order_id"]}/status',
+                headers=headers, json={'status': 'preparing'})
+        measure(client, 'POST payment webhook', 'POST', '/webhook/payment',
+                json={'order_id': r.json()['order_id'], 'status': 'paid'})
+
+
+if __name__ == '__main__':
+    sys.exit(main_())
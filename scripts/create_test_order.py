@@ -2,8 +2,10 @@ import asyncio
 import json
 from datetime import datetime
 
-from bot.services.db import AsyncSessionLocal, Product, Cart, Order
-from sqlalchemy import select, delete, text
+from shared.db import AsyncSessionLocal
+from shared.models import Product, Cart, Order
+from shared.repository import record_status_events
+from sqlalchemy import select, delete
 
 
 TEST_USER_ID = 123456789
@@ -16,9 +18,8 @@ async def main():
         await session.commit()
 
         # Возьмем первые 2 товара из каталога
-        # Запросим только нужные колонки, чтобы избежать несоответствий схемы
-        raw = await session.execute(text("SELECT id, name, price FROM products LIMIT 2"))
-        rows = raw.fetchall()
+        raw = await session.execute(select(Product.id, Product.name, Product.price).order_by(Product.id).limit(2))
+        rows = raw.all()
         if not rows:
             print("Нет товаров в базе — добавьте товары перед тестом.")
             return
@@ -57,6 +58,7 @@ async def main():
         )
         session.add(order)
         await session.flush()
+        await record_status_events(session, [order.id], order.status)
 
         # Очистим корзину
         await session.execute(delete(Cart).where(Cart.user_id == TEST_USER_ID))
@@ -0,0 +1 @@
+"""Database layer shared by the backend API and the Telegram bot."""
@@ -0,0 +1,350 @@
+"""Engine factory, schema setup and sample data for the shared database.
+
+Both processes (FastAPI backend and the bot) import the engine from here,
+so pool settings, indexes and migrations live in one place.
+
+Writes and checkout always go to the primary (`engine`). Reads that may
+be a few seconds old (statistics, exports, order history, catalog
+rebuilds) use `read_session()`. With READ_DATABASE_URL set, those go to
+the replica while its replication lag is below REPLICA_MAX_LAG seconds,
+and to the primary otherwise.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from . import metrics, tracing
+from .models import Base, Cart, Category, Order, Product
+
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite+aiosqlite:///./food.db')
+# optional read replica (hot standby); empty: every read goes to the primary
+READ_DATABASE_URL = os.getenv('READ_DATABASE_URL', '')
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', '10'))
+REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', '5'))
+
+# server databases (postgres): connections per process
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+POOL_MAX_OVERFLOW = int(os.getenv('DB_POOL_MAX_OVERFLOW', '10'))
+POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+# sqlite: both processes write the same file, wait for the lock instead of failing
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', '15'))
+SQLITE_WAL = os.getenv('SQLITE_WAL', '1') == '1'
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    if SQLITE_WAL:
+        # readers do not block the writer in the other process
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
+
+
+def create_engine(url: str = None, **kwargs):
+    """Async engine with the project-wide pool configuration."""
+    url = url or DATABASE_URL
+    kwargs.setdefault('echo', False)
+    kwargs.setdefault('pool_pre_ping', True)
+    if url.startswith('sqlite'):
+        kwargs.setdefault('connect_args', {'timeout': SQLITE_BUSY_TIMEOUT})
+    else:
+        kwargs.setdefault('pool_size', POOL_SIZE)
+        kwargs.setdefault('max_overflow', POOL_MAX_OVERFLOW)
+        kwargs.setdefault('pool_recycle', POOL_RECYCLE)
+    eng = create_async_engine(url, **kwargs)
+    if url.startswith('sqlite') and ':memory:' not in url:
+        event.listen(eng.sync_engine, 'connect', _sqlite_pragmas)
+    return eng
+
+
+engine = create_engine()
+metrics.instrument_engine(engine, 'primary')
+tracing.instrument_engine(engine, 'primary')
+AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+logger = logging.getLogger(__name__)
+
+# seconds the replica is behind; 0 when caught up, or when the server is not a standby
+_LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class EngineRouter:
+    """Chooses primary or replica for read-only sessions.
+
+    Replica lag is measured at most every check_interval seconds, during
+    a read, with one check at a time. A failed check counts as unlimited
+    lag until the next one. A reader that must see writes made at time T
+    passes fresh_since=T. The replica then serves it only if it has
+    replayed everything up to T.
+    """
+
+    def __init__(self, primary_sessions, replica_url: str = READ_DATABASE_URL, max_lag: float = REPLICA_MAX_LAG,
+                 check_interval: float = REPLICA_CHECK_INTERVAL):
+        self.primary_sessions = primary_sessions
+        self.replica = create_engine(replica_url) if replica_url else None
+        self.replica_sessions = (
+            sessionmaker(self.replica, class_=AsyncSession, expire_on_commit=False) if self.replica else None
+        )
+        if self.replica is not None:
+            metrics.instrument_engine(self.replica, 'replica')
+            tracing.instrument_engine(self.replica, 'replica')
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lag: Optional[float] = None
+        self._checked_at = float('-inf')
+        # wall-clock time of the last check: the replica had replayed up to _checked_wall - lag
+        self._checked_wall = 0.0
+        self._checking: Optional[asyncio.Lock] = None
+        self.stats = {'replica': 0, 'primary': 0, 'fallback': 0, 'checks': 0, 'check_errors': 0}
+
+    async def _check(self):
+        if self._checking is None:
+            self._checking = asyncio.Lock()
+        async with self._checking:
+            if time.monotonic() - self._checked_at < self.check_interval:
+                return
+            self.stats['checks'] += 1
+            try:
+                async with self.replica.connect() as conn:
+                    if self.replica.dialect.name == 'postgresql':
+                        self.lag = float(await conn.scalar(_LAG_SQL))
+                    else:
+                        await conn.execute(text('SELECT 1'))
+                        self.lag = 0.0
+            except Exception as e:
+                logger.warning('replica check failed, reading from the primary: %s', e)
+                self.stats['check_errors'] += 1
+                self.lag = None
+            self._checked_at = time.monotonic()
+            self._checked_wall = time.time()
+
+    async def use_replica(self, fresh_since: float = None) -> bool:
+        if self.replica is None:
+            return False
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            await self._check()
+        ok = self.lag is not None and self.lag <= self.max_lag
+        if ok and fresh_since is not None:
+            ok = self._checked_wall - self.lag > fresh_since
+        return ok
+
+    async def read_sessionmaker(self, fresh_since: float = None):
+        if await self.use_replica(fresh_since):
+            self.stats['replica'] += 1
+            return self.replica_sessions
+        self.stats['fallback' if self.replica is not None else 'primary'] += 1
+        return self.primary_sessions
+
+    async def close(self):
+        if self.replica is not None:
+            await self.replica.dispose()
+
+
+router = EngineRouter(AsyncSessionLocal)
+metrics.registry.stats('db_read_routing_total', 'Read sessions per target and replica lag checks',
+                       lambda: router.stats)
+metrics.registry.callback('db_replica_lag_seconds', 'Replication lag at the last check', (),
+                          lambda: [((), router.lag)])
+
+
+@asynccontextmanager
+async def read_session(fresh_since: float = None):
+    """Session for reads that tolerate replication lag (never write through it).
+
+    fresh_since: wall-clock time (time.time()) of a write the reader must see.
+    """
+    sessions = await router.read_sessionmaker(fresh_since)
+    async with sessions() as session:
+        yield session
+
+
+# INSERT/UPDATE ... RETURNING (order ids, status transitions, cart quantities)
+SQLITE_MIN_VERSION = (3, 35)
+
+
+async def init_db():
+    if engine.dialect.name == 'sqlite' and sqlite3.sqlite_version_info < SQLITE_MIN_VERSION:
+        raise RuntimeError(f'SQLite {sqlite3.sqlite_version} is too old, '
+                           f'{".".join(map(str, SQLITE_MIN_VERSION))} or newer is required')
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await _migrate_orders_autoincrement(conn)
+        await _migrate_legacy(conn)
+        await _migrate_cart_unique(conn)
+        await _migrate_photo_cascade(conn)
+        await conn.run_sync(_add_missing_indexes)
+        await _backfill_user_addresses(conn)
+
+
+def _add_missing_columns(conn):
+    """Add model columns missing from tables created by an older schema."""
+    insp = inspect(conn)
+    existing = set(insp.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        have = {c['name'] for c in insp.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in have or column.primary_key:
+                continue
+            col_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+
+
+def _add_missing_indexes(conn):
+    """Create model indexes added after the table itself was created."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+async def _migrate_orders_autoincrement(conn):
+    """Rebuild a SQLite orders table created without AUTOINCREMENT.
+
+    Without it SQLite reuses the ids of archived orders (max(id) + 1 of
+    what is left in orders), so the same id would exist in orders and
+    orders_archive. The sequence starts above the largest id of both.
+    """
+    if conn.dialect.name != 'sqlite':
+        return
+    ddl = (await conn.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'orders'"
+    ))).scalar()
+    if ddl is None or 'AUTOINCREMENT' in ddl.upper():
+        return
+    indexes = await conn.run_sync(lambda c: [i['name'] for i in inspect(c).get_indexes('orders')])
+    for name in indexes:
+        await conn.execute(text(f'DROP INDEX "{name}"'))
+    await conn.execute(text('ALTER TABLE orders RENAME TO orders_rebuild'))
+    await conn.run_sync(Order.__table__.create)
+    names = ', '.join(c.name for c in Order.__table__.columns)
+    await conn.execute(text(f'INSERT INTO orders ({names}) SELECT {names} FROM orders_rebuild'))
+    await conn.execute(text('DROP TABLE orders_rebuild'))
+    top = (await conn.execute(text(
+        "SELECT MAX(id) FROM (SELECT MAX(id) AS id FROM orders UNION ALL SELECT MAX(id) FROM orders_archive)"
+    ))).scalar() or 0
+    await conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'orders'"))
+    await conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('orders', :seq)"), {'seq': top})
+
+
+async def _migrate_legacy(conn):
+    """Copy data from the old backend schema (products.image, users.tg_id, JSON carts)."""
+    def columns(c):
+        insp = inspect(c)
+        return {t: {col['name'] for col in insp.get_columns(t)} for t in insp.get_table_names()}
+
+    tables = await conn.run_sync(columns)
+    if 'image' in tables.get('products', ()):
+        await conn.execute(text(
+            "UPDATE products SET image_url = image WHERE image_url IS NULL AND image IS NOT NULL AND image != ''"
+        ))
+    if 'delivery_type' in tables.get('orders', ()):
+        await conn.execute(text(
+            "UPDATE orders SET delivery_type = CASE WHEN address = 'Самовывоз' THEN 'pickup' ELSE 'delivery' END "
+            "WHERE delivery_type IS NULL"
+        ))
+    if 'tg_id' in tables.get('users', ()):
+        await conn.execute(text("UPDATE users SET telegram_id = tg_id WHERE telegram_id IS NULL"))
+    if 'items_json' in tables.get('carts', ()):
+        rows = (await conn.execute(text(
+            "SELECT carts.id, users.telegram_id, carts.items_json FROM carts "
+            "JOIN users ON users.id = carts.user_id "
+            "WHERE carts.items_json IS NOT NULL AND carts.items_json != '[]'"
+        ))).all()
+        # one line per (user, product): legacy carts may list a product twice
+        merged = {}
+        for _, telegram_id, items_json in rows:
+            for item in json.loads(items_json or '[]'):
+                if item.get('product_id') is not None:
+                    key = (telegram_id, item['product_id'])
+                    merged[key] = merged.get(key, 0) + int(item.get('qty', 1))
+        for (telegram_id, product_id), qty in merged.items():
+            # add to a line already in cart, so uq_cart_user_product holds whether or not it exists yet
+            params = {'u': telegram_id, 'p': product_id, 'q': qty, 't': datetime.utcnow()}
+            res = await conn.execute(text(
+                "UPDATE cart SET qty = qty + :q, updated_at = :t WHERE user_id = :u AND product_id = :p"
+            ), params)
+            if not res.rowcount:
+                await conn.execute(text(
+                    "INSERT INTO cart (user_id, product_id, qty, updated_at) VALUES (:u, :p, :q, :t)"
+                ), params)
+        for cart_id, _, _ in rows:
+            await conn.execute(text("UPDATE carts SET items_json = '[]' WHERE id = :id"), {'id': cart_id})
+
+
+async def _migrate_cart_unique(conn):
+    """Merge duplicate cart rows and add the unique index on databases created before it existed."""
+    indexes = await conn.run_sync(lambda c: [i['name'] for i in inspect(c).get_indexes('cart')])
+    if 'uq_cart_user_product' in indexes:
+        return
+    await conn.execute(text(
+        "UPDATE cart SET qty = (SELECT SUM(c2.qty) FROM cart c2 "
+        "WHERE c2.user_id = cart.user_id AND c2.product_id = cart.product_id) "
+        "WHERE id IN (SELECT MIN(id) FROM cart GROUP BY user_id, product_id HAVING COUNT(*) > 1)"
+    ))
+    await conn.execute(text(
+        "DELETE FROM cart WHERE id NOT IN (SELECT MIN(id) FROM cart GROUP BY user_id, product_id)"
+    ))
+    for index in Cart.__table__.indexes:
+        await conn.run_sync(index.create, checkfirst=True)
+
+
+async def _migrate_photo_cascade(conn):
+    """Recreate product_photos.product_id FK with ON DELETE CASCADE (PostgreSQL; SQLite does not enforce FKs)."""
+    if conn.dialect.name != 'postgresql':
+        return
+    fks = await conn.run_sync(lambda c: inspect(c).get_foreign_keys('product_photos'))
+    for fk in fks:
+        if fk['referred_table'] != 'products' or (fk.get('options') or {}).get('ondelete', '').upper() == 'CASCADE':
+            continue
+        await conn.execute(text(f'ALTER TABLE product_photos DROP CONSTRAINT "{fk["name"]}"'))
+        await conn.execute(text(
+            f'ALTER TABLE product_photos ADD CONSTRAINT "{fk["name"]}" '
+            'FOREIGN KEY (product_id) REFERENCES products (id) ON DELETE CASCADE'
+        ))
+
+
+async def _backfill_user_addresses(conn):
+    """Seed saved addresses from past delivery orders when user_addresses is new."""
+    if (await conn.execute(text("SELECT 1 FROM user_addresses LIMIT 1"))).first():
+        return
+    await conn.execute(text(
+        "INSERT INTO user_addresses (user_id, address, uses, last_used_at) "
+        "SELECT user_id, address, COUNT(*), MAX(created_at) FROM orders "
+        "WHERE user_id IS NOT NULL AND delivery_type = 'delivery' AND address IS NOT NULL AND address != '' "
+        "GROUP BY user_id, address"
+    ))
+
+
+async def create_sample_data():
+    from sqlalchemy import select
+    async with AsyncSessionLocal() as s:
+        res = await s.execute(select(Category.id).limit(1))
+        if res.first():
+            return
+        c1 = Category(title='Роллы', sort_order=1)
+        c2 = Category(title='Сэндвич-роллы', sort_order=2)
+        c3 = Category(title='Супы', sort_order=3)
+        s.add_all([c1, c2, c3])
+        await s.flush()
+        p1 = Product(name='Классический ролл', description='Рис, нори, лосось', price=450.0, category=c1, image_url='https://images.unsplash.com/photo-1562967916-eb82221dfb36', tags='Новинка', rating=4.5)
+        p2 = Product(name='Фирменный ролл', description='Тёплый ролл с сыром', price=520.0, category=c1, image_url='https://images.unsplash.com/photo-1546069901-ba9599a7e63c', tags='Выбор шефа', rating=4.8)
+        p3 = Product(name='Чикен ролл', description='Курочка и соус', price=350.0, category=c2, image_url='https://images.unsplash.com/photo-1604908177522-7d44e1a1b3e1', tags='', rating=4.2)
+        p4 = Product(name='Морковный суп', description='Тёплый овощной суп', price=230.0, category=c3, image_url='https://images.unsplash.com/photo-1504674900247-0877df9cc836', tags='Новинка', rating=4.0)
+        p5 = Product(name='Мiso суп', description='Японский суп', price=260.0, category=c3, image_url='https://images.unsplash.com/photo-1517248135467-4c7edcad34c4', tags='Выбор месяца', rating=4.6)
+        s.add_all([p1, p2, p3, p4, p5])
+        await s.commit()
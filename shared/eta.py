@@ -0,0 +1,165 @@
+"""Load-aware delivery ETA for new orders.
+
+Each process keeps an in-memory model that is updated in O(1) on every
+order insert and status change:
+
+* the open orders by status (the kitchen queue is new + paid + preparing);
+* kitchen time (creation until the order leaves the kitchen) as
+  ``base + per_order * queue``, an exponentially weighted least-squares fit
+  over finished orders, where queue is the number of kitchen orders ahead
+  when the order was placed;
+* exponentially weighted mean time spent in 'ready' and 'delivering'.
+
+Orders written by the other process are picked up by ``refresh``, which
+re-reads open orders and the stage history (order_status_events) every
+ETA_RESYNC_INTERVAL seconds.
+"""
+import math
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from . import order_status, repository
+
+ETA_RESYNC_INTERVAL = float(os.getenv('ETA_RESYNC_INTERVAL', '60'))
+# orders left open longer than this (never completed in the admin) are not queue
+ETA_OPEN_HOURS = float(os.getenv('ETA_OPEN_HOURS', '6'))
+# stage history used to seed the model
+ETA_HISTORY_DAYS = 7
+
+KITCHEN = frozenset({order_status.NEW, order_status.PAID, order_status.PREPARING})
+
+# priors (seconds) until there is history: 15 min cooking, 3 cooks
+DEFAULT_BASE = 15 * 60
+DEFAULT_PER_ORDER = 5 * 60
+DEFAULT_STAGE = {order_status.READY: 5 * 60, order_status.DELIVERING: 20 * 60}
+
+
+class EtaEstimator:
+    # weight of the newest observation in the stage means / decay of the fit
+    ALPHA = 0.1
+    DECAY = 0.98
+    # finished orders needed before the fitted slope replaces the prior
+    MIN_SAMPLES = 8
+
+    def __init__(self, resync_interval: float = ETA_RESYNC_INTERVAL):
+        self.resync_interval = resync_interval
+        self._synced_at: Optional[float] = None
+        # order id -> (status, entered status at, created at, kitchen queue at creation)
+        self._open: Dict[int, Tuple[str, datetime, datetime, Optional[int]]] = {}
+        self._counts: Counter = Counter()
+        self._kitchen = 0
+        self._stage = dict(DEFAULT_STAGE)
+        # weighted sums for kitchen_time ~ base + per_order * queue
+        self._w = self._q = self._qq = self._t = self._qt = 0.0
+        self._samples = 0
+        self.base = float(DEFAULT_BASE)
+        self.per_order = float(DEFAULT_PER_ORDER)
+
+    # --- incremental updates ---
+
+    def on_created(self, order_id: int, now: datetime = None):
+        now = now or datetime.utcnow()
+        self._enter(order_id, order_status.NEW, now, now, self._kitchen)
+
+    def on_transition(self, order_ids, status: str, now: datetime = None):
+        now = now or datetime.utcnow()
+        status = order_status.normalize(status)
+        for order_id in order_ids:
+            entry = self._leave(order_id)
+            if entry is None:
+                # created by the other process since the last refresh
+                created, queued = now, None
+            else:
+                old, entered, created, queued = entry
+                if old in self._stage:
+                    self._stage[old] += self.ALPHA * ((now - entered).total_seconds() - self._stage[old])
+                if old in KITCHEN and status not in KITCHEN and status != order_status.CANCELLED and queued is not None:
+                    self._observe(queued, (now - created).total_seconds())
+            if status not in order_status.FINAL:
+                self._enter(order_id, status, now, created, queued)
+
+    def _enter(self, order_id, status, entered, created, queued):
+        self._open[order_id] = (status, entered, created, queued)
+        self._counts[status] += 1
+        if status in KITCHEN:
+            self._kitchen += 1
+
+    def _leave(self, order_id):
+        entry = self._open.pop(order_id, None)
+        if entry is not None:
+            self._counts[entry[0]] -= 1
+            if entry[0] in KITCHEN:
+                self._kitchen -= 1
+        return entry
+
+    def _observe(self, queued: int, seconds: float):
+        d = self.DECAY
+        self._w = d * self._w + 1
+        self._q = d * self._q + queued
+        self._qq = d * self._qq + queued * queued
+        self._t = d * self._t + seconds
+        self._qt = d * self._qt + queued * seconds
+        self._samples += 1
+        mq, mt = self._q / self._w, self._t / self._w
+        var = self._qq / self._w - mq * mq
+        if self._samples >= self.MIN_SAMPLES and var > 0.25:
+            self.per_order = max(0.0, (self._qt / self._w - mq * mt) / var)
+        self.base = max(0.0, mt - self.per_order * mq)
+
+    # --- queries ---
+
+    @property
+    def kitchen_queue(self) -> int:
+        return self._kitchen
+
+    def count(self, status: str) -> int:
+        return self._counts[order_status.normalize(status)]
+
+    def estimate(self, delivery: bool = True) -> float:
+        """Seconds until an order placed now is ready (pickup) or delivered."""
+        seconds = self.base + self.per_order * self._kitchen
+        if delivery:
+            seconds += self._stage[order_status.READY] + self._stage[order_status.DELIVERING]
+        return seconds
+
+    def estimate_minutes(self, delivery: bool = True) -> int:
+        return math.ceil(self.estimate(delivery) / 60)
+
+    def estimate_text(self, delivery: bool = True) -> str:
+        minutes = self.estimate_minutes(delivery)
+        low = max(5, minutes // 5 * 5)
+        return f"{low}–{low + 10} минут"
+
+    # --- sync with the database ---
+
+    def stale(self) -> bool:
+        return self._synced_at is None or time.monotonic() - self._synced_at >= self.resync_interval
+
+    async def refresh(self, session, force: bool = False):
+        """Re-read open orders and stage history if the last sync is older than resync_interval."""
+        if not force and not self.stale():
+            return
+        now = datetime.utcnow()
+        rows = await repository.open_orders(session, now - timedelta(hours=ETA_OPEN_HOURS))
+        history = await repository.stage_durations(session, now - timedelta(days=ETA_HISTORY_DAYS), now)
+        previous, self._open = self._open, {}
+        self._counts, self._kitchen = Counter(), 0
+        for order_id, status, created, entered in rows:
+            queued = previous[order_id][3] if order_id in previous else None
+            self._enter(order_id, order_status.normalize(status), entered, created, queued)
+        if self._samples < self.MIN_SAMPLES:
+            # not enough local observations yet: start from the shared history
+            avg = {row['status']: row['avg'] for row in history if row['count'] >= self.MIN_SAMPLES}
+            for status in self._stage:
+                if avg.get(status):
+                    self._stage[status] = float(avg[status])
+            # time in 'preparing' is cooking itself; waiting in 'new' is what per_order * queue models
+            if avg.get(order_status.PREPARING):
+                self.base = float(avg[order_status.PREPARING])
+        self._synced_at = time.monotonic()
+
+
+estimator = EtaEstimator()
@@ -0,0 +1,269 @@
+"""In-process scheduler for periodic maintenance jobs.
+
+Each process (backend, bot) runs its own Scheduler. A job runs every
+`every` seconds, plus a random jitter so that processes started together
+do not hit the database at the same moment. Intervals are given as
+seconds or as strings like '30s', '10m', '6h', '1d'. JOB_<NAME>_EVERY
+overrides the interval, and '0' disables the job.
+
+Jobs that only touch process memory (token dicts, FSM storage) run
+everywhere. Jobs that change shared tables are registered with
+leader=True and run in one process at a time:
+
+- on PostgreSQL the runner holds pg_try_advisory_lock(<job key>) for the
+  duration of the run;
+- on SQLite it takes a lease in job_runs with a conditional UPDATE.
+
+The result of every run is written to job_runs. A process that finds the
+job finished elsewhere less than half an interval ago skips its turn, so
+two processes do not run the same cleanup back to back.
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Union
+
+from sqlalchemy import text
+
+from . import metrics, repository, tracing
+from .db import AsyncSessionLocal, engine
+
+logger = logging.getLogger(__name__)
+
+JOBS_ENABLED = os.getenv('JOBS_ENABLED', '1') == '1'
+# fraction of the interval added at random to every wait
+JOB_JITTER = float(os.getenv('JOB_JITTER', '0.1'))
+# SQLite lease length when the job does not set one
+JOB_LEASE = float(os.getenv('JOB_LEASE', '600'))
+
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+Interval = Union[int, float, str]
+
+
+def parse_interval(value: Interval) -> float:
+    """'90' / 90 -> 90.0, '10m' -> 600.0, '6h' -> 21600.0, '1d' -> 86400.0."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = value.strip().lower()
+    if value and value[-1] in _UNITS:
+        return float(value[:-1]) * _UNITS[value[-1]]
+    return float(value)
+
+
+@dataclass(slots=True)
+class JobStats:
+    runs: int = 0
+    failures: int = 0
+    # leader jobs: another process held the lock or ran the job recently
+    skipped: int = 0
+    total_seconds: float = 0.0
+    last_seconds: Optional[float] = None
+    last_run_at: Optional[datetime] = None
+    last_result: object = None
+    last_error: Optional[str] = None
+
+
+@dataclass(slots=True)
+class Job:
+    name: str
+    func: Callable[[], Awaitable[object]]
+    every: float
+    jitter: float = JOB_JITTER
+    leader: bool = False
+    # seconds before the first run (default: one jittered interval)
+    first_delay: Optional[float] = None
+    lease: float = JOB_LEASE
+    stats: JobStats = field(default_factory=JobStats)
+
+
+class Scheduler:
+    def __init__(self, owner: str = None):
+        # identifies this process in job_runs.owner
+        self.owner = owner or f'{socket.gethostname()}:{os.getpid()}'
+        self.jobs: Dict[str, Job] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def add(self, name: str, func: Callable[[], Awaitable[object]], every: Interval, *, jitter: float = JOB_JITTER,
+            leader: bool = False, first_delay: float = None, lease: float = JOB_LEASE) -> Optional[Job]:
+        """Register a job; returns None when its interval is 0 (disabled)."""
+        every = parse_interval(os.getenv(f'JOB_{name.upper()}_EVERY', every))
+        if every <= 0:
+            return None
+        job = self.jobs[name] = Job(name, func, every, jitter, leader, first_delay, lease)
+        return job
+
+    def start(self):
+        if not JOBS_ENABLED:
+            return
+        for name, job in self.jobs.items():
+            if name not in self._tasks:
+                self._tasks[name] = asyncio.get_running_loop().create_task(self._loop(job))
+
+    async def stop(self):
+        tasks, self._tasks = list(self._tasks.values()), {}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _delay(self, job: Job) -> float:
+        return job.every * (1 + random.uniform(0, job.jitter))
+
+    async def _loop(self, job: Job):
+        await asyncio.sleep(job.first_delay if job.first_delay is not None else self._delay(job))
+        while True:
+            await self.run(job.name)
+            await asyncio.sleep(self._delay(job))
+
+    async def run(self, name: str, force: bool = False) -> bool:
+        """Run a job now; True if it ran.
+
+        Leader jobs run only if this process gets the lock, and unless force
+        only if no process finished them in the last half interval.
+        """
+        job = self.jobs[name]
+        if not job.leader:
+            await self._execute(job)
+            return True
+        try:
+            if engine.dialect.name == 'postgresql':
+                return await self._run_advisory(job, force)
+            return await self._run_leased(job, force)
+        except Exception:
+            # lock bookkeeping failed (database down): try again next interval
+            logger.exception('job %s: could not acquire the lock', name)
+            job.stats.failures += 1
+            return False
+
+    async def _run_advisory(self, job: Job, force: bool) -> bool:
+        key = zlib.crc32(f'job:{job.name}'.encode())
+        async with engine.connect() as conn:
+            if not await conn.scalar(text('SELECT pg_try_advisory_lock(:k)'), {'k': key}):
+                job.stats.skipped += 1
+                return False
+            try:
+                return await self._run_if_due(job, force)
+            finally:
+                await conn.execute(text('SELECT pg_advisory_unlock(:k)'), {'k': key})
+                await conn.commit()
+
+    async def _run_leased(self, job: Job, force: bool) -> bool:
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as s:
+            leased = await repository.try_lease_job(s, job.name, self.owner, now, now + timedelta(seconds=job.lease))
+        if not leased:
+            job.stats.skipped += 1
+            return False
+        return await self._run_if_due(job, force)
+
+    async def _run_if_due(self, job: Job, force: bool) -> bool:
+        started = datetime.utcnow()
+        async with AsyncSessionLocal() as s:
+            finished = await repository.last_job_finish(s, job.name)
+        if not force and finished is not None and started - finished < timedelta(seconds=job.every / 2):
+            job.stats.skipped += 1
+            # give the lease back without recording a run
+            async with AsyncSessionLocal() as s:
+                await repository.release_job(s, job.name, self.owner)
+            return False
+        error = await self._execute(job)
+        async with AsyncSessionLocal() as s:
+            await repository.finish_job(s, job.name, self.owner, started, job.stats.last_seconds, error)
+        return True
+
+    async def _execute(self, job: Job) -> Optional[str]:
+        """Run the job function and update its stats; returns the error text if it failed."""
+        stats = job.stats
+        stats.last_run_at = datetime.utcnow()
+        t = time.perf_counter()
+        error = None
+        try:
+            # a trace of its own, not a child of whatever started the scheduler
+            with tracing.span(f'job {job.name}', trace_id=tracing.new_trace_id()):
+                stats.last_result = await job.func()
+        except Exception as e:
+            logger.exception('job %s failed', job.name)
+            stats.failures += 1
+            error = stats.last_error = f'{type(e).__name__}: {e}'
+        stats.runs += 1
+        stats.last_seconds = time.perf_counter() - t
+        stats.total_seconds += stats.last_seconds
+        return error
+
+    def snapshot(self) -> list:
+        """Per-job stats for the admin API."""
+        out = []
+        for job in self.jobs.values():
+            st = job.stats
+            out.append({
+                'name': job.name, 'every': job.every, 'leader': job.leader, 'running': job.name in self._tasks,
+                'runs': st.runs, 'failures': st.failures, 'skipped': st.skipped,
+                'avg_seconds': round(st.total_seconds / st.runs, 4) if st.runs else None,
+                'last_seconds': round(st.last_seconds, 4) if st.last_seconds is not None else None,
+                'last_run_at': st.last_run_at, 'last_result': st.last_result, 'last_error': st.last_error,
+            })
+        return out
+
+
+# --- jobs shared by both processes ---
+
+CART_TTL = parse_interval(os.getenv('CART_TTL', '14d'))
+
+
+async def expire_carts() -> int:
+    """Delete carts nobody touched for CART_TTL; returns removed lines."""
+    async with AsyncSessionLocal() as s:
+        removed = await repository.expire_carts(s, datetime.utcnow() - timedelta(seconds=CART_TTL))
+        await s.commit()
+    if removed:
+        logger.info('expired %d cart lines', removed)
+    return removed
+
+
+# orders moved per transaction, and per run at most ARCHIVE_BATCHES times that
+ARCHIVE_BATCH = int(os.getenv('ORDER_ARCHIVE_BATCH', '500'))
+ARCHIVE_BATCHES = 20
+
+
+async def archive_orders() -> int:
+    """Move completed/cancelled orders older than ORDER_ARCHIVE_AFTER_DAYS to orders_archive."""
+    before = datetime.utcnow() - timedelta(days=repository.ORDER_ARCHIVE_AFTER_DAYS)
+    moved = 0
+    for _ in range(ARCHIVE_BATCHES):
+        # short transactions: checkout writes wait for at most one batch
+        async with AsyncSessionLocal() as s:
+            n = await repository.archive_orders(s, before, ARCHIVE_BATCH)
+            await s.commit()
+        moved += n
+        if n < ARCHIVE_BATCH:
+            break
+    if moved:
+        logger.info('archived %d orders', moved)
+    return moved
+
+
+def add_shared_jobs(scheduler: Scheduler):
+    scheduler.add('expire_carts', expire_carts, '6h', leader=True, first_delay=60)
+    scheduler.add('archive_orders', archive_orders, '1h', leader=True, first_delay=90)
+
+
+scheduler = Scheduler()
+
+
+def _job_samples():
+    for job in scheduler.jobs.values():
+        for result in ('runs', 'failures', 'skipped'):
+            yield (job.name, result), getattr(job.stats, result)
+
+
+metrics.registry.callback('jobs_total', 'Scheduler runs, failures and skipped turns per job', ('job', 'result'),
+                          _job_samples, kind='counter')
+metrics.registry.callback('job_seconds_total', 'Time spent running each job', ('job',),
+                          lambda: (((job.name,), job.stats.total_seconds) for job in scheduler.jobs.values()),
+                          kind='counter')
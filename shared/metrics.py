@@ -0,0 +1,306 @@
+"""Prometheus metrics for the backend and the bot, without extra dependencies.
+
+Counters, histograms and callback metrics are kept in one registry per
+process and rendered in the Prometheus text format: by GET /metrics in
+the backend, and by a small aiohttp exporter in the bot (serve()).
+
+Instrumentation lives here as well:
+
+- instrument_engine(): query count and duration, errors and pool usage
+  through SQLAlchemy events;
+- TelegramMetrics: latency and errors of Bot API calls per method (aiogram
+  session middleware; telegram_call() for raw HTTP calls);
+- HandlerMetrics: time spent per bot handler (aiogram inner middleware).
+"""
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Sequence, Tuple
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# token for the /metrics endpoints (Authorization: Bearer ...); empty: open
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, '') for n in self.labelnames)
+
+    def header(self) -> list:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list:
+        return self.header() + [
+            f'{self.name}{_labels(self.labelnames, key)} {_number(v)}' for key, v in self.values.items()
+        ]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum]
+        self.values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t, **labels)
+
+    def render(self) -> list:
+        lines = self.header()
+        for key, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = 'le="%s"' % _number(bound)
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """Values read at scrape time: fn() -> iterable of (label values tuple, value)."""
+
+    def __init__(self, name, help, labelnames=(), fn: Callable[[], Iterable[Tuple[tuple, float]]] = None,
+                 kind: str = 'gauge'):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.fn = fn
+
+    def render(self) -> list:
+        try:
+            samples = list(self.fn())
+        except Exception:
+            logger.exception('metric %s failed', self.name)
+            return []
+        return self.header() + [
+            f'{self.name}{_labels(self.labelnames, key)} {_number(v)}' for key, v in samples if v is not None
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        # re-registering a name (module reload, second engine) keeps the first instance
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name, help, labelnames, fn, kind='gauge') -> CallbackMetric:
+        """Register or replace a metric computed at scrape time."""
+        metric = self.metrics[name] = CallbackMetric(name, help, labelnames, fn, kind)
+        return metric
+
+    def stats(self, name, help, source: Callable[[], dict], kind='counter', label='kind') -> CallbackMetric:
+        """Expose a {key: number} stats dict (e.g. EditRenderer.stats) as one labelled metric."""
+        return self.callback(name, help, (label,), lambda: (((k,), v) for k, v in source().items()), kind)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+http_duration = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route template', ('method', 'route', 'status'))
+errors = registry.counter('app_errors_total', 'Errors caught and logged instead of raised', ('where',))
+
+
+# --- database ---
+
+db_duration = registry.histogram(
+    'db_query_duration_seconds', 'SQL statement duration', ('engine', 'statement'),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+db_errors = registry.counter('db_errors_total', 'SQL statements that raised', ('engine',))
+_pools: Dict[str, object] = {}
+
+
+def _statement_kind(statement: str) -> str:
+    word = statement.lstrip(' (\n').split(None, 1)[0].upper() if statement.strip() else ''
+    return word if word in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH') else 'OTHER'
+
+
+def _pool_samples():
+    for name, pool in _pools.items():
+        for state, getter in (('checked_out', 'checkedout'), ('idle', 'checkedin'), ('overflow', 'overflow'),
+                              ('size', 'size')):
+            fn = getattr(pool, getter, None)
+            if fn is not None:
+                yield (name, state), fn()
+
+
+registry.callback('db_pool_connections', 'Connection pool usage', ('engine', 'state'), _pool_samples)
+
+
+def instrument_engine(engine, name: str):
+    """Time every statement of an (async) engine and expose its pool."""
+    sync_engine = getattr(engine, 'sync_engine', engine)
+    _pools[name] = sync_engine.pool
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def _end(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('query_start')
+        if starts:
+            db_duration.observe(time.perf_counter() - starts.pop(), engine=name, statement=_statement_kind(statement))
+
+    @event.listens_for(sync_engine, 'handle_error')
+    def _error(context):
+        db_errors.inc(engine=name)
+        conn = context.connection
+        if conn is not None and conn.info.get('query_start'):
+            conn.info['query_start'].pop()
+
+
+# --- Telegram ---
+
+tg_duration = registry.histogram('telegram_request_duration_seconds', 'Bot API call latency', ('method',))
+tg_errors = registry.counter('telegram_errors_total', 'Failed Bot API calls', ('method', 'error'))
+
+
+@contextmanager
+def telegram_call(method: str):
+    """Measure a Bot API call made without aiogram (e.g. plain httpx)."""
+    t = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        tg_errors.inc(method=method, error=type(e).__name__)
+        raise
+    finally:
+        tg_duration.observe(time.perf_counter() - t, method=method)
+
+
+class TelegramMetrics:
+    """aiogram session middleware: bot.session.middleware(TelegramMetrics())."""
+
+    async def __call__(self, make_request, bot, method):
+        with telegram_call(getattr(method, '__api_method__', type(method).__name__)):
+            return await make_request(bot, method)
+
+
+handler_duration = registry.histogram(
+    'bot_handler_duration_seconds', 'Time to handle one update, per handler', ('event', 'handler'))
+handler_errors = registry.counter('bot_handler_errors_total', 'Handlers that raised', ('event', 'handler'))
+
+
+class HandlerMetrics:
+    """aiogram inner middleware timing the handler chosen for the event."""
+
+    def __init__(self, event_type: str):
+        self.event_type = event_type
+
+    async def __call__(self, handler, event, data):
+        callback = getattr(data.get('handler'), 'callback', None)
+        name = getattr(callback, '__qualname__', None) or 'unknown'
+        t = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(event=self.event_type, handler=name)
+            raise
+        finally:
+            handler_duration.observe(time.perf_counter() - t, event=self.event_type, handler=name)
+
+
+def instrument_dispatcher(dp):
+    """Time the handlers of every router included in the dispatcher."""
+    for router in dp.chain_tail:
+        for event_type, observer in router.observers.items():
+            if event_type not in ('update', 'error'):
+                observer.middleware(HandlerMetrics(event_type))
+
+
+# --- exporter for processes without an HTTP server (the bot) ---
+
+def authorized(header: str) -> bool:
+    return not METRICS_TOKEN or header == f'Bearer {METRICS_TOKEN}'
+
+
+async def serve(port: int, host: str = '0.0.0.0'):
+    """Serve GET /metrics on host:port; returns the aiohttp runner (await runner.cleanup() to stop)."""
+    from aiohttp import web
+
+    async def metrics(request):
+        if not authorized(request.headers.get('Authorization', '')):
+            return web.Response(status=401)
+        return web.Response(body=registry.render().encode(), headers={'Content-Type': CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get('/metrics', metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
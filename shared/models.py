@@ -0,0 +1,196 @@
+"""ORM models shared by the backend API and the Telegram bot.
+
+Column names follow the production database (food.db): users.telegram_id,
+products.image_url, one cart row per (user, product), and orders.user_id
+holding the customer's Telegram id.  The backend spellings (image, tg_id)
+are kept as synonyms.
+"""
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Column, DateTime, Float, ForeignKey, Index, Integer, String, Table, Text
+from sqlalchemy.orm import declarative_base, relationship, synonym
+
+Base = declarative_base()
+
+
+class Category(Base):
+    __tablename__ = 'categories'
+    id = Column(Integer, primary_key=True)
+    title = Column(String, unique=True, nullable=False)
+    sort_order = Column(Integer, default=0)
+    products = relationship('Product', back_populates='category')
+
+
+# product <-> tag association (Product.tags keeps the display string)
+product_tags = Table(
+    'product_tags', Base.metadata,
+    Column('product_id', Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True),
+    Column('tag_id', Integer, ForeignKey('tags.id', ondelete='CASCADE'), primary_key=True, index=True),
+)
+
+
+class Tag(Base):
+    __tablename__ = 'tags'
+    id = Column(Integer, primary_key=True)
+    title = Column(String, unique=True, nullable=False)
+    products = relationship('Product', secondary=product_tags, back_populates='tag_items')
+
+
+class Product(Base):
+    __tablename__ = 'products'
+    id = Column(Integer, primary_key=True)
+    category_id = Column(Integer, ForeignKey('categories.id'), index=True)
+    name = Column(String, nullable=False)
+    description = Column(Text)
+    price = Column(Float, nullable=False)
+    image_url = Column(String)
+    image = synonym('image_url')
+    tags = Column(String)  # comma-separated
+    rating = Column(Float, default=0.0)
+    category = relationship('Category', back_populates='products')
+    tag_items = relationship('Tag', secondary=product_tags, back_populates='products')
+
+
+class User(Base):
+    __tablename__ = 'users'
+    id = Column(Integer, primary_key=True)
+    telegram_id = Column(BigInteger, unique=True, nullable=False)
+    tg_id = synonym('telegram_id')
+    name = Column(String)
+    phone = Column(String)
+
+
+class UserAddress(Base):
+    """Delivery addresses a customer has used, most recent first"""
+    __tablename__ = 'user_addresses'
+    __table_args__ = (Index('uq_user_addresses_user_address', 'user_id', 'address', unique=True),)
+    id = Column(Integer, primary_key=True)
+    # Telegram id, like orders.user_id
+    user_id = Column(BigInteger, nullable=False)
+    address = Column(String, nullable=False)
+    uses = Column(Integer, nullable=False, default=1)
+    last_used_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Order(Base):
+    __tablename__ = 'orders'
+    # keyset pages of a customer's history: WHERE user_id = ? AND id < ? ORDER BY id DESC
+    # sqlite: AUTOINCREMENT, so ids of archived orders are never handed out again
+    __table_args__ = (Index('ix_orders_user_id_id', 'user_id', 'id'), {'sqlite_autoincrement': True})
+    id = Column(Integer, primary_key=True)
+    # Telegram id of the customer (also the chat for status notifications)
+    user_id = Column(BigInteger, index=True)
+    items_json = Column(Text)
+    total_price = Column(Float)
+    address = Column(String)
+    name = Column(String)
+    phone = Column(String)
+    payment_method = Column(String)
+    delivery_type = Column(String, default='delivery')
+    status = Column(String, default='new')
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # trace of the checkout that created the order (shared.tracing)
+    trace_id = Column(String(32))
+
+
+class ArchivedOrder(Base):
+    """Completed and cancelled orders moved out of `orders` by the archive job (same columns).
+
+    On PostgreSQL the table is partitioned by month of created_at; the
+    archive job creates the partitions it needs.
+    """
+    __tablename__ = 'orders_archive'
+    __table_args__ = (
+        Index('ix_orders_archive_user_id_id', 'user_id', 'id'),
+        Index('ix_orders_archive_created_at', 'created_at'),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(BigInteger)
+    items_json = Column(Text)
+    total_price = Column(Float)
+    address = Column(String)
+    name = Column(String)
+    phone = Column(String)
+    payment_method = Column(String)
+    delivery_type = Column(String)
+    status = Column(String)
+    # part of the key: partitioned tables need the partition column in it
+    created_at = Column(DateTime, primary_key=True)
+    trace_id = Column(String(32))
+
+
+class OrderStatusEvent(Base):
+    """Append-only log of status changes: one row per order per status entered"""
+    __tablename__ = 'order_status_events'
+    __table_args__ = (Index('ix_order_status_events_order_ts', 'order_id', 'ts'),)
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, nullable=False)
+    status = Column(String, nullable=False)
+    ts = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class GeocodedAddress(Base):
+    """Coordinates per normalized address; filled from WebApp suggestions or the geocoder"""
+    __tablename__ = 'geocode_cache'
+    key = Column(String, primary_key=True)
+    address = Column(String, nullable=False)
+    lat = Column(Float, nullable=False)
+    lon = Column(Float, nullable=False)
+    source = Column(String)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Cart(Base):
+    __tablename__ = 'cart'
+    # one row per (user, product); quantity changes are in-place updates
+    __table_args__ = (Index('uq_cart_user_product', 'user_id', 'product_id', unique=True),)
+    id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, nullable=False)  # Telegram id
+    product_id = Column(Integer, ForeignKey('products.id'))
+    qty = Column(Integer, default=1)
+    # last change of this line; carts untouched for CART_TTL are expired by the cleanup job
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    product = relationship('Product')
+
+
+class CatalogVersion(Base):
+    """Single row bumped on every catalog write; caches in both processes poll it"""
+    __tablename__ = 'catalog_version'
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class MenuSession(Base):
+    """Last menu message per chat (persisted MenuUI state)"""
+    __tablename__ = 'menu_sessions'
+    chat_id = Column(BigInteger, primary_key=True)
+    message_id = Column(BigInteger, nullable=False)
+    state = Column(String, nullable=False)
+    category_id = Column(Integer)
+    product_id = Column(Integer)
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class ProductPhoto(Base):
+    """Telegram file_id of a product photo, valid while image_url is unchanged"""
+    __tablename__ = 'product_photos'
+    product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    image_url = Column(String, nullable=False)
+    file_id = Column(String, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class JobRun(Base):
+    """Lease and last result of a scheduled maintenance job (shared by all processes)"""
+    __tablename__ = 'job_runs'
+    name = Column(String, primary_key=True)
+    # process holding the lease and until when (SQLite; PostgreSQL uses advisory locks)
+    owner = Column(String)
+    locked_until = Column(DateTime)
+    last_started_at = Column(DateTime)
+    last_finished_at = Column(DateTime)
+    last_status = Column(String)
+    last_error = Column(Text)
+    last_duration = Column(Float)
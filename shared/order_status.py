@@ -0,0 +1,68 @@
+"""Order status state machine shared by the admin API, payments and the bot.
+
+Every status change goes through ``TRANSITIONS``: a status can only be set
+on orders currently in one of its predecessor states, which lets the
+repository apply it as a single conditional UPDATE.
+"""
+from typing import Dict, FrozenSet
+
+NEW = 'new'
+PAID = 'paid'
+PREPARING = 'preparing'
+READY = 'ready'
+DELIVERING = 'delivering'
+COMPLETED = 'completed'
+CANCELLED = 'cancelled'
+
+# status -> statuses it may move to
+TRANSITIONS: Dict[str, FrozenSet[str]] = {
+    NEW: frozenset({PAID, PREPARING, CANCELLED}),
+    PAID: frozenset({PREPARING, CANCELLED}),
+    PREPARING: frozenset({READY, CANCELLED}),
+    READY: frozenset({DELIVERING, COMPLETED, CANCELLED}),
+    DELIVERING: frozenset({COMPLETED, CANCELLED}),
+    COMPLETED: frozenset(),
+    CANCELLED: frozenset(),
+}
+STATUSES = frozenset(TRANSITIONS)
+FINAL = frozenset(s for s, nxt in TRANSITIONS.items() if not nxt)
+
+# spellings written by older code, treated as the canonical status
+ALIASES = {'processing': PREPARING}
+
+TITLES = {
+    NEW: '🆕 Новый',
+    PAID: '💳 Оплачен',
+    PREPARING: '👨‍🍳 Готовится',
+    READY: '✅ Готов',
+    DELIVERING: '🚗 Доставляется',
+    COMPLETED: '🎉 Завершён',
+    CANCELLED: '❌ Отменён',
+}
+
+
+class InvalidTransition(ValueError):
+    """The target status is unknown or not reachable from the order's status."""
+
+
+def normalize(status: str) -> str:
+    return ALIASES.get(status, status)
+
+
+def title(status: str) -> str:
+    status = normalize(status)
+    return TITLES.get(status, status)
+
+
+def can_transition(current: str, target: str) -> bool:
+    return normalize(target) in TRANSITIONS.get(normalize(current), ())
+
+
+def predecessors(target: str) -> FrozenSet[str]:
+    """Stored statuses from which target is reachable, legacy spellings included."""
+    target = normalize(target)
+    if target not in STATUSES:
+        raise InvalidTransition(f'unknown status: {target}')
+    allowed = {s for s, nxt in TRANSITIONS.items() if target in nxt}
+    allowed |= {old for old, new in ALIASES.items() if new in allowed}
+    return frozenset(allowed)
@@ -0,0 +1,561 @@
+"""Queries shared by the backend and the bot.
+
+Every function takes an open AsyncSession and leaves committing to the
+caller unless noted, so several calls can share one transaction.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+from sqlalchemy import case, delete, func, literal, select, text, union_all, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import order_status
+from .models import (
+    ArchivedOrder, Cart, CatalogVersion, GeocodedAddress, JobRun, Order, OrderStatusEvent, Product, Tag, User,
+    UserAddress, product_tags,
+)
+
+# how often in-process catalog caches check catalog_version for edits made elsewhere
+CATALOG_POLL_INTERVAL = float(os.getenv('CATALOG_POLL_INTERVAL', '5'))
+# completed/cancelled orders older than this are moved to orders_archive
+ORDER_ARCHIVE_AFTER_DAYS = float(os.getenv('ORDER_ARCHIVE_AFTER_DAYS', '7'))
+
+
+def _insert(session: AsyncSession, table):
+    # INSERT ... ON CONFLICT is dialect specific
+    if session.bind.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+# --- catalog ---
+
+def parse_tags(tags) -> list:
+    # "Новинка, Выбор шефа" -> ['Новинка', 'Выбор шефа'] (order kept, no dups)
+    out = []
+    for t in (tags or '').split(','):
+        t = t.strip()
+        if t and t not in out:
+            out.append(t)
+    return out
+
+
+async def set_product_tags(session: AsyncSession, product_id: int, tags):
+    titles = parse_tags(tags)
+    await session.execute(delete(product_tags).where(product_tags.c.product_id == product_id))
+    if not titles:
+        return
+    res = await session.execute(select(Tag).where(Tag.title.in_(titles)))
+    by_title = {t.title: t for t in res.scalars().all()}
+    for title in titles:
+        if title not in by_title:
+            t = Tag(title=title)
+            session.add(t)
+            by_title[title] = t
+    await session.flush()
+    await session.execute(product_tags.insert(), [{'product_id': product_id, 'tag_id': by_title[t].id} for t in titles])
+
+
+async def list_product_tags(session: AsyncSession) -> List[Tuple[int, str]]:
+    """(product_id, tag title) pairs for the catalog caches."""
+    res = await session.execute(
+        select(product_tags.c.product_id, Tag.title).join(Tag, Tag.id == product_tags.c.tag_id)
+    )
+    return res.all()
+
+
+async def bump_catalog_version(session: AsyncSession) -> int:
+    """Mark the catalog as changed; call in the same transaction as the write."""
+    table = CatalogVersion.__table__
+    stmt = _insert(session, table).values(id=1, version=1, updated_at=datetime.utcnow())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['id'],
+        set_={'version': table.c.version + 1, 'updated_at': datetime.utcnow()},
+    ).returning(table.c.version)
+    return (await session.execute(stmt)).scalar_one()
+
+
+async def get_catalog_version(session: AsyncSession) -> int:
+    res = await session.execute(select(CatalogVersion.version).where(CatalogVersion.id == 1))
+    return res.scalar_one_or_none() or 0
+
+
+# --- users ---
+
+async def get_or_create_user(session: AsyncSession, telegram_id: int, name: str = None, phone: str = None) -> User:
+    res = await session.execute(select(User).where(User.telegram_id == telegram_id))
+    user = res.scalars().first()
+    if user is None:
+        user = User(telegram_id=telegram_id, name=name, phone=phone)
+        session.add(user)
+        await session.flush()
+    return user
+
+
+async def save_customer(session: AsyncSession, telegram_id: int, name: str = None, phone: str = None,
+                        address: str = None) -> None:
+    """Remember the latest name/phone (None keeps the stored value) and bump a delivery address."""
+    users = User.__table__
+    stmt = _insert(session, users).values(telegram_id=telegram_id, name=name, phone=phone)
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=['telegram_id'],
+        set_={'name': func.coalesce(stmt.excluded.name, users.c.name),
+              'phone': func.coalesce(stmt.excluded.phone, users.c.phone)},
+    ))
+    if address:
+        table = UserAddress.__table__
+        stmt = _insert(session, table).values(user_id=telegram_id, address=address, uses=1, last_used_at=datetime.utcnow())
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=['user_id', 'address'],
+            set_={'uses': table.c.uses + 1, 'last_used_at': stmt.excluded.last_used_at},
+        ))
+
+
+async def customer_profile(session: AsyncSession, telegram_id: int, addresses: int = 5, orders: int = 5):
+    """(name, phone) row, recent addresses and recent order rows of a customer."""
+    user = (await session.execute(
+        select(User.name, User.phone).where(User.telegram_id == telegram_id)
+    )).first()
+    recent_addresses = (await session.execute(
+        select(UserAddress.address).where(UserAddress.user_id == telegram_id)
+        .order_by(UserAddress.last_used_at.desc()).limit(addresses)
+    )).scalars().all()
+    src = orders_with_archive()
+    recent_orders = (await session.execute(
+        select(src.c.id, src.c.created_at, src.c.total_price, src.c.status, src.c.items_json, src.c.address,
+               src.c.payment_method, src.c.delivery_type)
+        .where(src.c.user_id == telegram_id).order_by(src.c.id.desc()).limit(orders)
+    )).all()
+    return user, recent_addresses, recent_orders
+
+
+# --- cart (keyed by Telegram id) ---
+
+async def change_cart_qty(session: AsyncSession, user_id: int, product_id: int, delta: int) -> int:
+    """Atomically add delta to a cart line, removing it at zero. Returns the new qty.
+
+    Increments are a single upsert; decrements a single conditional
+    UPDATE (plus a DELETE only when the line reaches zero).
+    """
+    table = Cart.__table__
+    if delta > 0:
+        stmt = _insert(session, table).values(user_id=user_id, product_id=product_id, qty=delta)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'product_id'],
+            set_={'qty': table.c.qty + delta, 'updated_at': datetime.utcnow()},
+        ).returning(table.c.qty)
+        return (await session.execute(stmt)).scalar_one()
+    res = await session.execute(
+        update(Cart)
+        .where(Cart.user_id == user_id, Cart.product_id == product_id, Cart.qty > -delta)
+        .values(qty=Cart.qty + delta)
+        .returning(Cart.qty)
+    )
+    qty = res.scalar_one_or_none()
+    if qty is None:
+        await session.execute(delete(Cart).where(Cart.user_id == user_id, Cart.product_id == product_id))
+        qty = 0
+    return qty
+
+
+async def get_cart_qty(session: AsyncSession, user_id: int, product_id: int) -> int:
+    res = await session.execute(select(Cart.qty).where(Cart.user_id == user_id, Cart.product_id == product_id))
+    return res.scalar_one_or_none() or 0
+
+
+async def cart_lines(session: AsyncSession, user_id: int) -> List[Tuple[Product, int]]:
+    """(product, qty) for every cart line, in the order they were added."""
+    res = await session.execute(
+        select(Product, Cart.qty)
+        .join(Cart, Cart.product_id == Product.id)
+        .where(Cart.user_id == user_id)
+        .order_by(Cart.id)
+    )
+    return res.all()
+
+
+async def replace_cart(session: AsyncSession, user_id: int, items) -> None:
+    """Replace the cart with items ({'product_id', 'qty'}), merging repeated products."""
+    merged = {}
+    for item in items:
+        merged[item['product_id']] = merged.get(item['product_id'], 0) + item.get('qty', 1)
+    rows = [{'user_id': user_id, 'product_id': pid, 'qty': qty} for pid, qty in merged.items() if qty > 0]
+    await session.execute(delete(Cart).where(Cart.user_id == user_id))
+    if rows:
+        await session.execute(Cart.__table__.insert(), rows)
+
+
+async def clear_cart(session: AsyncSession, user_id: int) -> None:
+    await session.execute(delete(Cart).where(Cart.user_id == user_id))
+
+
+async def cart_from_items(session: AsyncSession, user_id: int, items) -> int:
+    """Replace the cart with order items ({'product_id', 'qty'}); returns the number of lines.
+
+    One INSERT ... SELECT from products, so products deleted since the
+    order was placed are skipped without loading them.
+    """
+    qty = {}
+    for item in items:
+        if item.get('product_id'):
+            qty[int(item['product_id'])] = qty.get(int(item['product_id']), 0) + int(item.get('qty') or 1)
+    await session.execute(delete(Cart).where(Cart.user_id == user_id))
+    if not qty:
+        return 0
+    rows = (
+        select(literal(user_id), Product.id, case(qty, value=Product.id), literal(datetime.utcnow()))
+        .where(Product.id.in_(list(qty)))
+    )
+    res = await session.execute(
+        Cart.__table__.insert().from_select(['user_id', 'product_id', 'qty', 'updated_at'], rows)
+    )
+    return res.rowcount
+
+
+async def expire_carts(session: AsyncSession, before: datetime) -> int:
+    """Delete carts whose newest line is older than before; returns the number of lines removed.
+
+    Lines from before carts had updated_at are stamped now, so they expire
+    one full TTL after the first sweep.
+    """
+    await session.execute(update(Cart).where(Cart.updated_at.is_(None)).values(updated_at=datetime.utcnow()))
+    stale = select(Cart.user_id).group_by(Cart.user_id).having(func.max(Cart.updated_at) < before)
+    res = await session.execute(delete(Cart).where(Cart.user_id.in_(stale)))
+    return res.rowcount
+
+
+# --- orders ---
+
+async def order_items(session: AsyncSession, user_id: int, order_id: int):
+    """Parsed items_json of the customer's order, or None if it is not theirs."""
+    src = orders_with_archive()
+    items_json = (await session.execute(
+        select(src.c.items_json).where(src.c.id == order_id, src.c.user_id == user_id)
+    )).scalar_one_or_none()
+    return None if items_json is None else json.loads(items_json or '[]')
+
+
+# --- order archive (hot `orders`, cold `orders_archive`) ---
+
+ORDER_COLUMN_NAMES = [c.name for c in Order.__table__.columns]
+
+
+def orders_with_archive():
+    """`orders` UNION ALL `orders_archive` as a subquery with the order columns.
+
+    Filter on its columns (src.c.user_id, src.c.created_at, ...): both
+    PostgreSQL and SQLite push the conditions into each branch, so the
+    per-table indexes are used.
+    """
+    return union_all(
+        select(*[Order.__table__.c[name] for name in ORDER_COLUMN_NAMES]),
+        select(*[ArchivedOrder.__table__.c[name] for name in ORDER_COLUMN_NAMES]),
+    ).subquery('orders_all')
+
+
+async def list_orders(session: AsyncSession, columns, date_from: datetime = None, date_to: datetime = None) -> list:
+    """Rows of the named order columns with date_from <= created_at < date_to, newest first.
+
+    Without date_from only the hot table is read (open orders and the last
+    ORDER_ARCHIVE_AFTER_DAYS). The archive is added only when date_from
+    reaches back to archived orders.
+    """
+    src = Order.__table__
+    if date_from is not None and date_from < datetime.utcnow() - timedelta(days=ORDER_ARCHIVE_AFTER_DAYS):
+        until = await archived_until(session)
+        if until is not None and date_from <= until:
+            src = orders_with_archive()
+    stmt = select(*[src.c[name] for name in columns]).order_by(src.c.created_at.desc(), src.c.id.desc())
+    if date_from is not None:
+        stmt = stmt.where(src.c.created_at >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(src.c.created_at < date_to)
+    return (await session.execute(stmt)).all()
+
+
+async def order_totals(session: AsyncSession, date_from: datetime = None) -> Tuple[int, float]:
+    """(number of orders, sum of total_price) created at or after date_from, counted in the database.
+
+    Each table is aggregated on its own; the archive only when date_from
+    is None (all time) or older than ORDER_ARCHIVE_AFTER_DAYS.
+    """
+    tables = [Order.__table__]
+    if date_from is None or date_from < datetime.utcnow() - timedelta(days=ORDER_ARCHIVE_AFTER_DAYS):
+        tables.append(ArchivedOrder.__table__)
+    count, revenue = 0, 0.0
+    for table in tables:
+        stmt = select(func.count(), func.coalesce(func.sum(table.c.total_price), 0))
+        if date_from is not None:
+            stmt = stmt.where(table.c.created_at >= date_from)
+        n, total = (await session.execute(stmt)).one()
+        count += n
+        revenue += float(total)
+    return count, revenue
+
+
+async def archived_until(session: AsyncSession):
+    """created_at of the newest archived order (None if the archive is empty)."""
+    return (await session.execute(select(func.max(ArchivedOrder.created_at)))).scalar()
+
+
+async def archive_orders(session: AsyncSession, before: datetime, limit: int = 500) -> int:
+    """Move up to limit final (completed/cancelled) orders created before `before` to the archive.
+
+    Returns the number moved; call again (after committing) until it
+    returns less than limit.
+    """
+    rows = (await session.execute(
+        select(Order.id, Order.created_at)
+        .where(Order.status.in_(order_status.FINAL), Order.created_at < before)
+        .order_by(Order.id)
+        .limit(limit)
+    )).all()
+    if not rows:
+        return 0
+    ids = [order_id for order_id, _ in rows]
+    if session.bind.dialect.name == 'postgresql':
+        await _ensure_archive_partitions(session, {(ts.year, ts.month) for _, ts in rows})
+    columns = [Order.__table__.c[name] for name in ORDER_COLUMN_NAMES]
+    await session.execute(
+        ArchivedOrder.__table__.insert().from_select(ORDER_COLUMN_NAMES, select(*columns).where(Order.id.in_(ids)))
+    )
+    await session.execute(delete(Order).where(Order.id.in_(ids)))
+    return len(ids)
+
+
+async def _ensure_archive_partitions(session: AsyncSession, months) -> None:
+    for year, month in sorted(months):
+        nxt = (year + month // 12, month % 12 + 1)
+        await session.execute(text(
+            f"CREATE TABLE IF NOT EXISTS orders_archive_y{year}m{month:02d} PARTITION OF orders_archive "
+            f"FOR VALUES FROM ('{year}-{month:02d}-01') TO ('{nxt[0]}-{nxt[1]:02d}-01')"
+        ))
+
+
+async def list_user_orders(session: AsyncSession, user_id: int) -> List[Order]:
+    res = await session.execute(select(Order).where(Order.user_id == user_id).order_by(Order.created_at.desc()))
+    return res.scalars().all()
+
+
+async def user_orders_page(session: AsyncSession, user_id: int, before_id: int = None, limit: int = 20) -> list:
+    """Summary rows of a customer's orders with id < before_id, newest first (keyset page)."""
+    src = orders_with_archive()
+    stmt = (
+        select(src.c.id, src.c.created_at, src.c.total_price, src.c.status, src.c.delivery_type)
+        .where(src.c.user_id == user_id)
+        .order_by(src.c.id.desc())
+        .limit(limit)
+    )
+    if before_id is not None:
+        stmt = stmt.where(src.c.id < before_id)
+    return (await session.execute(stmt)).all()
+
+
+async def order_events_after(session: AsyncSession, after_id: int = None) -> Tuple[int, set]:
+    """(last event id, Telegram ids whose orders changed since after_id).
+
+    With after_id None only the current last id is returned, to start
+    watching from now.
+    """
+    if after_id is None:
+        last = (await session.execute(select(func.max(OrderStatusEvent.id)))).scalar()
+        return last or 0, set()
+    rows = (await session.execute(
+        select(OrderStatusEvent.id, Order.user_id)
+        .outerjoin(Order, Order.id == OrderStatusEvent.order_id)
+        .where(OrderStatusEvent.id > after_id)
+    )).all()
+    return max((event_id for event_id, _ in rows), default=after_id), {user_id for _, user_id in rows if user_id}
+
+
+async def transition_orders(session: AsyncSession, order_ids, status: str) -> List[Tuple[int, int]]:
+    """Move orders to status where the state machine allows it.
+
+    One conditional UPDATE ... WHERE status IN (predecessors) for the whole
+    batch, no read first. Returns (order id, Telegram id) of the orders that
+    actually moved; the rest were missing or in a state that forbids it.
+    """
+    status = order_status.normalize(status)
+    res = await session.execute(
+        update(Order)
+        .where(Order.id.in_(list(order_ids)), Order.status.in_(order_status.predecessors(status)))
+        .values(status=status)
+        .returning(Order.id, Order.user_id)
+        .execution_options(synchronize_session=False)
+    )
+    moved = res.all()
+    await record_status_events(session, [order_id for order_id, _ in moved], status)
+    return moved
+
+
+async def order_statuses(session: AsyncSession, order_ids) -> dict:
+    """Current status per order id (used to explain rejected transitions)."""
+    res = await session.execute(select(Order.id, Order.status).where(Order.id.in_(list(order_ids))))
+    return dict(res.all())
+
+
+# --- order status history ---
+
+async def record_status_events(session: AsyncSession, order_ids, status: str, ts: datetime = None) -> None:
+    """Append one order_status_events row per order; call with every status write."""
+    if not order_ids:
+        return
+    ts = ts or datetime.utcnow()
+    await session.execute(
+        OrderStatusEvent.__table__.insert(),
+        [{'order_id': order_id, 'status': status, 'ts': ts} for order_id in order_ids],
+    )
+
+
+def _seconds_between(session: AsyncSession, start, end):
+    if session.bind.dialect.name == 'postgresql':
+        return func.extract('epoch', end - start)
+    return (func.julianday(end) - func.julianday(start)) * 86400.0
+
+
+async def stage_durations(session: AsyncSession, date_from: datetime, date_to: datetime,
+                          percentiles=(0.5, 0.9, 0.95)) -> list:
+    """Time spent in each status for stages entered in [date_from, date_to).
+
+    LEAD over (order_id, ts) pairs every event with the next one of the same
+    order; ROW_NUMBER/COUNT per status give nearest-rank percentiles in the
+    same query. Returns dicts: status, count, avg and p50/p90/... in seconds.
+    Stages still open (no next event) are not counted.
+    """
+    ev = OrderStatusEvent
+    in_range = select(ev.order_id).where(ev.ts >= date_from, ev.ts < date_to)
+    steps = (
+        select(
+            ev.status, ev.ts,
+            func.lead(ev.ts).over(partition_by=ev.order_id, order_by=(ev.ts, ev.id)).label('next_ts'),
+        )
+        .where(ev.order_id.in_(in_range))
+        .subquery()
+    )
+    stages = (
+        select(steps.c.status, _seconds_between(session, steps.c.ts, steps.c.next_ts).label('seconds'))
+        .where(steps.c.next_ts.is_not(None), steps.c.ts >= date_from, steps.c.ts < date_to)
+        .subquery()
+    )
+    ranked = select(
+        stages.c.status, stages.c.seconds,
+        func.row_number().over(partition_by=stages.c.status, order_by=stages.c.seconds).label('rn'),
+        func.count().over(partition_by=stages.c.status).label('n'),
+    ).subquery()
+    columns = [
+        ranked.c.status,
+        func.count().label('count'),
+        func.avg(ranked.c.seconds).label('avg'),
+    ]
+    for p in percentiles:
+        # nearest rank: the first row whose rank reaches p * n
+        columns.append(func.min(case((ranked.c.rn >= ranked.c.n * p, ranked.c.seconds))).label(f'p{round(p * 100)}'))
+    res = await session.execute(select(*columns).group_by(ranked.c.status).order_by(ranked.c.status))
+    return [dict(row._mapping) for row in res]
+
+
+async def open_orders(session: AsyncSession, since: datetime) -> list:
+    """(id, status, created ts, entered-status ts) of unfinished orders created after since.
+
+    Times come from order_status_events (UTC) when present, else orders.created_at.
+    """
+    ev = OrderStatusEvent
+    res = await session.execute(
+        select(
+            Order.id, Order.status,
+            func.coalesce(func.min(ev.ts), Order.created_at),
+            func.coalesce(func.max(ev.ts), Order.created_at),
+        )
+        .outerjoin(ev, ev.order_id == Order.id)
+        .where(Order.status.not_in(order_status.FINAL), Order.created_at >= since)
+        .group_by(Order.id, Order.status, Order.created_at)
+    )
+    return res.all()
+
+
+# --- delivery ---
+
+async def ready_delivery_orders(session: AsyncSession) -> list:
+    """(id, address, ready ts) of delivery orders waiting for a courier, oldest first."""
+    ev = OrderStatusEvent
+    ready_at = func.coalesce(func.max(ev.ts), Order.created_at)
+    res = await session.execute(
+        select(Order.id, Order.address, ready_at)
+        .outerjoin(ev, (ev.order_id == Order.id) & (ev.status == order_status.READY))
+        .where(Order.status == order_status.READY, Order.delivery_type == 'delivery')
+        .group_by(Order.id, Order.address, Order.created_at)
+        .order_by(ready_at)
+    )
+    return res.all()
+
+
+async def load_geocodes(session: AsyncSession, keys) -> dict:
+    """key -> (lat, lon) for the cached ones among keys."""
+    res = await session.execute(
+        select(GeocodedAddress.key, GeocodedAddress.lat, GeocodedAddress.lon)
+        .where(GeocodedAddress.key.in_(list(keys)))
+    )
+    return {key: (lat, lon) for key, lat, lon in res}
+
+
+async def save_geocode(session: AsyncSession, key: str, address: str, lat: float, lon: float, source: str) -> None:
+    table = GeocodedAddress.__table__
+    values = {'address': address, 'lat': lat, 'lon': lon, 'source': source, 'updated_at': datetime.utcnow()}
+    stmt = _insert(session, table).values(key=key, **values)
+    await session.execute(stmt.on_conflict_do_update(index_elements=['key'], set_=values))
+
+
+async def delivery_addresses(session: AsyncSession, after_id: int = 0) -> list:
+    """(id, Telegram id, address) of delivery orders with id > after_id, oldest first."""
+    src = orders_with_archive()
+    res = await session.execute(
+        select(src.c.id, src.c.user_id, src.c.address)
+        .where(src.c.id > after_id, src.c.delivery_type == 'delivery', src.c.address.is_not(None))
+        .order_by(src.c.id)
+    )
+    return res.all()
+
+
+# --- scheduled jobs ---
+
+async def try_lease_job(session: AsyncSession, name: str, owner: str, now: datetime, until: datetime) -> bool:
+    """Take the job's lease if it is free or expired (one conditional UPDATE); commits."""
+    await session.execute(_insert(session, JobRun.__table__).values(name=name).on_conflict_do_nothing())
+    res = await session.execute(
+        update(JobRun)
+        .where(JobRun.name == name, (JobRun.locked_until.is_(None)) | (JobRun.locked_until < now))
+        .values(owner=owner, locked_until=until)
+    )
+    await session.commit()
+    return res.rowcount == 1
+
+
+async def last_job_finish(session: AsyncSession, name: str):
+    return (await session.execute(select(JobRun.last_finished_at).where(JobRun.name == name))).scalar_one_or_none()
+
+
+async def finish_job(session: AsyncSession, name: str, owner: str, started_at: datetime, duration: float,
+                     error: str = None) -> None:
+    """Record the result and release the lease (if this owner still holds it); commits."""
+    await session.execute(_insert(session, JobRun.__table__).values(name=name).on_conflict_do_nothing())
+    await session.execute(
+        update(JobRun).where(JobRun.name == name).values(
+            last_started_at=started_at, last_finished_at=datetime.utcnow(), last_duration=duration,
+            last_status='error' if error else 'ok', last_error=error,
+            owner=case((JobRun.owner == owner, None), else_=JobRun.owner),
+            locked_until=case((JobRun.owner == owner, None), else_=JobRun.locked_until),
+        )
+    )
+    await session.commit()
+
+
+async def release_job(session: AsyncSession, name: str, owner: str) -> None:
+    """Give the lease back without recording a run; commits."""
+    await session.execute(
+        update(JobRun).where(JobRun.name == name, JobRun.owner == owner).values(owner=None, locked_until=None)
+    )
+    await session.commit()
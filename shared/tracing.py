@@ -0,0 +1,426 @@
+"""Correlation ids, spans and structured logs for the backend and the bot.
+
+Every HTTP request and every bot update runs inside a span; the current
+span lives in a contextvar, so nested spans (handlers, SQL statements,
+Bot API calls, jobs) and log records pick up its trace id without
+passing it around. The trace id crosses process boundaries as:
+
+- the W3C `traceparent` header (or a 32-hex `X-Request-ID`) of requests
+  to the backend (the WebApp sends one with every order); the response
+  carries it back in `X-Request-ID`;
+- orders.trace_id, written at checkout, so later status changes (payment
+  webhooks, admin panel) can be matched with the checkout that created
+  the order.
+
+Spans are exported by a background thread, as set by TRACE_EXPORTER:
+
+- '' (default): not exported, ids still go to the logs;
+- 'file': one JSON object per line appended to TRACE_FILE;
+- 'otlp': OTLP/HTTP JSON batches to OTEL_EXPORTER_OTLP_ENDPOINT (a local
+  OpenTelemetry collector, http://localhost:4318 by default).
+
+setup_logging() switches the root logger to one JSON object per line
+(LOG_FORMAT=text keeps plain lines) with trace_id and span_id added.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+from sqlalchemy import event
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', '').lower()
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')
+OTLP_ENDPOINT = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT', 'http://localhost:4318').rstrip('/')
+# spans waiting for export; more are dropped (counted in trace_spans_dropped_total)
+TRACE_QUEUE_SIZE = int(os.getenv('TRACE_QUEUE_SIZE', '10000'))
+TRACE_BATCH = 512
+TRACE_FLUSH_INTERVAL = float(os.getenv('TRACE_FLUSH_INTERVAL', '2'))
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+
+_HEX32 = re.compile(r'^[0-9a-f]{32}$')
+_TRACEPARENT = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+_KINDS = {'internal': 1, 'server': 2, 'client': 3}
+
+spans_dropped = metrics.registry.counter('trace_spans_dropped_total', 'Spans lost: export queue full or export failed')
+
+
+def new_trace_id() -> str:
+    return secrets.token_hex(16)
+
+
+def valid_trace_id(value) -> Optional[str]:
+    """The id if it is 32 lowercase hex digits (and not all zeros), else None."""
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if _HEX32.match(value) and value.strip('0'):
+            return value
+    return None
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str]]:
+    """'00-<trace id>-<parent span id>-01' -> (trace id, parent span id)."""
+    m = _TRACEPARENT.match((value or '').strip().lower())
+    if m is None or not valid_trace_id(m.group(1)):
+        return None
+    return m.group(1), m.group(2)
+
+
+class Span:
+    __slots__ = ('name', 'kind', 'trace_id', 'span_id', 'parent_id', 'attributes', 'start_ns', 'end_ns', 'error')
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: str = 'internal',
+                 attributes: dict = None):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or ())
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def traceparent(self) -> str:
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+
+_current: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current.get()
+    return span.trace_id if span is not None else None
+
+
+def set_attribute(key: str, value):
+    """Annotate the current span, if any."""
+    s = _current.get()
+    if s is not None:
+        s.set(key, value)
+
+
+def start_span(name: str, attributes: dict = None, *, kind: str = 'internal', trace_id: str = None,
+               parent_id: str = None) -> Span:
+    """A child of the current span (or a new trace) that is not made current; finish with end_span()."""
+    parent = _current.get()
+    if trace_id is None and parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    return Span(name, trace_id or new_trace_id(), parent_id, kind, attributes)
+
+
+def end_span(span: Span, error: BaseException = None):
+    span.end_ns = time.time_ns()
+    if error is not None:
+        span.error = f'{type(error).__name__}: {error}'
+    exporter.export(span)
+
+
+@contextmanager
+def span(name: str, attributes: dict = None, *, kind: str = 'internal', trace_id: str = None, parent_id: str = None):
+    """Run the block inside a new current span.
+
+    trace_id/parent_id continue a trace started elsewhere (another process);
+    by default the span is a child of the current one, or starts a new trace.
+    """
+    s = start_span(name, attributes, kind=kind, trace_id=trace_id, parent_id=parent_id)
+    token = _current.set(s)
+    error = None
+    try:
+        yield s
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current.reset(token)
+        end_span(s, error)
+
+
+# --- export ---
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_attributes(attributes: dict) -> list:
+    return [{'key': k, 'value': _otlp_value(v)} for k, v in attributes.items() if v is not None]
+
+
+def _otlp_span(s: Span) -> dict:
+    out = {
+        'traceId': s.trace_id, 'spanId': s.span_id, 'name': s.name, 'kind': _KINDS.get(s.kind, 1),
+        'startTimeUnixNano': str(s.start_ns), 'endTimeUnixNano': str(s.end_ns),
+        'attributes': _otlp_attributes(s.attributes),
+        'status': {'code': 2, 'message': s.error} if s.error else {'code': 0},
+    }
+    if s.parent_id:
+        out['parentSpanId'] = s.parent_id
+    return out
+
+
+def _file_span(s: Span, service: str) -> dict:
+    return {
+        'ts': datetime.fromtimestamp(s.start_ns / 1e9, timezone.utc).isoformat(timespec='milliseconds'),
+        'service': service, 'trace_id': s.trace_id, 'span_id': s.span_id, 'parent_id': s.parent_id,
+        'name': s.name, 'kind': s.kind, 'duration_ms': round(s.duration * 1000, 3), 'error': s.error,
+        'attributes': s.attributes,
+    }
+
+
+class SpanExporter:
+    """Queues finished spans and writes them in batches from a daemon thread."""
+
+    def __init__(self, kind: str = TRACE_EXPORTER, path: str = TRACE_FILE, endpoint: str = OTLP_ENDPOINT,
+                 service: str = None):
+        self.kind = kind if kind in ('file', 'otlp') else ''
+        self.path = path
+        self.endpoint = endpoint
+        self.service = service or os.getenv('OTEL_SERVICE_NAME', 'jafood')
+        self._queue: queue.Queue = queue.Queue(TRACE_QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.kind)
+
+    def export(self, s: Span):
+        if not self.kind:
+            return
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(s)
+        except queue.Full:
+            spans_dropped.inc()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='span-exporter', daemon=True)
+                self._thread.start()
+                atexit.register(self.shutdown)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + TRACE_FLUSH_INTERVAL
+            while batch[-1] is not None and len(batch) < TRACE_BATCH:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            spans = [s for s in batch if s is not None]
+            if spans:
+                try:
+                    self._write(spans)
+                except Exception as e:
+                    spans_dropped.inc(len(spans))
+                    logger.warning('span export failed (%d spans dropped): %s', len(spans), e)
+            if stop:
+                return
+
+    def _write(self, spans: list):
+        if self.kind == 'file':
+            with open(self.path, 'a', encoding='utf-8') as f:
+                for s in spans:
+                    f.write(json.dumps(_file_span(s, self.service), ensure_ascii=False, default=str) + '\n')
+            return
+        body = {'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes({'service.name': self.service})},
+            'scopeSpans': [{'scope': {'name': 'jafood'}, 'spans': [_otlp_span(s) for s in spans]}],
+        }]}
+        request = urllib.request.Request(
+            f'{self.endpoint}/v1/traces', data=json.dumps(body, default=str).encode(),
+            headers={'Content-Type': 'application/json'}, method='POST',
+        )
+        with urllib.request.urlopen(request, timeout=5) as response:
+            response.read()
+
+    def shutdown(self, timeout: float = 5):
+        """Write the queued spans and stop the thread."""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+        self._thread = None
+
+
+exporter = SpanExporter()
+
+
+# --- logs ---
+
+class TraceContextFilter(logging.Filter):
+    """Adds trace_id and span_id of the current span to every record."""
+
+    def filter(self, record):
+        s = _current.get()
+        record.trace_id = s.trace_id if s is not None else None
+        record.span_id = s.span_id if s is not None else None
+        return True
+
+
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'trace_id', 'span_id',
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; `extra={...}` fields become top-level keys."""
+
+    def __init__(self, service: str = None):
+        super().__init__()
+        self.service = service
+
+    def format(self, record):
+        out = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if self.service:
+            out['service'] = self.service
+        if getattr(record, 'trace_id', None):
+            out['trace_id'] = record.trace_id
+            out['span_id'] = record.span_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and not key.startswith('_'):
+                out[key] = value
+        if record.exc_info:
+            out['exc'] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s'
+
+
+def setup_logging(service: str, level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """Configure the root logger of a process (replaces logging.basicConfig)."""
+    handler = logging.StreamHandler()
+    handler.addFilter(TraceContextFilter())
+    handler.setFormatter(JsonFormatter(service) if fmt == 'json' else logging.Formatter(TEXT_FORMAT))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+    if not os.getenv('OTEL_SERVICE_NAME'):
+        exporter.service = service
+
+
+# --- instrumentation ---
+
+def _statement_name(statement: str) -> str:
+    words = statement.split(None, 4)
+    if not words:
+        return 'sql'
+    op = words[0].upper()
+    # SELECT ... FROM table is not cheap to find; keep the operation and the table for writes
+    if op in ('INSERT', 'DELETE') and len(words) > 2:
+        return f'{op} {words[2]}'
+    if op == 'UPDATE' and len(words) > 1:
+        return f'{op} {words[1]}'
+    return op
+
+
+def instrument_engine(engine, name: str):
+    """A span per SQL statement run inside an exported trace."""
+    sync_engine = getattr(engine, 'sync_engine', engine)
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        if exporter.enabled and _current.get() is not None:
+            conn.info.setdefault('trace_spans', []).append(start_span(
+                _statement_name(statement), {'db.system': sync_engine.dialect.name, 'db.engine': name,
+                                             'db.statement': statement[:500]}, kind='client'))
+        else:
+            conn.info.setdefault('trace_spans', []).append(None)
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def _end(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get('trace_spans')
+        s = spans.pop() if spans else None
+        if s is not None:
+            end_span(s)
+
+    @event.listens_for(sync_engine, 'handle_error')
+    def _error(context):
+        conn = context.connection
+        spans = conn.info.get('trace_spans') if conn is not None else None
+        s = spans.pop() if spans else None
+        if s is not None:
+            end_span(s, context.original_exception)
+
+
+class TelegramTracing:
+    """aiogram session middleware: a client span per Bot API call."""
+
+    async def __call__(self, make_request, bot, method):
+        name = getattr(method, '__api_method__', type(method).__name__)
+        with span(f'telegram {name}', {'telegram.chat_id': getattr(method, 'chat_id', None)}, kind='client'):
+            return await make_request(bot, method)
+
+
+class UpdateTracing:
+    """aiogram outer middleware on dp.update: one server span per update."""
+
+    async def __call__(self, handler, update, data):
+        user = data.get('event_from_user')
+        attributes = {'telegram.update_id': update.update_id, 'telegram.user_id': user.id if user else None}
+        name = f'update {getattr(update, "event_type", "unknown")}'
+        with span(name, attributes, kind='server'):
+            return await handler(update, data)
+
+
+class HandlerTracing:
+    """aiogram inner middleware: a span named after the handler chosen for the event."""
+
+    async def __call__(self, handler, event, data):
+        callback = getattr(data.get('handler'), 'callback', None)
+        with span(getattr(callback, '__qualname__', None) or 'handler'):
+            return await handler(event, data)
+
+
+def instrument_dispatcher(dp):
+    """Trace updates and the handlers of every router included in the dispatcher."""
+    dp.update.outer_middleware(UpdateTracing())
+    for router in dp.chain_tail:
+        for event_type, observer in router.observers.items():
+            if event_type not in ('update', 'error'):
+                observer.middleware(HandlerTracing())
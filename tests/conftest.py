@@ -0,0 +1,37 @@
+"""Test setup: a throwaway SQLite database, set before shared.db creates the engine."""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+_tmp = tempfile.mkdtemp(prefix='food-tests-')
+os.environ['DATABASE_URL'] = f'sqlite+aiosqlite:///{_tmp}/test.db'
+os.environ['READ_DATABASE_URL'] = ''
+os.environ['BOT_TOKEN'] = ''
+os.environ['JOBS_ENABLED'] = '0'
+os.environ['TRACE_EXPORTER'] = ''
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def client():
+    from fastapi.testclient import TestClient
+    from backend.app import main
+
+    with TestClient(main.app) as c:
+        yield c
+
+
+@pytest.fixture(scope='session')
+def admin_headers(client):
+    from backend.app import main
+
+    return {'Authorization': 'Bearer ' + main.generate_token(0)}
+
+
+@pytest.fixture
+def run(client):
+    """Run a coroutine on the app's event loop (the engine's connections belong to it)."""
+    return client.portal.call
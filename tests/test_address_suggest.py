@@ -0,0 +1,34 @@
+import json
+import time
+
+from backend.app import addresses, webapp_auth
+
+BOT_TOKEN = '123:test-token'
+ADDRESS = 'Тестовая улица, 7, кв. 42'
+
+
+def init_data(user_id: int, token: str = BOT_TOKEN) -> str:
+    fields = {'auth_date': str(int(time.time())), 'user': json.dumps({'id': user_id, 'first_name': 'A'})}
+    return webapp_auth.sign_init_data(fields, token)
+
+
+def suggestions(client, headers=None, **params):
+    r = client.get('/api/address/suggest', params={'q': 'тестовая', **params}, headers=headers or {})
+    assert r.status_code == 200
+    return [s['value'] for s in r.json()['suggestions']]
+
+
+def test_own_addresses_need_signed_init_data(client, monkeypatch):
+    monkeypatch.setenv('BOT_TOKEN', BOT_TOKEN)
+    addresses.suggester.index.add(ADDRESS, 777)
+
+    # a user_id in the query is no longer trusted
+    assert ADDRESS not in suggestions(client, user_id=777)
+    assert ADDRESS not in suggestions(client, {'X-Telegram-Init-Data': init_data(777, 'other:token')})
+    assert ADDRESS not in suggestions(client, {'X-Telegram-Init-Data': init_data(778)})
+    assert ADDRESS in suggestions(client, {'X-Telegram-Init-Data': init_data(777)})
+
+
+def test_expired_init_data_is_refused():
+    fields = {'auth_date': str(int(time.time()) - 2 * webapp_auth.INIT_DATA_TTL), 'user': json.dumps({'id': 1})}
+    assert webapp_auth.verify_init_data(webapp_auth.sign_init_data(fields, BOT_TOKEN), BOT_TOKEN) is None
@@ -0,0 +1,105 @@
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, text
+
+from shared import db, repository
+from shared.models import ArchivedOrder, Base, Order
+
+USER = 7001
+
+
+def test_new_orders_do_not_reuse_archived_ids(run):
+    old = datetime.utcnow() - timedelta(days=120)
+
+    async def scenario():
+        async with db.AsyncSessionLocal() as session:
+            first = Order(user_id=USER, items_json=json.dumps([{'name': 'a'}]), status='completed', created_at=old)
+            session.add(first)
+            await session.commit()
+            # archived while it is the newest order: SQLite without AUTOINCREMENT would hand its id out again
+            while await repository.archive_orders(session, datetime.utcnow() - timedelta(days=1)):
+                await session.commit()
+            await session.commit()
+            second = Order(user_id=USER, items_json=json.dumps([{'name': 'b'}]), status='new')
+            session.add(second)
+            await session.commit()
+            src = repository.orders_with_archive()
+            ids = (await session.execute(
+                select(src.c.id).where(src.c.user_id == USER).order_by(src.c.id.desc())
+            )).scalars().all()
+            items = [await repository.order_items(session, USER, order_id) for order_id in ids]
+            page = await repository.user_orders_page(session, USER)
+        return first.id, second.id, ids, items, page
+
+    first_id, second_id, ids, items, page = run(scenario)
+    assert second_id > first_id
+    assert ids == [second_id, first_id]
+    assert items == [[{'name': 'b'}], [{'name': 'a'}]]
+    assert [(row.id, row.status) for row in page] == [(second_id, 'new'), (first_id, 'completed')]
+
+
+def test_orders_rebuilt_with_autoincrement_above_archive(tmp_path):
+    import asyncio
+
+    async def scenario():
+        eng = db.create_engine(f'sqlite+aiosqlite:///{tmp_path}/legacy.db')
+        try:
+            async with eng.begin() as conn:
+                await conn.execute(text(
+                    "CREATE TABLE orders (id INTEGER PRIMARY KEY, user_id BIGINT, items_json TEXT, "
+                    "total_price FLOAT, address VARCHAR, name VARCHAR, phone VARCHAR, payment_method VARCHAR, "
+                    "delivery_type VARCHAR, status VARCHAR, created_at DATETIME, trace_id VARCHAR(32))"
+                ))
+                await conn.execute(text("CREATE INDEX ix_orders_user_id ON orders (user_id)"))
+                await conn.execute(text("INSERT INTO orders (id, user_id, status) VALUES (3, 1, 'new')"))
+                await conn.run_sync(ArchivedOrder.__table__.create)
+                await conn.execute(text(
+                    "INSERT INTO orders_archive (id, user_id, status, created_at) VALUES (8, 1, 'completed', '2024-01-01')"
+                ))
+                await conn.run_sync(Base.metadata.create_all)
+                await db._migrate_orders_autoincrement(conn)
+                await db._migrate_orders_autoincrement(conn)  # no-op once rebuilt
+                await conn.execute(text("INSERT INTO orders (user_id, status) VALUES (1, 'new')"))
+                ids = (await conn.execute(select(Order.id).order_by(Order.id))).scalars().all()
+                count = (await conn.execute(select(func.count()).select_from(ArchivedOrder))).scalar()
+                indexes = (await conn.execute(text(
+                    "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'orders' AND sql IS NOT NULL"
+                ))).scalars().all()
+        finally:
+            await eng.dispose()
+        return ids, count, set(indexes)
+
+    ids, count, indexes = asyncio.run(scenario())
+    assert ids == [3, 9]
+    assert count == 1
+    assert indexes == {'ix_orders_user_id', 'ix_orders_user_id_id'}
+
+
+def test_admin_stats_count_hot_and_archived_orders(client, admin_headers, run):
+    def stats():
+        resp = client.get('/api/admin/stats', headers=admin_headers)
+        assert resp.status_code == 200
+        return resp.json()
+
+    before = stats()
+
+    async def scenario():
+        async with db.AsyncSessionLocal() as session:
+            session.add_all([
+                Order(user_id=USER + 1, total_price=100, status='completed', created_at=datetime.utcnow() - timedelta(days=200)),
+                Order(user_id=USER + 1, total_price=250, status='new'),
+            ])
+            await session.commit()
+            while await repository.archive_orders(session, datetime.utcnow() - timedelta(days=1)):
+                await session.commit()
+            await session.commit()
+
+    run(scenario)
+    after = stats()
+    assert after['orders'] - before['orders'] == 2
+    assert after['revenue'] - before['revenue'] == 350
+    assert after['today_orders'] - before['today_orders'] == 1
+    assert after['today_revenue'] - before['today_revenue'] == 250
+    assert client.get('/api/admin/stats', params={'today_from': '2100-01-01T00:00:00Z'},
+                      headers=admin_headers).json()['today_orders'] == 0
@@ -0,0 +1,47 @@
+import asyncio
+
+from shared import db, repository
+
+USER = 6001
+
+
+def test_cart_quantity_upserts(run):
+    async def change(delta):
+        async with db.AsyncSessionLocal() as session:
+            qty = await repository.change_cart_qty(session, USER, 1, delta)
+            await session.commit()
+            return qty
+
+    async def qty():
+        async with db.AsyncSessionLocal() as session:
+            return await repository.get_cart_qty(session, USER, 1)
+
+    async def scenario():
+        steps = [await change(1), await change(2), await change(-1)]
+        # concurrent taps: every increment counts, no duplicate line
+        await asyncio.gather(*(change(1) for _ in range(10)))
+        after_taps = await qty()
+        steps.append(await change(-after_taps))
+        steps.append(await change(-1))  # already gone: stays at zero
+        return steps, after_taps, await qty()
+
+    steps, after_taps, final = run(scenario)
+    assert steps[:3] == [1, 3, 2]
+    assert after_taps == 12
+    assert steps[3:] == [0, 0]
+    assert final == 0
+
+
+def test_replace_cart_merges_repeated_products(run):
+    async def scenario():
+        async with db.AsyncSessionLocal() as session:
+            await repository.replace_cart(session, USER + 1, [
+                {'product_id': 1, 'qty': 2}, {'product_id': 2}, {'product_id': 1, 'qty': 1}, {'product_id': 3, 'qty': 0},
+            ])
+            await session.commit()
+            lines = await repository.cart_lines(session, USER + 1)
+            await repository.clear_cart(session, USER + 1)
+            await session.commit()
+        return [(product.id, qty) for product, qty in lines]
+
+    assert run(scenario) == [(1, 3), (2, 1)]
@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+from backend.app.catalog import CatalogCache
+
+
+def product(pid, category_id, rating, image=None):
+    return SimpleNamespace(id=pid, name=f'p{pid}', description='', price=100.0, image=image, tags='',
+                           rating=rating, category_id=category_id)
+
+
+def cache():
+    c = CatalogCache()
+    products = [product(1, 10, 4.5), product(2, 10, 3.9), product(3, 20, 4.8), product(4, 20, 4.1)]
+    tags = [(1, 'Новинка'), (1, 'Острое'), (3, 'Новинка'), (4, 'Острое')]
+    c.build(products, tags, [SimpleNamespace(id=20, title='Супы', sort_order=2),
+                             SimpleNamespace(id=10, title='Роллы', sort_order=1)])
+    return c
+
+
+def ids(items):
+    return [doc['id'] for doc in items]
+
+
+def test_tag_filters_intersect_and_ignore_case():
+    c = cache()
+    items, _ = c.query(tags=['новинка'])
+    assert ids(items) == [1, 3]
+    items, _ = c.query(tags=['Новинка', 'острое'])
+    assert ids(items) == [1]
+    assert c.query(tags=['Нет такого'])[0] == []
+
+
+def test_facet_counts():
+    c = cache()
+    items, facets = c.query(category_id=10, min_rating=4.0)
+    assert ids(items) == [1]
+    assert facets['tags'] == {'Новинка': 1, 'Острое': 1}
+    # category counts ignore the category filter, not the others
+    assert facets['categories'] == {10: 1, 20: 2}
+
+
+def test_upsert_moves_product_between_facets():
+    c = cache()
+    version = c.version
+    c.upsert(product(2, 20, 4.0), ['Острое'])
+    assert c.version > version
+    assert ids(c.products(20)) == [2, 3, 4]
+    assert ids(c.query(tags=['Острое'])[0]) == [1, 2, 4]
+    c.remove(4)
+    assert ids(c.query(tags=['Острое'])[0]) == [1, 2]
+
+
+def test_products_endpoint_facets(client):
+    resp = client.get('/api/products', params={'tag': 'Новинка', 'facets': 1})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body['items'] and all('Новинка' in doc['tags'] for doc in body['items'])
+    assert body['facets']['tags']['Новинка'] == len(body['items'])
@@ -0,0 +1,13 @@
+from bot.handlers.order import last_checkout
+from bot.services.profiles import PastOrder, Profile
+
+
+def past(delivery_type, address):
+    return PastOrder(1, None, 500.0, 'completed', [], address, 'cash', delivery_type)
+
+
+def test_last_checkout_only_after_delivery():
+    assert last_checkout(Profile(phone='+7999', orders=[past('delivery', 'Ленина, 1')])).address == 'Ленина, 1'
+    assert last_checkout(Profile(phone='+7999', orders=[past('pickup', 'Самовывоз')])) is None
+    assert last_checkout(Profile(phone='+7999')) is None
+    assert last_checkout(Profile(orders=[past('delivery', 'Ленина, 1')])) is None
@@ -0,0 +1,46 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend.app import dispatch, geo
+
+
+def stop(order_id, lat, lon, minutes=0):
+    return dispatch.Stop(order_id, f'addr {order_id}', lat, lon, datetime(2026, 1, 1) + timedelta(minutes=minutes))
+
+
+def test_plan_groups_nearby_stops():
+    stops = [stop(1, 55.750, 37.600), stop(2, 55.752, 37.602, 1), stop(3, 55.900, 37.900, 2), stop(4, 55.751, 37.601, 3)]
+    bags = dispatch.plan(stops, depot=(55.75, 37.61), max_bag=2, radius_km=1)
+    # the oldest order takes its nearest neighbour, the far one rides alone
+    assert [sorted(bag.order_ids) for bag in bags] == [[1, 4], [2], [3]]
+    assert all(bag.distance_km > 0 for bag in bags)
+
+
+def test_plan_rejects_empty_radius():
+    with pytest.raises(ValueError):
+        dispatch.plan([stop(1, 55.75, 37.6)], radius_km=0)
+
+
+def test_dispatch_parameters_are_validated(client, admin_headers):
+    assert client.get('/api/admin/dispatch', params={'radius_km': 0}, headers=admin_headers).status_code == 422
+    assert client.get('/api/admin/dispatch', params={'max_bag': 1000}, headers=admin_headers).status_code == 422
+    resp = client.get('/api/admin/dispatch', params={'radius_km': 1.5, 'max_bag': 2}, headers=admin_headers)
+    assert resp.status_code == 200
+    assert set(resp.json()) == {'bags', 'unlocated'}
+
+
+def test_fetch_many_is_concurrent_and_bounded():
+    coder = geo.Geocoder(token='t', deadline=0.5, concurrency=10)
+
+    async def fake_fetch(client, address):
+        await asyncio.sleep(5 if address == 'slow' else 0.2)
+        return 55.0, 37.0
+
+    coder._fetch = fake_fetch
+    started = time.monotonic()
+    found = asyncio.run(coder.fetch_many(['ул Ленина 1', 'ул Ленина 2', 'ул Ленина 3', 'slow']))
+    assert time.monotonic() - started < 2
+    assert set(found) == {'ул Ленина 1', 'ул Ленина 2', 'ул Ленина 3'}
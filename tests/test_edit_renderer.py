@@ -0,0 +1,24 @@
+import asyncio
+import time
+
+from bot.services.edit_renderer import EditRenderer
+from bot.services.menu_state import MenuState
+
+
+def test_flush_before_debounce_timer():
+    async def scenario():
+        renderer = EditRenderer(window=60)
+        state = MenuState(1, 'main')
+        state.edited_at = time.monotonic()
+        sent = []
+
+        async def action():
+            sent.append('edit')
+
+        await renderer.edit(1, state, 'digest', action)
+        await renderer.flush()
+        # the debounce timer fires after flush() drained the chat
+        await renderer._deferred(1, state, 0)
+        return sent
+
+    assert asyncio.run(scenario()) == ['edit']
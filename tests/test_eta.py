@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+
+from shared import eta
+
+T0 = datetime(2026, 1, 1, 12, 0)
+
+
+def test_estimate_grows_with_the_kitchen_queue():
+    est = eta.EtaEstimator()
+    empty = est.estimate(delivery=False)
+    for order_id in (1, 2, 3):
+        est.on_created(order_id, T0)
+    assert est.kitchen_queue == 3
+    assert est.estimate(delivery=False) == empty + 3 * est.per_order
+    # delivery adds the time spent ready and on the road
+    assert est.estimate(delivery=True) - est.estimate(delivery=False) == sum(eta.DEFAULT_STAGE.values())
+
+    est.on_transition([1], 'ready', T0 + timedelta(minutes=10))
+    est.on_transition([2], 'cancelled', T0 + timedelta(minutes=10))
+    assert est.kitchen_queue == 1
+    assert est.count('ready') == 1
+
+
+def test_kitchen_time_is_fitted_from_finished_orders():
+    est = eta.EtaEstimator()
+    # kitchen time = 10 min + 2 min for every order ahead
+    orders = range(1, 13)
+    for order_id in orders:
+        est.on_created(order_id, T0)
+    for queued, order_id in enumerate(orders):
+        est.on_transition([order_id], 'ready', T0 + timedelta(seconds=600 + 120 * queued))
+    assert round(est.base) == 600
+    assert round(est.per_order) == 120
+    assert est.kitchen_queue == 0
+
+
+def test_estimate_text_is_a_range():
+    est = eta.EtaEstimator()
+    assert est.estimate_text(delivery=False) == '15–25 минут'
@@ -0,0 +1,57 @@
+import asyncio
+import io
+
+from PIL import Image
+
+from backend.app import images
+from bot.services import menu_ui
+
+
+def png(color) -> bytes:
+    buf = io.BytesIO()
+    Image.new('RGB', (64, 64), color).save(buf, 'PNG')
+    return buf.getvalue()
+
+
+def test_uploads_survive_cache_eviction(tmp_path):
+    cache = images.ImageCache(root=tmp_path / 'cache', uploads=tmp_path / 'uploads', max_bytes=1, workers=1)
+
+    async def scenario():
+        red, blue = cache.store_upload(png('red')), cache.store_upload(png('blue'))
+        first = await cache.thumbnail(red, 'thumb')
+        # over the limit: every cached thumbnail but the newest is evicted
+        await cache.thumbnail(blue, 'thumb')
+        evicted = not first.exists()
+        again = await cache.thumbnail(red, 'thumb')
+        return evicted, again
+
+    try:
+        evicted, again = asyncio.run(scenario())
+    finally:
+        cache.close()
+    assert evicted
+    assert again.exists()
+    assert len(list((tmp_path / 'uploads').glob('*/*'))) == 2
+
+
+def test_upload_moved_out_of_cache(tmp_path):
+    cache = images.ImageCache(root=tmp_path / 'cache', uploads=tmp_path / 'uploads', workers=1)
+    data = png('green')
+    # stored the old way, inside the evictable cache
+    digest = cache._store_original(data)
+
+    async def scenario():
+        return await cache.thumbnail(images.UPLOAD_PREFIX + digest, 'thumb')
+
+    try:
+        assert asyncio.run(scenario()).exists()
+    finally:
+        cache.close()
+    assert cache._upload_path(digest).read_bytes() == data
+    assert not (tmp_path / 'cache' / 'orig' / digest[:2] / digest).exists()
+
+
+def test_bot_sends_public_url_of_uploads():
+    source = images.UPLOAD_PREFIX + 'ab' * 32
+    assert menu_ui.photo_url(5, source) == menu_ui.BASE_URL.rstrip('/') + images.thumb_url(5, source, 'full')
+    assert menu_ui.photo_url(5, 'https://example.com/a.jpg') == 'https://example.com/a.jpg'
@@ -0,0 +1,45 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from bot.services.maintenance import sweep_fsm
+
+
+def key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+def test_sweep_expires_data_without_started_at(monkeypatch):
+    storage = MemoryStorage()
+    asyncio.run(storage.set_data(key(1), {'checkout_total': 500}))
+    now = 1_000_000.0
+    monkeypatch.setattr('bot.services.maintenance.time.time', lambda: now)
+    seen = {}
+
+    # first seen on the first sweep, kept until the ttl has passed
+    assert sweep_fsm(storage, ttl=60, first_seen=seen) == 0
+    now += 30
+    assert sweep_fsm(storage, ttl=60, first_seen=seen) == 0
+    # the sweep's bookkeeping never shows up in the handler's data
+    assert asyncio.run(storage.get_data(key(1))) == {'checkout_total': 500}
+    now += 60
+    assert sweep_fsm(storage, ttl=60, first_seen=seen) == 1
+    assert key(1) not in storage.storage
+    assert seen == {}
+
+
+def test_sweep_forgets_records_that_got_started_at(monkeypatch):
+    storage = MemoryStorage()
+    asyncio.run(storage.set_data(key(2), {'checkout_total': 500}))
+    now = 1_000_000.0
+    monkeypatch.setattr('bot.services.maintenance.time.time', lambda: now)
+    seen = {}
+
+    assert sweep_fsm(storage, ttl=60, first_seen=seen) == 0
+    assert key(2) in seen
+    # a checkout starts: its own started_at counts from now on
+    asyncio.run(storage.set_data(key(2), {'started_at': now + 50}))
+    now += 100
+    assert sweep_fsm(storage, ttl=60, first_seen=seen) == 0
+    assert seen == {}
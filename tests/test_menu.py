@@ -0,0 +1,49 @@
+import json
+from types import SimpleNamespace
+
+from backend.app.catalog import CatalogCache
+from backend.app.main import etag_matches
+
+CATEGORIES = [SimpleNamespace(id=20, title='Супы', sort_order=2), SimpleNamespace(id=10, title='Роллы', sort_order=1)]
+
+
+def product(pid, category_id, image=None):
+    return SimpleNamespace(id=pid, name=f'p{pid}', description='', price=100.0, image=image, tags='',
+                           rating=4.0, category_id=category_id)
+
+
+def test_if_none_match_compares_whole_tags():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('"x", W/"abc"', '"abc"')
+    assert etag_matches('*', '"abc"')
+    assert not etag_matches('"abcd"', '"abc"')
+    assert not etag_matches('"xx"abc""', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+
+def test_menu_not_modified(client):
+    first = client.get('/api/menu')
+    assert first.status_code == 200
+    etag = first.headers['etag']
+    assert {'version', 'categories', 'tags'} <= set(first.json())
+
+    assert client.get('/api/menu', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/api/menu', headers={'If-None-Match': f'"other", W/{etag}'}).status_code == 304
+    # a longer tag that contains the current one is a different version
+    stale = client.get('/api/menu', headers={'If-None-Match': etag[:-1] + '0"'})
+    assert stale.status_code == 200
+    assert stale.headers['etag'] == etag
+
+
+def test_menu_groups_products_by_category_and_keeps_etag_until_change():
+    c = CatalogCache()
+    c.build([product(1, 10), product(2, 10), product(3, 20)], [], CATEGORIES)
+    body, etag = c.menu()
+    assert c.menu() == (body, etag)
+    c.upsert(product(5, 10, image='https://example.com/a.jpg'), [])
+    body2, etag2 = c.menu()
+    assert etag2 != etag
+    menu = json.loads(body2)
+    assert [cat['title'] for cat in menu['categories']] == ['Роллы', 'Супы']
+    assert menu['categories'][0]['products']['id'] == [1, 2, 5]
+    assert menu['categories'][0]['products']['thumb'][2].startswith('/img/5/card?v=')
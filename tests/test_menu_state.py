@@ -0,0 +1,36 @@
+from bot.services.menu_state import MenuStateStore
+
+CHATS = (4101, 4102, 4103)
+
+
+def test_store_is_bounded_and_persists_evicted_chats(run):
+    async def scenario():
+        store = MenuStateStore(max_chats=2, ttl=3600, persist=True, flush_interval=60)
+        for message_id, chat_id in enumerate(CHATS, start=1):
+            store.set(chat_id, message_id, 'category', category=7)
+        in_memory = len(store)
+        await store.close()  # write-behind: pending changes are written on close
+        # a fresh store (restart) finds the chat that was evicted first
+        restarted = MenuStateStore(max_chats=2, ttl=3600, persist=True)
+        first = await restarted.get(CHATS[0])
+        expired = MenuStateStore(max_chats=2, ttl=-1, persist=True)
+        purged = await expired.purge_expired()
+        gone = await restarted.get(CHATS[0]) is not None, await MenuStateStore(persist=True).get(CHATS[1])
+        return in_memory, first, purged, gone
+
+    in_memory, first, purged, gone = run(scenario)
+    assert in_memory == 2
+    assert (first.message_id, first.state, first.category) == (1, 'category', 7)
+    assert purged >= 3
+    # purged rows are gone; chats still in a store's memory are not affected
+    assert gone == (True, None)
+
+
+def test_same_message_is_updated_in_place():
+    store = MenuStateStore(persist=False)
+    item = store.set(1, 10, 'menu')
+    item.digest = 'abc'
+    assert store.set(1, 10, 'cart') is item
+    assert item.state == 'cart' and item.digest == 'abc'
+    # a new message starts without a digest
+    assert store.set(1, 11, 'menu').digest is None
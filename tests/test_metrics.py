@@ -0,0 +1,48 @@
+import pytest
+
+from shared import metrics
+
+
+def test_histogram_buckets_are_cumulative():
+    reg = metrics.Registry()
+    h = reg.histogram('t_seconds', 'test', ('op',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3):
+        h.observe(value, op='a"b')
+    reg.counter('t_total', 'test').inc(2)
+    reg.stats('t_stats', 'test', lambda: {'hits': 3, 'misses': 1})
+    lines = reg.render().splitlines()
+    assert 't_seconds_bucket{op="a\\"b",le="0.1"} 1' in lines
+    assert 't_seconds_bucket{op="a\\"b",le="1.0"} 3' in lines
+    assert 't_seconds_bucket{op="a\\"b",le="+Inf"} 4' in lines
+    assert 't_seconds_count{op="a\\"b"} 4' in lines
+    assert 't_seconds_sum{op="a\\"b"} 4.05' in lines
+    assert 't_total 2' in lines
+    assert 't_stats{kind="hits"} 3' in lines
+    assert '# TYPE t_seconds histogram' in lines
+
+
+def test_telegram_call_counts_errors():
+    before = metrics.tg_errors.values.get(('sendTest', 'RuntimeError'), 0)
+    with pytest.raises(RuntimeError):
+        with metrics.telegram_call('sendTest'):
+            raise RuntimeError('down')
+    assert metrics.tg_errors.values[('sendTest', 'RuntimeError')] == before + 1
+    counts, _ = metrics.tg_duration.values[('sendTest',)]
+    assert sum(counts) >= 1
+
+
+def test_metrics_endpoint_reports_routes_and_queries(client, monkeypatch):
+    assert client.get('/api/products').status_code == 200
+    assert client.get('/img/999999/card').status_code == 404
+    monkeypatch.setattr(metrics, 'METRICS_TOKEN', 'secret')
+    assert client.get('/metrics').status_code == 401
+    resp = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert resp.status_code == 200
+    assert resp.headers['content-type'].startswith('text/plain')
+    body = resp.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/products",status="200"}' in body
+    # route templates, not raw paths, keep the label set bounded
+    assert 'route="/img/{product_id}/{size}",status="404"' in body
+    assert '/img/999999' not in body
+    assert 'db_query_duration_seconds_count{engine="primary",statement="SELECT"}' in body
+    assert 'db_pool_connections{engine="primary",state=' in body
@@ -0,0 +1,33 @@
+import json
+
+from sqlalchemy import text
+
+from shared.db import engine, init_db
+
+
+def test_legacy_json_carts_merge_into_cart(run):
+    async def scenario():
+        async with engine.begin() as conn:
+            await conn.execute(text("CREATE TABLE carts (id INTEGER PRIMARY KEY, user_id INTEGER, items_json TEXT)"))
+            await conn.execute(text("INSERT INTO users (id, telegram_id) VALUES (900, 9000)"))
+            items = [{'product_id': 1, 'qty': 2}, {'product_id': 1, 'qty': 1}, {'product_id': 2}]
+            await conn.execute(text("INSERT INTO carts (user_id, items_json) VALUES (900, :j)"), {'j': json.dumps(items)})
+            # already in the new table: the legacy quantity is added to it
+            await conn.execute(text("INSERT INTO cart (user_id, product_id, qty) VALUES (9000, 2, 4)"))
+        try:
+            await init_db()
+            async with engine.connect() as conn:
+                lines = (await conn.execute(text(
+                    "SELECT product_id, qty FROM cart WHERE user_id = 9000 ORDER BY product_id"
+                ))).all()
+                left = (await conn.execute(text("SELECT items_json FROM carts"))).scalar()
+        finally:
+            async with engine.begin() as conn:
+                await conn.execute(text("DROP TABLE carts"))
+                await conn.execute(text("DELETE FROM cart WHERE user_id = 9000"))
+                await conn.execute(text("DELETE FROM users WHERE id = 900"))
+        return lines, left
+
+    lines, left = run(scenario)
+    assert [tuple(line) for line in lines] == [(1, 3), (2, 5)]
+    assert left == '[]'
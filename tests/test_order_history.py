@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+from bot.services.order_history import OrderHistoryCache
+from shared import db, repository
+from shared.models import Order
+
+USER = 8001
+
+
+def test_history_pages_span_hot_and_archived_orders(run):
+    old = datetime.utcnow() - timedelta(days=200)
+
+    async def add_orders(n, **fields):
+        async with db.AsyncSessionLocal() as session:
+            orders = [Order(user_id=USER, total_price=100 + i, **fields) for i in range(n)]
+            session.add_all(orders)
+            await session.flush()
+            await repository.record_status_events(session, [o.id for o in orders], fields.get('status', 'new'))
+            await session.commit()
+            return [o.id for o in orders]
+
+    async def scenario():
+        archived = await add_orders(3, status='completed', created_at=old)
+        async with db.AsyncSessionLocal() as session:
+            while await repository.archive_orders(session, datetime.utcnow() - timedelta(days=1)):
+                await session.commit()
+            await session.commit()
+        hot = await add_orders(4, status='new')
+        ids = archived + hot
+
+        cache = OrderHistoryCache(page_size=3, chunk_size=4, poll_interval=0)
+        first = await cache.page(USER)
+        second = await cache.page(USER, before=first.older_than)
+        third = await cache.page(USER, before=second.older_than)
+        back = await cache.page(USER, after=third.newer_than)
+        queries = cache.stats['queries']
+        # a new order (status event from another process) drops the cached history
+        newest = (await add_orders(1))[0]
+        fresh = await cache.page(USER)
+        return ids, first, second, third, back, queries, newest, fresh, cache.stats
+
+    ids, first, second, third, back, queries, newest, fresh, stats = run(scenario)
+    newest_first = sorted(ids, reverse=True)
+    assert [o.id for o in first.orders] == newest_first[:3]
+    assert first.newer_than is None
+    assert [o.id for o in second.orders] == newest_first[3:6]
+    assert [o.id for o in third.orders] == newest_first[6:]
+    assert third.older_than is None
+    assert [o.status for o in third.orders] == ['completed']
+    assert [o.id for o in back.orders] == newest_first[3:6]
+    # 7 orders in chunks of 4: two queries, then paging is served from memory
+    assert queries == 2
+    assert fresh.orders[0].id == newest
+    assert stats['invalidated'] == 1
@@ -0,0 +1,51 @@
+import pytest
+
+from shared import order_status
+
+
+def new_order(client, user_id=0):
+    resp = client.post('/api/orders', json={
+        'user_id': user_id, 'items': [{'product_id': 1, 'name': 'Ролл', 'qty': 1, 'price': 450}],
+        'total_price': 450, 'address': 'Самовывоз', 'phone': '+79990000000',
+        'payment_method': 'cash', 'delivery_type': 'pickup',
+    })
+    assert resp.status_code == 200
+    return resp.json()['order_id']
+
+
+def set_status(client, headers, order_id, status):
+    return client.post(f'/api/admin/order/{order_id}/status', json={'status': status}, headers=headers)
+
+
+def test_transitions():
+    assert order_status.can_transition('new', 'paid')
+    assert order_status.can_transition('processing', 'ready')  # legacy spelling of preparing
+    assert not order_status.can_transition('completed', 'new')
+    assert not order_status.can_transition('ready', 'preparing')
+    assert order_status.predecessors('completed') == {'ready', 'delivering'}
+    with pytest.raises(order_status.InvalidTransition):
+        order_status.predecessors('lost')
+
+
+def test_admin_status_follows_the_state_machine(client, admin_headers):
+    order_id = new_order(client)
+    for status in ('paid', 'preparing', 'ready', 'completed'):
+        assert set_status(client, admin_headers, order_id, status).status_code == 200
+
+    rejected = set_status(client, admin_headers, order_id, 'cancelled')
+    assert rejected.status_code == 409
+    assert 'completed' in rejected.json()['detail']
+    assert set_status(client, admin_headers, order_id, 'lost').status_code == 400
+    assert set_status(client, admin_headers, 10 ** 9, 'paid').status_code == 404
+
+
+def test_bulk_status_moves_only_allowed_orders(client, admin_headers):
+    fresh, done = new_order(client), new_order(client)
+    assert set_status(client, admin_headers, done, 'cancelled').status_code == 200
+
+    resp = client.post('/api/admin/orders/status', json={'order_ids': [fresh, done], 'status': 'preparing'},
+                       headers=admin_headers)
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body['moved'] == [fresh]
+    assert body['rejected'] == {str(done): 'cancelled'}
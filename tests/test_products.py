@@ -0,0 +1,39 @@
+import dataclasses
+
+from sqlalchemy import select
+
+from backend.app.schemas import ProductRow
+from shared.db import AsyncSessionLocal
+from shared.models import ProductPhoto
+
+
+def test_delete_product_with_cached_photo(client, admin_headers, run):
+    product = {'name': 'Фото-ролл', 'category_id': 1, 'price': 300, 'image': 'https://example.com/a.jpg'}
+    r = client.post('/api/admin/product', json=product, headers=admin_headers)
+    assert r.status_code == 200
+    product_id = r.json()['id']
+
+    async def cache_photo():
+        async with AsyncSessionLocal() as s:
+            s.add(ProductPhoto(product_id=product_id, image_url='https://example.com/a.jpg', file_id='AgAD'))
+            await s.commit()
+
+    async def photos():
+        async with AsyncSessionLocal() as s:
+            return (await s.execute(select(ProductPhoto).where(ProductPhoto.product_id == product_id))).all()
+
+    run(cache_photo)
+    r = client.delete(f'/api/admin/product/{product_id}', headers=admin_headers)
+    assert r.status_code == 200
+    assert run(photos) == []
+
+
+def test_admin_product_writes_keep_image_key(client, admin_headers):
+    product = {'name': 'Ролл', 'category_id': 1, 'price': 400, 'image_url': 'https://example.com/b.jpg'}
+    created = client.post('/api/admin/product', json=product, headers=admin_headers).json()
+    assert created['image'] == 'https://example.com/b.jpg'
+    assert 'image_url' not in created
+
+    updated = client.put(f"/api/admin/product/{created['id']}", json={'price': 450}, headers=admin_headers).json()
+    assert updated['image'] == 'https://example.com/b.jpg'
+    assert set(updated) == {f.name for f in dataclasses.fields(ProductRow)}
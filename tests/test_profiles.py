@@ -0,0 +1,36 @@
+from sqlalchemy import select
+
+from shared import db
+from shared.models import User, UserAddress
+from test_address_suggest import BOT_TOKEN, init_data
+
+
+def order(user_id, address):
+    return {'user_id': user_id, 'first_name': 'Чужой', 'items': [{'product_id': 1, 'name': 'Ролл', 'qty': 1, 'price': 450}],
+            'total_price': 450, 'address': address, 'phone': '+79990000001', 'payment_method': 'cash',
+            'delivery_type': 'delivery'}
+
+
+def profile(run, telegram_id):
+    async def load():
+        async with db.AsyncSessionLocal() as s:
+            user = (await s.execute(select(User.name, User.phone).where(User.telegram_id == telegram_id))).first()
+            saved = (await s.execute(select(UserAddress.address).where(UserAddress.user_id == telegram_id))).scalars().all()
+        return user, saved
+
+    return run(load)
+
+
+def test_profile_saved_only_for_verified_customer(client, run, monkeypatch):
+    monkeypatch.setenv('BOT_TOKEN', BOT_TOKEN)
+    # someone else's id in the body: the order is taken, the profile of 5501 is not touched
+    assert client.post('/api/orders', json=order(5501, 'Чужая, 1')).status_code == 200
+    assert client.post('/api/orders', json=order(5501, 'Чужая, 2'),
+                       headers={'X-Telegram-Init-Data': init_data(5502)}).status_code == 200
+    assert profile(run, 5501) == (None, [])
+
+    assert client.post('/api/orders', json=order(5501, 'Своя, 3'),
+                       headers={'X-Telegram-Init-Data': init_data(5501)}).status_code == 200
+    user, saved = profile(run, 5501)
+    assert tuple(user) == ('Чужой', '+79990000001')
+    assert saved == ['Своя, 3']
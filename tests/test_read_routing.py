@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+from shared.db import AsyncSessionLocal, EngineRouter
+
+
+def test_reads_go_to_a_replica_that_has_caught_up(tmp_path):
+    router = EngineRouter(AsyncSessionLocal, f'sqlite+aiosqlite:///{tmp_path}/replica.db', max_lag=5, check_interval=60)
+
+    async def scenario():
+        try:
+            picks = [await router.read_sessionmaker()]
+            # a write after the last lag check may not be on the replica yet
+            picks.append(await router.read_sessionmaker(fresh_since=time.time() + 1))
+            picks.append(await router.read_sessionmaker(fresh_since=time.time() - 60))
+            router.lag = 30.0  # more than max_lag
+            picks.append(await router.read_sessionmaker())
+            return picks
+        finally:
+            await router.close()
+
+    replica = router.replica_sessions
+    assert asyncio.run(scenario()) == [replica, AsyncSessionLocal, replica, AsyncSessionLocal]
+    assert router.stats['checks'] == 1
+    assert (router.stats['replica'], router.stats['fallback']) == (2, 2)
+
+
+def test_failed_lag_check_falls_back_to_the_primary(tmp_path):
+    router = EngineRouter(AsyncSessionLocal, f'sqlite+aiosqlite:///{tmp_path}/missing/replica.db', check_interval=60)
+
+    async def scenario():
+        try:
+            return await router.read_sessionmaker()
+        finally:
+            await router.close()
+            await asyncio.sleep(0.1)  # let the failed connection's worker thread finish
+
+    assert asyncio.run(scenario()) is AsyncSessionLocal
+    assert router.lag is None
+    assert router.stats['check_errors'] == 1
+
+
+def test_without_a_replica_everything_reads_the_primary():
+    router = EngineRouter(AsyncSessionLocal, '')
+    assert asyncio.run(router.read_sessionmaker()) is AsyncSessionLocal
+    assert router.stats['primary'] == 1
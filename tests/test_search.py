@@ -0,0 +1,58 @@
+from backend.app.search import ProductSearchIndex
+
+PRODUCTS = [
+    {'id': 1, 'name': 'Классический ролл', 'description': 'Рис, нори, лосось', 'tags': 'Новинка'},
+    {'id': 2, 'name': 'Фирменный ролл', 'description': 'Тёплый ролл с сыром', 'tags': 'Выбор шефа'},
+    {'id': 3, 'name': 'Морковный суп', 'description': 'Тёплый овощной суп', 'tags': 'Новинка'},
+    {'id': 4, 'name': 'Лосось терияки', 'description': 'Запечённый лосось', 'tags': ''},
+]
+
+
+def index():
+    idx = ProductSearchIndex()
+    idx.build(PRODUCTS)
+    return idx
+
+
+def ids(results):
+    return [doc['id'] for doc in results]
+
+
+def test_exact_prefix_and_case():
+    idx = index()
+    assert sorted(ids(idx.search('РОЛЛ'))) == [1, 2]
+    assert sorted(ids(idx.search('мор'))) == [3]
+    # ё and е are the same letter
+    assert sorted(ids(idx.search('теплый'))) == [2, 3]
+
+
+def test_fuzzy_matches_typos():
+    idx = index()
+    assert ids(idx.search('марковный')) == [3]
+    assert ids(idx.search('фирменый ролл')) == [2]
+    assert idx.search('пицца') == []
+
+
+def test_name_hits_rank_first_and_all_words_must_match():
+    idx = index()
+    # "лосось" is the name of 4 but only the description of 1
+    assert ids(idx.search('лосось')) == [4, 1]
+    assert ids(idx.search('лосось нори')) == [1]
+    assert ids(idx.search('лосось', limit=1)) == [4]
+
+
+def test_updates_and_removal():
+    idx = index()
+    idx.add({'id': 3, 'name': 'Тыквенный суп', 'description': '', 'tags': ''})
+    assert idx.search('морковный') == []
+    assert ids(idx.search('тыквенный')) == [3]
+    idx.remove(1)
+    assert ids(idx.search('нори')) == []
+    assert len(idx) == 3
+
+
+def test_search_endpoint(client):
+    resp = client.get('/api/products/search', params={'q': 'суп'})
+    assert resp.status_code == 200
+    assert resp.json() and all('суп' in doc['name'].lower() for doc in resp.json())
+    assert client.get('/api/products/search', params={'q': ''}).json() == []
@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from shared import db, repository
+from shared.models import OrderStatusEvent
+
+T0 = datetime(2020, 3, 1, 12, 0)
+
+
+def test_stage_durations_and_percentiles(client, admin_headers, run):
+    # order -> seconds after T0 at which it entered new, preparing, ready
+    timelines = {-1: (0, 60, 360), -2: (0, 120, 720), -3: (0, 30, 330)}
+
+    async def scenario():
+        async with db.AsyncSessionLocal() as session:
+            for order_id, offsets in timelines.items():
+                for status, seconds in zip(('new', 'preparing', 'ready'), offsets):
+                    await repository.record_status_events(session, [order_id], status, T0 + timedelta(seconds=seconds))
+            await session.commit()
+            return (await session.execute(
+                select(OrderStatusEvent.status).where(OrderStatusEvent.order_id == -1).order_by(OrderStatusEvent.ts)
+            )).scalars().all()
+
+    assert run(scenario) == ['new', 'preparing', 'ready']
+    resp = client.get('/api/admin/orders/stage-stats', params={'date_from': '2020-03-01', 'date_to': '2020-03-01'},
+                      headers=admin_headers)
+    assert resp.status_code == 200
+    stages = {row['status']: row for row in resp.json()['stages']}
+    # ready is still open: no next event, not counted
+    assert set(stages) == {'new', 'preparing'}
+    assert stages['new']['count'] == 3
+    assert round(stages['new']['avg']) == 70
+    assert [round(stages['new'][p]) for p in ('p50', 'p90', 'p95')] == [60, 120, 120]
+    assert [round(stages['preparing'][p]) for p in ('p50', 'p90')] == [300, 600]
+
+    bad = client.get('/api/admin/orders/stage-stats', params={'date_from': '2020-03-02', 'date_to': '2020-03-01'},
+                     headers=admin_headers)
+    assert bad.status_code == 400
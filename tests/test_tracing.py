@@ -0,0 +1,30 @@
+from sqlalchemy import select
+
+from shared import tracing
+from shared.db import AsyncSessionLocal
+from shared.models import Order
+
+TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+
+
+def test_order_keeps_the_webapp_trace(client, run):
+    order = {
+        'user_id': 0, 'items': [{'product_id': 1, 'name': 'Ролл', 'qty': 1, 'price': 450}], 'total_price': 450,
+        'address': 'Самовывоз', 'phone': '+79990000000', 'payment_method': 'cash', 'delivery_type': 'pickup',
+    }
+    r = client.post('/api/orders', json=order, headers={'traceparent': f'00-{TRACE_ID}-00f067aa0ba902b7-01'})
+    assert r.status_code == 200
+    assert r.headers['X-Request-ID'] == TRACE_ID
+
+    async def stored():
+        async with AsyncSessionLocal() as s:
+            return (await s.execute(select(Order.trace_id).where(Order.id == r.json()['order_id']))).scalar()
+
+    assert run(stored) == TRACE_ID
+
+
+def test_requests_without_context_get_a_new_trace(client):
+    first = client.get('/api/categories').headers['X-Request-ID']
+    assert tracing.valid_trace_id(first)
+    assert client.get('/api/categories').headers['X-Request-ID'] != first
+    assert tracing.parse_traceparent('00-' + '0' * 32 + '-00f067aa0ba902b7-01') is None
@@ -63,24 +63,37 @@ function App() {
   const [catError, setCatError] = useState("");
   const [prodError, setProdError] = useState("");
 
+  const [productsByCat, setProductsByCat] = useState({});
+
+  // всё меню одним запросом, переключение категорий без сети
   useEffect(() => {
-    fetchJson("/api/categories")
-      .then(data => {
-        setCategories(data);
+    setLoading(true);
+    fetchJson("/api/menu")
+      .then(menu => {
+        const byCat = {};
+        menu.categories.forEach(c => {
+          const cols = c.products;
+          byCat[c.id] = cols.id.map((id, i) => {
+            const p = { category_id: c.id };
+            Object.keys(cols).forEach(f => { p[f] = cols[f][i]; });
+            return p;
+          });
+        });
+        setProductsByCat(byCat);
+        setCategories(menu.categories);
         setCatError("");
-        if (data.length) setSelectedCat(data[0].id);
+        setLoading(false);
+        if (menu.categories.length) setSelectedCat(menu.categories[0].id);
       })
-      .catch(e => setCatError("Ошибка загрузки категорий: " + e));
+      .catch(e => { setCatError("Ошибка загрузки меню: " + e); setLoading(false); });
   }, []);
 
   useEffect(() => {
     if (selectedCat) {
-      setLoading(true);
-      fetchJson(`/api/products?category_id=${selectedCat}`)
-        .then(data => { setProducts(data); setProdError(""); setLoading(false); })
-        .catch(e => { setProdError("Ошибка загрузки позиций: " + e); setLoading(false); });
+      setProducts(productsByCat[selectedCat] || []);
+      setProdError("");
     }
-  }, [selectedCat]);
+  }, [selectedCat, productsByCat]);
 
   function addToCart(product) {
     setCart(prev => {